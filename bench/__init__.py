@@ -0,0 +1 @@
+# offline benchmarks: mock OpenAI-compatible server + throughput scenarios
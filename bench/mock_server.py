@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+import argparse, hashlib, json, math, random, re, threading, time, uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Minimal OpenAI-compatible server for offline runs of run_eval.py / judge_batch.py:
+#   POST /v1/chat/completions  (plain and SSE streaming, as used by langchain_openai.ChatOpenAI)
+#   POST /v1/responses         (as used by openai.OpenAI().responses.create)
+#   GET  /stats                (request/error counters)
+# Judge requests get canned judge JSON (a JSON array for packed requests); everything else gets
+# a canned HCP reply. Latency, 429/500 injection and an optional requests-per-minute budget are tunable.
+# Prompt caching is simulated like the real API: a request whose first 1024+ tokens match an
+# earlier request reports the matching prefix (in 128-token steps) as cached_tokens.
+
+HCP_REPLY = ("Thanks. On-label, Trodelvy is indicated for HR+/HER2- metastatic breast cancer after endocrine "
+             "therapy and at least two additional systemic therapies. I'd check performance status and "
+             "neutropenia risk first; please refer to the SmPC for dosing and monitoring.")
+
+def parse_latency(spec):
+    # fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA  (seconds)
+    kind, _, rest = spec.partition(":")
+    vals = [float(x) for x in rest.split(",") if x] if rest else []
+    if kind == "fixed":
+        return lambda: vals[0]
+    if kind == "uniform":
+        return lambda: random.uniform(vals[0], vals[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(vals[0], vals[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(math.log(vals[0]), vals[1])
+    raise ValueError(f"bad latency spec: {spec!r}")
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+def _judge(eval_id):
+    # Deterministic per eval_id so repeated runs score the same
+    h = int(hashlib.sha256(eval_id.encode("utf-8")).hexdigest(), 16)
+    score = 55 + h % 45
+    return {"eval_id": eval_id, "score": score, "pass": score >= 80,
+            "findings": [f"on_label_compliance: mock finding for {eval_id}"],
+            "rationale": "Canned judge response from bench.mock_server."}
+
+def reply_for(messages):
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    if "quality judge" not in text:
+        return HCP_REPLY
+    last = str(messages[-1].get("content", "")) if messages else ""
+    try:
+        case = json.loads(last)
+    except Exception:
+        m = re.search(r'"?eval_id"?\s*:\s*"?([^"\s]+)', last)
+        case = {"eval_id": m.group(1) if m else "UNKNOWN"}
+    if isinstance(case, list):
+        return json.dumps([_judge(c.get("eval_id", "UNKNOWN")) for c in case])
+    return json.dumps(_judge(case.get("eval_id", "UNKNOWN") if isinstance(case, dict) else "UNKNOWN"))
+
+class MockState:
+    def __init__(self, latency="fixed:0.05", p429=0.0, p500=0.0, rpm=0, seed=None):
+        self.latency = parse_latency(latency)
+        self.p429, self.p500, self.rpm = p429, p500, rpm
+        self.lock = threading.Lock()
+        self.window = []  # request timestamps in the last 60s (for --rpm)
+        self.stats = {"requests": 0, "ok": 0, "429": 0, "500": 0, "in_flight": 0, "max_in_flight": 0, "cached_tokens": 0}
+        self.prefixes = set()  # hashes of every 128-token prefix seen so far
+        if seed is not None:
+            random.seed(seed)
+
+    def admit(self):
+        # -> (status, headers); status is 200, 429 or 500
+        with self.lock:
+            now = time.time()
+            self.stats["requests"] += 1
+            self.window = [t for t in self.window if now - t < 60]
+            headers = {}
+            if self.rpm:
+                remaining = max(0, self.rpm - len(self.window))
+                reset = 60 - (now - self.window[0]) if self.window else 0.0
+                headers = {"x-ratelimit-limit-requests": str(self.rpm),
+                           "x-ratelimit-remaining-requests": str(max(0, remaining - 1)),
+                           "x-ratelimit-reset-requests": f"{reset:.3f}s"}
+                if remaining <= 0:
+                    self.stats["429"] += 1
+                    return 429, dict(headers, **{"retry-after": f"{max(reset, 0.05):.3f}"})
+            r = random.random()
+            if r < self.p429:
+                self.stats["429"] += 1
+                return 429, dict(headers, **{"retry-after": "0.1"})
+            if r < self.p429 + self.p500:
+                self.stats["500"] += 1
+                return 500, headers
+            self.window.append(now)
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            return 200, headers
+
+    def cached_tokens(self, messages):
+        text = "".join(f"{m.get('role')}\n{m.get('content', '')}\n" for m in messages)
+        step, cached, h, hashes = 128 * 4, 0, hashlib.sha1(), []
+        for i in range(0, len(text) - step + 1, step):
+            h.update(text[i:i + step].encode("utf-8"))
+            hashes.append(h.copy().digest())
+        with self.lock:
+            for k, h in enumerate(hashes):
+                if h not in self.prefixes:
+                    break
+                cached = (k + 1) * 128
+            self.prefixes.update(hashes)
+            cached = cached if cached >= 1024 else 0
+            self.stats["cached_tokens"] += cached
+        return cached
+
+    def done(self):
+        with self.lock:
+            self.stats["in_flight"] -= 1
+            self.stats["ok"] += 1
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # set by make_server
+
+    def log_message(self, *a):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            return self._send(200, dict(self.state.stats))
+        self._send(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        path = self.path.split("?")[0].rstrip("/")
+        if not path.endswith(("/chat/completions", "/responses")):
+            return self._send(404, {"error": {"message": f"unsupported endpoint {path}"}})
+        status, headers = self.state.admit()
+        if status != 200:
+            kind = "rate_limit_exceeded" if status == 429 else "server_error"
+            return self._send(status, {"error": {"message": f"mock {status}", "type": kind, "code": kind}}, headers)
+        try:
+            time.sleep(self.state.latency())
+            if path.endswith("/chat/completions"):
+                self._chat(req, headers)
+            else:
+                self._responses(req, headers)
+        finally:
+            self.state.done()
+
+    def _chat(self, req, headers):
+        messages = req.get("messages") or []
+        content = reply_for(messages)
+        prompt = sum(_tokens(str(m.get("content", ""))) for m in messages)
+        usage = {"prompt_tokens": prompt, "completion_tokens": _tokens(content),
+                 "prompt_tokens_details": {"cached_tokens": min(prompt, self.state.cached_tokens(messages))}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        cid, created, model = f"chatcmpl-{uuid.uuid4().hex[:24]}", int(time.time()), req.get("model", "mock")
+        if not req.get("stream"):
+            return self._send(200, {"id": cid, "object": "chat.completion", "created": created, "model": model,
+                                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                                                 "finish_reason": "stop", "logprobs": None}],
+                                    "usage": usage}, headers)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        # Chunked, so the connection stays open for the next request (keep-alive, as real APIs do)
+        self.send_header("Transfer-Encoding", "chunked")
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        def chunk(data):
+            self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+            self.wfile.flush()
+        base = {"id": cid, "object": "chat.completion.chunk", "created": created, "model": model}
+        pieces = [content[i:i + 40] for i in range(0, len(content), 40)]
+        events = [dict(base, choices=[{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])]
+        events += [dict(base, choices=[{"index": 0, "delta": {"content": p}, "finish_reason": None}]) for p in pieces]
+        events.append(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+        if (req.get("stream_options") or {}).get("include_usage"):
+            events.append(dict(base, choices=[], usage=usage))
+        for ev in events:
+            chunk(f"data: {json.dumps(ev)}\n\n".encode("utf-8"))
+        chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _responses(self, req, headers):
+        inp = req.get("input")
+        messages = inp if isinstance(inp, list) else [{"role": "user", "content": str(inp or "")}]
+        content = reply_for(messages)
+        prompt = sum(_tokens(str(m.get("content", ""))) for m in messages)
+        usage = {"input_tokens": prompt, "output_tokens": _tokens(content),
+                 "input_tokens_details": {"cached_tokens": min(prompt, self.state.cached_tokens(messages))},
+                 "output_tokens_details": {"reasoning_tokens": 0}}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        self._send(200, {
+            "id": f"resp_{uuid.uuid4().hex[:24]}", "object": "response", "created_at": int(time.time()),
+            "status": "completed", "model": req.get("model", "mock"), "parallel_tool_calls": True,
+            "tool_choice": "auto", "tools": [], "temperature": req.get("temperature"),
+            "output": [{"type": "message", "id": f"msg_{uuid.uuid4().hex[:24]}", "status": "completed", "role": "assistant",
+                        "content": [{"type": "output_text", "text": content, "annotations": []}]}],
+            "usage": usage,
+        }, headers)
+
+def make_server(host="127.0.0.1", port=0, **state_kw):
+    handler = type("MockHandler", (Handler,), {"state": MockState(**state_kw)})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+def start_in_thread(**kw):
+    # -> (server, base_url); call server.shutdown() when done
+    server = make_server(**kw)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/v1"
+
+def add_mock_args(ap):
+    ap.add_argument("--latency", default="lognormal:0.3,0.5", help="fixed:S | uniform:A,B | normal:MU,SIGMA | lognormal:MEDIAN,SIGMA")
+    ap.add_argument("--p429", type=float, default=0.0, help="fraction of requests answered with 429")
+    ap.add_argument("--p500", type=float, default=0.0, help="fraction of requests answered with 500")
+    ap.add_argument("--rpm", type=int, default=0, help="requests/min budget before 429s (0 = unlimited)")
+    ap.add_argument("--seed", type=int)
+
+def main():
+    ap = argparse.ArgumentParser(description="Mock OpenAI-compatible server")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    add_mock_args(ap)
+    args = ap.parse_args()
+    server = make_server(args.host, args.port, latency=args.latency, p429=args.p429, p500=args.p500, rpm=args.rpm, seed=args.seed)
+    print(f"Mock OpenAI server on http://{args.host}:{args.port}/v1  (export OPENAI_BASE_URL to use it)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import argparse, glob, json, os, subprocess, sys, time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.mock_server import add_mock_args, start_in_thread
+
+# Scripted throughput scenarios against the mock server: builds N-case datasets from the
+# eval/S*.json templates, runs src/run_eval.py end to end and reports cases/sec, p95 case
+# latency, peak RSS of the run and report-build time.
+
+SCENARIOS = {"50": 50, "1k": 1000, "10k": 10000}
+
+def build_dataset(n, path, templates="eval/S*.json"):
+    cases = []
+    for p in sorted(glob.glob(templates)):
+        with open(p, "r", encoding="utf-8") as f:
+            cases.append(json.load(f))
+    if not cases:
+        raise SystemExit(f"No templates at {templates}")
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            t = cases[i % len(cases)]
+            f.write(json.dumps({
+                "eval_id": f"{t['eval_id']}-{i:05d}" if n > len(cases) else t["eval_id"],
+                "prompt": t.get("rep_input") or t.get("prompt", ""),
+                "category": t.get("category", ""),
+                "criteria": t.get("evaluation_criteria") or t.get("criteria", []),
+            }, ensure_ascii=False) + "\n")
+    return path
+
+def _run(cmd, env):
+    # -> (wall seconds, peak RSS MB) for one child process
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, ru = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    err = proc.stderr.read().decode("utf-8", "replace")
+    proc.stderr.close()
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise SystemExit(f"{' '.join(cmd)} failed:\n{err[-2000:]}")
+    rss_mb = ru.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return wall, round(rss_mb, 1)
+
+def run_scenario(name, n, base_url, workdir, run_args):
+    env = dict(os.environ, OPENAI_API_KEY="sk-bench", OPENAI_BASE_URL=base_url, OPENAI_API_BASE=base_url)
+    data = build_dataset(n, os.path.join(workdir, f"dataset_{name}.jsonl"))
+    outdir = os.path.join(workdir, f"runs_{name}")
+    wall, rss = _run([sys.executable, "src/run_eval.py", "--dataset", data, "--outdir", outdir, "--cache", "off"] + run_args, env)
+    base = os.path.realpath(os.path.join(outdir, "latest"))
+    with open(os.path.join(base, "metrics.json"), "r", encoding="utf-8") as f:
+        m = json.load(f)
+    report_s, _ = _run([sys.executable, "src/report.py", "--base", base], env)
+    return {
+        "scenario": name, "cases": n, "wall_s": round(wall, 2),
+        "cases_per_s": round(n / wall, 2) if wall else None,
+        "p95_case_latency_s": m["totals"]["case_latency_s"]["p95"],
+        "engine_s": m.get("wall_s"),
+        "peak_rss_mb": rss,
+        "report_build_s": round(report_s, 2),
+        "run_dir": base,
+    }
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline throughput benchmark for the eval harness")
+    ap.add_argument("scenarios", nargs="*", default=["50"], help=f"any of {', '.join(SCENARIOS)} or a case count")
+    ap.add_argument("--workdir", default="results/bench")
+    ap.add_argument("--run_args", default="--concurrency 16", help="extra args passed to src/run_eval.py")
+    add_mock_args(ap)
+    ap.set_defaults(latency="lognormal:0.2,0.5")
+    args = ap.parse_args()
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    workdir = os.path.join(args.workdir, stamp)
+    os.makedirs(workdir, exist_ok=True)
+    server, url = start_in_thread(latency=args.latency, p429=args.p429, p500=args.p500, rpm=args.rpm, seed=args.seed)
+    rows = []
+    try:
+        for name in args.scenarios:
+            n = SCENARIOS.get(name) or int(name)
+            print(f"[bench] {name}: {n} cases, mock latency {args.latency}, run_eval {args.run_args}", flush=True)
+            r = run_scenario(name, n, url, workdir, args.run_args.split())
+            r["mock"] = dict(server.RequestHandlerClass.state.stats)
+            rows.append(r)
+            print(f"[bench] {name}: {r['cases_per_s']} cases/s, p95 case {r['p95_case_latency_s']}s, "
+                  f"peak RSS {r['peak_rss_mb']} MB, report build {r['report_build_s']}s", flush=True)
+    finally:
+        server.shutdown()
+
+    out = os.path.join(workdir, "bench.json")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"created": stamp, "latency": args.latency, "p429": args.p429, "p500": args.p500,
+                   "run_args": args.run_args, "results": rows}, f, indent=2)
+    print(f"\n{'scenario':>8} {'cases':>6} {'cases/s':>8} {'p95 s':>7} {'RSS MB':>7} {'report s':>8}")
+    for r in rows:
+        print(f"{r['scenario']:>8} {r['cases']:>6} {r['cases_per_s']:>8} {r['p95_case_latency_s']:>7} {r['peak_rss_mb']:>7} {r['report_build_s']:>8}")
+    print(f"\nWrote {out}")
+
+if __name__ == "__main__":
+    main()
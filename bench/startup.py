@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+import argparse, glob, os, shutil, statistics, subprocess, sys, tempfile, time
+
+# Cold-start timings for the short-lived CLI invocations CI jobs make: --help, building
+# each engine (which is where the SDK imports now happen) and a report-only rebuild.
+
+def _engine(name):
+    return [sys.executable, "-c", f"import sys; sys.path.insert(0, 'src'); import engines; engines.ENGINES[{name!r}]('gpt-4o', 0.0)"]
+
+def commands(sample_run):
+    cmds = {
+        "run_eval --help": [sys.executable, "src/run_eval.py", "--help"],
+        "judge_batch --help": [sys.executable, "src/judge_batch.py", "--help"],
+        "engine langchain": _engine("langchain"),
+        "engine openai": _engine("openai"),
+    }
+    if sample_run:
+        # Copy of the run so the rebuild doesn't touch it
+        out = os.path.join(tempfile.mkdtemp(prefix="startup_report_"), "run")
+        shutil.copytree(sample_run, out)
+        cmds["report"] = [sys.executable, "src/report.py", "--base", out]
+    return cmds
+
+def time_cmd(cmd, n, env):
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, env=env, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+def main():
+    ap = argparse.ArgumentParser(description="Cold-start benchmark for the eval CLIs")
+    ap.add_argument("-n", type=int, default=5, help="runs per command")
+    ap.add_argument("--sample_run", default=(sorted(glob.glob("results/run_latest/2*/")) or [""])[0].rstrip("/"),
+                    help="run dir used for the report-only rebuild")
+    args = ap.parse_args()
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY") or "sk-startup-bench")
+    print(f"{'command':<20} {'min ms':>8} {'median ms':>10}")
+    for name, cmd in commands(args.sample_run).items():
+        ts = time_cmd(cmd, args.n, env)
+        print(f"{name:<20} {min(ts):>8.0f} {statistics.median(ts):>10.0f}")
+
+if __name__ == "__main__":
+    main()
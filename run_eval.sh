@@ -11,6 +11,17 @@ fi
 
 # Allow small smokes: DATASET=eval/eval_set_5.jsonl ./run_eval.sh
 DATASET="${DATASET:-eval/eval_set.jsonl}"
+# Parallel LLM calls: CONCURRENCY=8 ./run_eval.sh
+CONCURRENCY="${CONCURRENCY:-1}"
+# One append-only run.jsonl instead of a JSON file per case: STORE=jsonl (or jsonl.gz) ./run_eval.sh
+STORE="${STORE:-files}"
+# Continue an interrupted run instead of starting fresh: RESUME=latest ./run_eval.sh
+EXTRA_ARGS=()
+[ -n "${RESUME:-}" ] && EXTRA_ARGS=(--resume "$RESUME")
+# Run one slice of the dataset (merge the slices with src/merge_runs.py): SHARD=0/4 ./run_eval.sh
+[ -n "${SHARD:-}" ] && EXTRA_ARGS+=(--shard "$SHARD")
+# Rubric and label values for the judge prompt's {{placeholders}}: PROMPT_VARS=my_vars.json ./run_eval.sh
+PROMPT_VARS="${PROMPT_VARS:-prompt/judge_vars.json}"
 
 echo "[run] dataset = $DATASET"
 
@@ -22,40 +33,29 @@ python src/run_eval.py \
   --outdir results/run_latest \
   --model gpt-4o \
   --judge_model gpt-4o \
-  --temp 0.6
+  --temp 0.6 \
+  --prompt_vars_file "$PROMPT_VARS" \
+  --concurrency "$CONCURRENCY" \
+  --store "$STORE" \
+  ${EXTRA_ARGS[@]+"${EXTRA_ARGS[@]}"}
 
-# 2) Find newest COMPLETE timestamped run using Python (no fragile globs)
-BASE="$(python - <<'PY'
-import os, glob
-candidates = sorted(glob.glob("results/run_latest/*/"))
-best = ""
-for d in reversed(candidates):
-    gen = glob.glob(os.path.join(d, "gen", "*.gen.json"))
-    jgd = glob.glob(os.path.join(d, "judged", "*.judge.json"))
-    if gen and jgd:
-        best = d.rstrip("/")
-        break
-print(best)
-PY
-)"
-[ -n "$BASE" ] || { echo "[run] No complete run found."; exit 2; }
-
-# Resolve absolute path
-ABS="$(python -c 'import os,sys; print(os.path.realpath(sys.argv[1]))' "$BASE")"
+# 2) run_eval.py points results/run_latest/latest at the run it just wrote
+[ -L results/run_latest/latest ] || { echo "[run] results/run_latest/latest not found; see run_eval.py output"; exit 2; }
+ABS="$(realpath results/run_latest/latest)"
 
 echo "[run] base = $ABS"
 
-# 3) Build chats & report INTO that run
-python src/make_chat_pages.py --base "$ABS"
-python src/report_batch.py --judged_glob "$ABS/judged/*.judge.json" --outdir "$ABS/report"
-
-# 4) Optional: refresh 'latest' symlink (absolute target)
-rm -rf results/run_latest/latest
-ln -sfn "$ABS" results/run_latest/latest
+# 3) Report, CSV and chat pages were built in-process by run_eval.py; rebuild only when asked
+#    (e.g. after editing templates): REBUILD_REPORT=1 ./run_eval.sh
+if [ -n "${REBUILD_REPORT:-}" ]; then
+  python src/report.py --base "$ABS"
+fi
 
-# 5) Summary
-GENS=$(ls "$ABS/gen"/*.gen.json 2>/dev/null | wc -l | tr -d ' ')
-JGDS=$(ls "$ABS/judged"/*.judge.json 2>/dev/null | wc -l | tr -d ' ')
+# 4) Summary
+# Counted through the run's store, so run.jsonl runs report the same numbers as per-file runs
+COUNTS="$(python -c 'import sys; sys.path.insert(0, "src"); from run_store import open_store; g, j = open_store(sys.argv[1]).scan(); print(len(g), len(j))' "$ABS")"
+GENS="${COUNTS% *}"
+JGDS="${COUNTS#* }"
 CHTS=$(ls "$ABS/report/chat"/S*.html 2>/dev/null | wc -l | tr -d ' ')
 
 echo
@@ -0,0 +1,139 @@
+import math, random, asyncio
+from statistics import NormalDist
+
+# --target_ci: judge a stratified random subset, just large enough to pin down the pass rate of
+# every category. Cases are shuffled per category (--seed) and each new case goes to the
+# category whose interval is currently widest. Intervals are Wilson score intervals with a
+# finite-population correction, so a fully evaluated category has width 0. No new cases are
+# started once every category's interval is narrower than --target_ci, or once --ci_budget
+# cases / --ci_max_cost USD have been spent.
+
+NONE = "(none)"
+
+def add_adaptive_args(ap):
+    ap.add_argument("--target_ci", type=float, help="stop once every category's pass-rate interval is narrower than this (e.g. 0.2 = 20 points)")
+    ap.add_argument("--ci_level", type=float, default=0.95, help="--target_ci: confidence level of the intervals")
+    ap.add_argument("--ci_budget", type=int, help="--target_ci: evaluate at most this many cases")
+    ap.add_argument("--ci_max_cost", type=float, help="--target_ci: stop starting cases once the estimated cost (USD) reaches this")
+    ap.add_argument("--seed", type=int, default=0, help="--target_ci: shuffle seed for the case order")
+
+def wilson(passes, n, N=None, level=0.95):
+    # -> (lo, hi) for a pass rate of passes/n out of a category of N cases
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + level / 2)
+    if N:
+        z *= math.sqrt(max(0.0, (N - n) / (N - 1))) if N > 1 else 0.0
+    p = passes / n
+    d = 1 + z * z / n
+    c = (p + z * z / (2 * n)) / d
+    h = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / d
+    return max(0.0, c - h), min(1.0, c + h)
+
+class Stratum:
+    def __init__(self, name, cases):
+        self.name, self.todo, self.total = name, cases, len(cases)
+        self.n = self.passes = self.inflight = 0
+
+    def interval(self, level):
+        return wilson(self.passes, self.n, self.total, level)
+
+    def width(self, level):
+        lo, hi = self.interval(level)
+        return hi - lo
+
+    def expected_width(self, level):
+        # Width once the in-flight cases land, assuming they pass at the current rate
+        n = self.n + self.inflight
+        if n == 0:
+            return 1.0
+        p = self.passes / self.n if self.n else 0.5
+        lo, hi = wilson(p * n, n, self.total, level)
+        return hi - lo
+
+class StratifiedSampler:
+    def __init__(self, examples, args, cost=lambda: 0.0, done=None):
+        # examples in dataset order; done: {eval_id: judge dict} already judged (--resume)
+        self.args, self.cost = args, cost
+        self.order = {ex["eval_id"]: i for i, ex in enumerate(examples)}
+        done = done or {}
+        rng = random.Random(args.seed)
+        by_cat = {}
+        for ex in examples:
+            by_cat.setdefault(ex.get("category") or NONE, []).append(ex)
+        self.strata = {}
+        for name, cases in sorted(by_cat.items()):
+            rng.shuffle(cases)
+            s = self.strata[name] = Stratum(name, [ex for ex in cases if ex["eval_id"] not in done])
+            s.total = len(cases)
+        self.judged, self.issued, self.stopped = {}, 0, None
+        self.changed = asyncio.Event()
+        for ex in examples:
+            if ex["eval_id"] in done:
+                self.update(ex, done[ex["eval_id"]], issued=False)
+
+    def _pick(self):
+        level, target = self.args.ci_level, self.args.target_ci
+        if all(s.width(level) <= target for s in self.strata.values()):
+            return None, "converged"
+        if self.args.ci_budget is not None and self.issued >= self.args.ci_budget:
+            return None, "budget"
+        if self.args.ci_max_cost is not None and (self.cost() or 0.0) >= self.args.ci_max_cost:
+            return None, "cost"
+        open_ = [s for s in self.strata.values() if s.todo and s.expected_width(level) > target]
+        if not open_:
+            return None, "converged" if not any(s.todo for s in self.strata.values()) else "waiting"
+        s = max(open_, key=lambda s: (s.expected_width(level), -s.n - s.inflight))
+        s.inflight += 1
+        self.issued += 1
+        return s.todo.pop(), None
+
+    async def next(self):
+        # Next case to run, or None once nothing more should be started. Waits while the only
+        # undecided categories have cases in flight.
+        while True:
+            ex, why = self._pick()
+            if ex is not None:
+                return ex
+            if why != "waiting" or not any(s.inflight for s in self.strata.values()):
+                self.stopped = self.stopped or ("exhausted" if why == "waiting" else why)
+                return None
+            self.changed.clear()
+            await self.changed.wait()
+
+    def update(self, ex, j, issued=True):
+        s = self.strata[ex.get("category") or NONE]
+        if issued:
+            s.inflight -= 1
+        s.n += 1
+        s.passes += 1 if j.get("pass") else 0
+        self.judged[ex["eval_id"]] = j
+        self.changed.set()
+
+    def results(self):
+        return [self.judged[e] for e in sorted(self.judged, key=self.order.get)]
+
+    def summary(self):
+        level = self.args.ci_level
+        total = sum(s.total for s in self.strata.values())
+        cats = {}
+        for s in self.strata.values():
+            lo, hi = s.interval(level)
+            cats[s.name] = {"n": s.n, "total": s.total, "passes": s.passes,
+                            "pass_rate": round(s.passes / s.n, 4) if s.n else None,
+                            "lo": round(lo, 4), "hi": round(hi, 4), "width": round(hi - lo, 4)}
+        # Overall pass rate: strata weighted by size (normal approximation with the same correction)
+        seen = [s for s in self.strata.values() if s.n]
+        overall = None
+        if seen:
+            w = {s.name: s.total / total for s in seen}
+            p = sum(w[s.name] * s.passes / s.n for s in seen) / sum(w.values())
+            var = sum(w[s.name] ** 2 * (s.passes / s.n) * (1 - s.passes / s.n) / s.n
+                      * ((s.total - s.n) / (s.total - 1) if s.total > 1 else 0.0) for s in seen) / sum(w.values()) ** 2
+            z = NormalDist().inv_cdf(0.5 + level / 2)
+            overall = {"pass_rate": round(p, 4), "lo": round(max(0.0, p - z * math.sqrt(var)), 4),
+                       "hi": round(min(1.0, p + z * math.sqrt(var)), 4)}
+        n = sum(s.n for s in self.strata.values())
+        return {"target": self.args.target_ci, "level": level, "seed": self.args.seed, "stopped": self.stopped,
+                "evaluated": n, "total": total, "fraction": round(n / total, 4) if total else None,
+                "overall": overall, "categories": cats}
@@ -0,0 +1,56 @@
+import heapq, itertools
+
+# Constant-memory roll-up of judge results as they land: running pass rate and mean score, a
+# score histogram, per-category counters and the K worst cases (failures first, then lowest
+# score). run_eval.py feeds it one judge dict at a time and records summary() as "aggregate" in
+# metrics.json; the HTML report builds one while it streams the records into summary.csv.
+
+class RunAggregator:
+    def __init__(self, top_k=10, bin_width=10):
+        self.top_k, self.bin_width = top_k, bin_width
+        self.n = self.passes = self.score_sum = self.parse_failures = 0
+        self.hist = [0] * (100 // bin_width)
+        self.cats = {}   # category -> [n, passes, score_sum]
+        self.worst = []  # min-heap on badness, at most top_k entries
+        self._seq = itertools.count()
+
+    def add(self, j):
+        score = max(0, min(100, int(j.get("score") or 0)))
+        passed = bool(j.get("pass"))
+        self.n += 1
+        self.passes += passed
+        self.score_sum += score
+        self.parse_failures += 1 if j.get("parse_error") else 0
+        self.hist[min(score // self.bin_width, len(self.hist) - 1)] += 1
+        c = self.cats.setdefault(j.get("category") or "(none)", [0, 0, 0])
+        c[0] += 1; c[1] += passed; c[2] += score
+        findings = j.get("findings") or []
+        # Ties keep the earlier case (a larger seq is less bad)
+        entry = ((not passed, -score, -next(self._seq)), j.get("eval_id"), score, passed, str(findings[0])[:200] if findings else "")
+        if len(self.worst) < self.top_k:
+            heapq.heappush(self.worst, entry)
+        elif entry > self.worst[0]:
+            heapq.heapreplace(self.worst, entry)
+
+    def pass_rate(self):
+        return round(self.passes / self.n, 4) if self.n else None
+
+    def avg_score(self):
+        return round(self.score_sum / self.n, 2) if self.n else None
+
+    def line(self):
+        if not self.n:
+            return "no cases judged"
+        return f"pass {100 * self.passes / self.n:.1f}% ({self.passes}/{self.n}), avg score {self.score_sum / self.n:.1f}"
+
+    def summary(self):
+        w = self.bin_width
+        return {
+            "n": self.n, "passes": self.passes, "pass_rate": self.pass_rate(), "avg_score": self.avg_score(),
+            "parse_failures": self.parse_failures,
+            "histogram": [{"lo": i * w, "hi": 100 if i == len(self.hist) - 1 else (i + 1) * w - 1, "n": k} for i, k in enumerate(self.hist)],
+            "categories": {cat: {"n": n, "passes": p, "pass_rate": round(p / n, 4), "avg_score": round(s / n, 2)}
+                           for cat, (n, p, s) in sorted(self.cats.items())},
+            "worst": [{"eval_id": eid, "score": score, "pass": passed, "finding": finding}
+                      for _, eid, score, passed, finding in sorted(self.worst, reverse=True)],
+        }
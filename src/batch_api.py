@@ -0,0 +1,91 @@
+import os, json, time, uuid
+
+ENDPOINT = "/v1/chat/completions"
+TERMINAL = ("completed", "failed", "expired", "cancelled")
+
+def request_line(custom_id, model, temperature, messages, response_format=None):
+    body = {"model": model, "temperature": temperature, "messages": messages}
+    if response_format:
+        body["response_format"] = response_format
+    return {"custom_id": custom_id, "method": "POST", "url": ENDPOINT, "body": body}
+
+def output_content(line):
+    # One line of a batch output file -> assistant text (None if the request errored)
+    resp = line.get("response") or {}
+    if line.get("error") or resp.get("status_code", 200) != 200:
+        return None
+    choices = (resp.get("body") or {}).get("choices") or []
+    return ((choices[0] if choices else {}).get("message") or {}).get("content")
+
+def output_usage(line):
+    u = (((line.get("response") or {}).get("body") or {}).get("usage")) or {}
+    if not u:
+        return None
+    return {"input_tokens": u.get("prompt_tokens", 0), "output_tokens": u.get("completion_tokens", 0),
+            "cached_tokens": (u.get("prompt_tokens_details") or {}).get("cached_tokens")}
+
+class OpenAIBatchBackend:
+    def __init__(self, client):
+        self.client = client
+
+    def submit(self, path):
+        with open(path, "rb") as f:
+            fobj = self.client.files.create(file=f, purpose="batch")
+        b = self.client.batches.create(input_file_id=fobj.id, endpoint=ENDPOINT, completion_window="24h")
+        return b.id
+
+    def status(self, batch_id):
+        b = self.client.batches.retrieve(batch_id)
+        return {"status": b.status, "output_file_id": b.output_file_id, "error_file_id": b.error_file_id}
+
+    def fetch(self, file_id):
+        return self.client.files.content(file_id).text
+
+def _canned_judge(body, custom_id):
+    return json.dumps({"eval_id": custom_id, "score": 85, "pass": True,
+                       "findings": ["local batch stand-in"], "rationale": "Canned response from LocalBatchBackend."})
+
+class LocalBatchBackend:
+    # File-based stand-in for the batch endpoint: a batch is a directory under root holding
+    # input.jsonl; it "completes" on the first poll after `delay` seconds, with respond(body, custom_id)
+    # producing each assistant message. Lets the submit/poll/fan-out flow run offline.
+    def __init__(self, root, respond=None, delay=0.0):
+        self.root = root
+        self.respond = respond or _canned_judge
+        self.delay = delay
+        os.makedirs(root, exist_ok=True)
+
+    def submit(self, path):
+        batch_id = f"batch_local_{uuid.uuid4().hex[:12]}"
+        d = os.path.join(self.root, batch_id)
+        os.makedirs(d)
+        with open(path, "r", encoding="utf-8") as src, open(os.path.join(d, "input.jsonl"), "w", encoding="utf-8") as dst:
+            dst.write(src.read())
+        with open(os.path.join(d, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"created": time.time()}, f)
+        return batch_id
+
+    def status(self, batch_id):
+        d = os.path.join(self.root, batch_id)
+        out = os.path.join(d, "output.jsonl")
+        if not os.path.exists(out):
+            with open(os.path.join(d, "meta.json"), "r", encoding="utf-8") as f:
+                created = json.load(f)["created"]
+            if time.time() - created < self.delay:
+                return {"status": "in_progress", "output_file_id": None, "error_file_id": None}
+            with open(os.path.join(d, "input.jsonl"), "r", encoding="utf-8") as src, open(out + ".tmp", "w", encoding="utf-8") as dst:
+                for raw in src:
+                    if not raw.strip():
+                        continue
+                    req = json.loads(raw)
+                    content = self.respond(req["body"], req["custom_id"])
+                    dst.write(json.dumps({
+                        "id": f"req_{uuid.uuid4().hex[:12]}", "custom_id": req["custom_id"], "error": None,
+                        "response": {"status_code": 200, "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]}},
+                    }, ensure_ascii=False) + "\n")
+            os.replace(out + ".tmp", out)
+        return {"status": "completed", "output_file_id": out, "error_file_id": None}
+
+    def fetch(self, file_id):
+        with open(file_id, "r", encoding="utf-8") as f:
+            return f.read()
@@ -0,0 +1,132 @@
+import statistics
+
+# Scripted multi-turn cases: a dataset record with "turns" (the rep's messages, in order) is
+# played against the HCP one turn at a time. Each request is
+#   system prompt [+ summary of dropped turns] + kept turns + the new rep turn
+# and earlier turns are only ever removed in one block (compaction) when the next request would
+# exceed --context_budget tokens. Between compactions every request extends the previous one
+# byte for byte, so the provider's prompt cache covers the whole prefix, and the prompt size
+# per turn stays bounded however long the conversation gets.
+
+SUMMARY_REQ = ("Summarize the conversation so far between a pharmaceutical sales representative (Rep) and "
+               "the physician (HCP) in at most 150 words. Keep the products, patient details, questions "
+               "asked and positions the HCP has taken. Plain text only.")
+
+def add_conversation_args(ap):
+    ap.add_argument("--context_budget", type=int, default=6000, help="multi-turn cases: max prompt tokens per HCP turn")
+    ap.add_argument("--context_mode", choices=("truncate", "summarize"), default="truncate",
+                    help="multi-turn cases: drop old turns, or replace them with a running summary (one extra call per compaction)")
+    ap.add_argument("--judge_per", choices=("conversation", "turn"), default="conversation",
+                    help="multi-turn cases: one judge call over the transcript, or one per HCP turn")
+
+def tokens(text):
+    # Same chars/4 estimate as the scheduler; +4 for message framing
+    return len(text) // 4 + 4
+
+def check_budget(system, examples, budget):
+    # Compaction keeps turns within half the budget after the system prompt and the new rep
+    # turn; if those alone fill that half, every turn would drop all history (and, with
+    # --context_mode summarize, pay a summary call), so refuse the run up front
+    reps = [tokens(r) for ex in examples for r in ex.get("turns") or []]
+    if not reps:
+        return
+    need = 2 * (tokens(system) + max(reps))
+    if budget < need:
+        raise SystemExit(f"--context_budget {budget} is too small for these multi-turn cases: the system prompt plus the "
+                         f"longest rep turn need ~{need // 2} tokens and compaction keeps half the budget; use at least {need}")
+
+def transcript(turns):
+    # [{"rep", "hcp"}] -> text handed to the judge (and stored as the gen record's model_output)
+    return "\n\n".join(f"Rep: {t['rep']}\n\nHCP: {t['hcp']}" for t in turns)
+
+class History:
+    def __init__(self, system, budget):
+        self.system, self.budget = system, budget
+        self.turns = []       # kept (rep, hcp) pairs
+        self.summary = None   # running summary of dropped turns (--context_mode summarize)
+        self.dropped = 0
+
+    def messages(self, rep):
+        msgs = [("system", self.system)]
+        if self.summary:
+            msgs.append(("system", f"Summary of the earlier conversation:\n{self.summary}"))
+        elif self.dropped:
+            msgs.append(("system", f"({self.dropped} earlier turns of this conversation are not shown.)"))
+        for r, h in self.turns:
+            msgs += [("user", r), ("assistant", h)]
+        msgs.append(("user", rep))
+        return msgs
+
+    def size(self, rep):
+        return sum(tokens(c) for _, c in self.messages(rep))
+
+    def compact(self, rep):
+        # Drop the oldest turns, keeping the newest ones that fit in half the budget, so several
+        # turns can be appended before the next compaction. -> dropped (rep, hcp) pairs
+        if self.size(rep) <= self.budget or not self.turns:
+            return []
+        room, keep = self.budget // 2 - tokens(self.system) - tokens(rep), 0
+        for r, h in reversed(self.turns):
+            room -= tokens(r) + tokens(h)
+            if room < 0 and keep:
+                break
+            keep += 1  # the newest turn is always kept, so a long reply cannot empty the history
+        dropped, self.turns = self.turns[:len(self.turns) - keep], self.turns[len(self.turns) - keep:]
+        self.dropped += len(dropped)
+        return dropped
+
+    def add(self, rep, hcp):
+        self.turns.append((rep, hcp))
+
+def summary_messages(summary, dropped):
+    text = transcript([{"rep": r, "hcp": h} for r, h in dropped])
+    if summary:
+        text = f"Earlier summary:\n{summary}\n\nLater turns:\n{text}"
+    return [("system", SUMMARY_REQ), ("user", text)]
+
+def sum_usage(usages):
+    usages = [u for u in usages if u]
+    if not usages:
+        return None
+    out = {k: round(sum(u.get(k) or 0 for u in usages), 4) for k in ("input_tokens", "output_tokens", "cached_tokens", "latency_s")}
+    costs = [u["cost_usd"] for u in usages if u.get("cost_usd") is not None]
+    out["cost_usd"] = round(sum(costs), 6) if costs else None
+    out["retries"] = sum(u.get("retries") or 0 for u in usages)
+    out["cached"] = all(u.get("cached") for u in usages)
+    out["calls"] = len(usages)
+    return out
+
+def aggregate_turns(first, turn_judges):
+    # --judge_per turn: score = mean over turns, pass = every turn passes; findings are
+    # prefixed with their turn, failing turns first
+    k = len(turn_judges)
+    out = dict(first)
+    order = sorted(range(k), key=lambda i: (turn_judges[i]["pass"], i))
+    out.update({"score": round(sum(j["score"] for j in turn_judges) / k), "pass": all(j["pass"] for j in turn_judges),
+                "findings": [f"Turn {i + 1}: {f}" for i in order for f in (turn_judges[i].get("findings") or [])[:2]],
+                "rationale": " ".join(f"Turn {i + 1}: {turn_judges[i].get('rationale', '')}" for i in order if not turn_judges[i]["pass"]) or first.get("rationale", ""),
+                "turns": [{"turn": i + 1, "score": j["score"], "pass": j["pass"], "findings": j.get("findings") or [],
+                           "rationale": j.get("rationale", "")} for i, j in enumerate(turn_judges)]})
+    usage = sum_usage([j.get("judge_usage") for j in turn_judges])
+    if usage:
+        out["judge_usage"] = usage
+    return out
+
+def conversation_summary(gens):
+    # Per-turn prompt tokens and latency over all multi-turn cases (flat = bounded context)
+    by_turn, compactions, n = {}, 0, 0
+    for g in gens:
+        if not g or not g.get("turns"):
+            continue
+        n += 1
+        for i, t in enumerate(g["turns"]):
+            u = t.get("usage") or {}
+            by_turn.setdefault(i + 1, []).append((t.get("context_tokens") or 0, u.get("input_tokens") or 0, u.get("latency_s") or 0.0))
+            compactions += 1 if t.get("compacted") else 0
+    if not n:
+        return None
+    mean = lambda xs: round(statistics.fmean(xs), 3) if xs else None
+    return {"cases": n, "turns": sum(len(v) for v in by_turn.values()), "compactions": compactions,
+            "by_turn": [{"turn": k, "n": len(v), "context_tokens": mean([x[0] for x in v]),
+                         "input_tokens": mean([x[1] for x in v]), "latency_s": mean([x[2] for x in v])}
+                        for k, v in sorted(by_turn.items())]}
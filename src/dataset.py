@@ -0,0 +1,76 @@
+import os, json, glob, hashlib
+
+# Eval cases come as JSONL (eval_set.jsonl), a JSON array (eval_set.json) or one JSON file per
+# case (eval/S*.json), with either prompt/criteria or rep_input/evaluation_criteria keys.
+# iter_cases() streams any of these as {"eval_id", "prompt", "category", "criteria", ...}.
+# Multi-turn cases add "turns", the rep's scripted messages (conversation.py).
+
+ALIASES = {"rep_input": "prompt", "evaluation_criteria": "criteria"}
+
+def normalize(rec, where=""):
+    if not isinstance(rec, dict) or not rec.get("eval_id"):
+        raise SystemExit(f"Dataset record without eval_id{' in ' + where if where else ''}")
+    out = {ALIASES.get(k, k): v for k, v in rec.items() if k not in ALIASES or ALIASES[k] not in rec}
+    out["eval_id"] = str(out["eval_id"])
+    if out.get("turns"):
+        # Multi-turn script: the rep's messages, as strings or {"role", "content"} dicts
+        # (non-rep roles are ignored; the HCP side is generated)
+        out["turns"] = [t if isinstance(t, str) else str(t.get("content") or t.get("text") or "")
+                        for t in out["turns"] if isinstance(t, str) or t.get("role", "rep") in ("rep", "user", "sales_rep")]
+        out.setdefault("prompt", out["turns"][0] if out["turns"] else "")
+    out.setdefault("prompt", "")
+    out.setdefault("category", "")
+    out.setdefault("criteria", [])
+    return out
+
+def _records(path):
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for n, line in enumerate(f, 1):
+                if line.strip():
+                    yield json.loads(line), f"{path}:{n}"
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("cases") or [data]
+    for n, rec in enumerate(data):
+        yield rec, f"{path}[{n}]"
+
+def dataset_files(spec):
+    # A file, a directory (its *.jsonl/*.json files) or a glob such as "eval/S*.json"
+    if os.path.isdir(spec):
+        return sorted(glob.glob(os.path.join(spec, "*.jsonl")) + glob.glob(os.path.join(spec, "*.json")))
+    if os.path.exists(spec):
+        return [spec]
+    files = sorted(glob.glob(spec))
+    if not files:
+        raise SystemExit(f"--dataset: nothing matches {spec}")
+    return files
+
+def shard_of(eval_id, n):
+    # Stable across machines and Python runs (unlike hash())
+    return int(hashlib.sha1(eval_id.encode("utf-8")).hexdigest()[:8], 16) % n
+
+def parse_shard(s):
+    # "i/N" with 0 <= i < N -> (i, N)
+    try:
+        i, n = (int(x) for x in s.split("/"))
+    except ValueError:
+        raise SystemExit(f"--shard expects i/N, got {s!r}")
+    if n < 1 or not 0 <= i < n:
+        raise SystemExit(f"--shard {s}: need 0 <= i < N")
+    return i, n
+
+def iter_cases(spec, shard=None):
+    # Streams normalized cases in file order; duplicate eval_ids keep the first occurrence
+    seen = set()
+    for path in dataset_files(spec):
+        for rec, where in _records(path):
+            ex = normalize(rec, where)
+            if ex["eval_id"] in seen:
+                continue
+            seen.add(ex["eval_id"])
+            if shard and shard_of(ex["eval_id"], shard[1]) != shard[0]:
+                continue
+            yield ex
@@ -0,0 +1,101 @@
+import os, time
+import http_pool
+
+# LLM call backends for run_eval.py. Both take prompt "parts" -- [(role, static_text, slot)],
+# where slot names an input filled per call -- and return plain [(role, content)] messages,
+# so cache keys are the same whichever engine ran. Heavy SDK imports happen on construction.
+# Both send through the process-wide pooled httpx clients from http_pool.py.
+
+def require_api_key():
+    if not os.environ.get("OPENAI_API_KEY"):
+        raise SystemExit("Missing OPENAI_API_KEY. Create .env from .env.example or export it in your shell.")
+
+def _usage(input_tokens, output_tokens, cached_tokens=None):
+    # cached_tokens: prompt tokens served from the provider's prompt cache (None = not reported)
+    return {"input_tokens": input_tokens or 0, "output_tokens": output_tokens or 0, "cached_tokens": cached_tokens}
+
+def _cached(details):
+    # prompt_tokens_details as an SDK object or a plain dict (LangChain's token_usage)
+    if isinstance(details, dict):
+        return details.get("cached_tokens")
+    return getattr(details, "cached_tokens", None)
+
+JSON_MODE = {"type": "json_object"}
+
+class LangChainEngine:
+    # json_mode: ask for a JSON object reply (response_format); used to re-judge unparseable replies
+    def __init__(self, model, temperature, stream=False, llm=None, json_mode=False):
+        from langchain_core.prompts import ChatPromptTemplate
+        self._template = ChatPromptTemplate
+        if llm is None:
+            require_api_key()
+            from langchain_openai import ChatOpenAI
+            # langchain-openai 0.1.x can't return headers from astream, so streaming runs
+            # go without them and the scheduler relies on 429s alone
+            llm = ChatOpenAI(model=model, temperature=temperature, max_retries=0,
+                             stream_usage=stream, include_response_headers=not stream,
+                             http_client=http_pool.sync_client(), http_async_client=http_pool.async_client(),
+                             request_timeout=http_pool.timeout())
+        self.response_format = JSON_MODE if json_mode else None
+        self.llm = llm.bind(response_format=JSON_MODE) if json_mode else llm
+
+    def compile(self, parts):
+        esc = lambda t: t.replace("{", "{{").replace("}", "}}")
+        prompt = self._template.from_messages([(role, esc(text) if slot is None else "{" + slot + "}") for role, text, slot in parts])
+        roles = {"human": "user", "ai": "assistant"}
+        return lambda inputs: [(roles.get(m.type, m.type), m.content) for m in prompt.format_messages(**inputs)]
+
+    async def acall(self, messages, stream=False):
+        # -> (content, usage, headers, ttft)
+        ttft = None
+        if not stream:
+            msg = await self.llm.ainvoke(messages)
+        else:
+            t0 = time.perf_counter(); msg = None
+            async for chunk in self.llm.astream(messages):
+                if ttft is None and chunk.content: ttft = time.perf_counter() - t0
+                msg = chunk if msg is None else msg + chunk
+        um = getattr(msg, "usage_metadata", None) or {}
+        meta = getattr(msg, "response_metadata", None) or {}
+        # Cached prompt tokens only reach LangChain 0.1.x through the raw token_usage (non-streaming)
+        cached = _cached((meta.get("token_usage") or {}).get("prompt_tokens_details"))
+        usage = _usage(um.get("input_tokens"), um.get("output_tokens"), cached) if um else None
+        return msg.content, usage, meta.get("headers"), ttft
+
+class OpenAIEngine:
+    # Direct openai SDK path: no LangChain import, messages are plain dicts
+    def __init__(self, model, temperature, stream=False, client=None, json_mode=False):
+        if client is None:
+            require_api_key()
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(max_retries=0, http_client=http_pool.async_client())
+        self.client, self.model, self.temperature = client, model, temperature
+        self.response_format = JSON_MODE if json_mode else None
+        self.extra = {"response_format": JSON_MODE} if json_mode else {}
+
+    def compile(self, parts):
+        return lambda inputs: [(role, text if slot is None else inputs[slot]) for role, text, slot in parts]
+
+    async def acall(self, messages, stream=False):
+        msgs = [{"role": r, "content": c} for r, c in messages]
+        if not stream:
+            raw = await self.client.chat.completions.with_raw_response.create(
+                model=self.model, temperature=self.temperature, messages=msgs, **self.extra)
+            resp = raw.parse()
+            u = resp.usage
+            usage = _usage(u.prompt_tokens, u.completion_tokens, _cached(u.prompt_tokens_details)) if u else None
+            return resp.choices[0].message.content or "", usage, dict(raw.headers), None
+        t0 = time.perf_counter(); ttft = None; parts = []; usage = None
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model, temperature=self.temperature, messages=msgs,
+            stream=True, stream_options={"include_usage": True}, **self.extra)
+        async for chunk in raw.parse():
+            if chunk.choices and chunk.choices[0].delta.content:
+                if ttft is None: ttft = time.perf_counter() - t0
+                parts.append(chunk.choices[0].delta.content)
+            if chunk.usage:
+                u = chunk.usage
+                usage = _usage(u.prompt_tokens, u.completion_tokens, _cached(u.prompt_tokens_details))
+        return "".join(parts), usage, dict(raw.headers), ttft
+
+ENGINES = {"langchain": LangChainEngine, "openai": OpenAIEngine}
@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+import os, argparse
+from run_store import FileStore, find_log, open_store
+
+# Write the per-file layout (gen/<id>.gen.json, judged/<id>.judge.json) out of a run that was
+# recorded with --store jsonl / jsonl.gz, for tools that expect one JSON file per case.
+
+def main():
+    ap = argparse.ArgumentParser(description="Export run.jsonl[.gz] to gen/ and judged/ files")
+    ap.add_argument("base", help="run dir containing run.jsonl or run.jsonl.gz")
+    ap.add_argument("--to", help="target run dir (default: the same run dir)")
+    args = ap.parse_args()
+    if not find_log(args.base):
+        raise SystemExit(f"No run.jsonl[.gz] in {args.base}")
+    src, dst = open_store(args.base), FileStore(args.to or args.base)
+    counts = {}
+    for kind in ("gen", "judge"):
+        for rec in src.iter(kind):
+            dst.put(kind, rec)
+            counts[kind] = counts.get(kind, 0) + 1
+    print(f"Exported {counts.get('gen', 0)} gen and {counts.get('judge', 0)} judge records -> {os.path.abspath(dst.base)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import time
+
+# One pooled httpx client per process (a sync and an async one), shared by every OpenAI /
+# LangChain client the harness builds -- HCP, judge, packed judge, judge_batch.py and the batch
+# API backend -- so keep-alive connections (and their TLS sessions) are reused across stages
+# instead of each SDK client opening its own. HTTP/2 is used when the h2 package is installed.
+# Each request carries an httpcore trace hook that counts new TCP connections and TLS
+# handshakes; stats() (recorded as "http" in metrics.json) shows how often a request found a
+# pooled connection.
+
+CONFIG = {"pool": 100, "timeout": 120.0, "connect_timeout": 10.0, "keepalive_s": 60.0, "http2": "auto"}
+_clients = {}
+_stats = {"requests": 0, "connections": 0, "tls_handshakes": 0, "connect_s": 0.0, "http2_responses": 0}
+
+def add_http_args(ap):
+    ap.add_argument("--http_pool", type=int, default=CONFIG["pool"], help="max pooled HTTP connections shared by all stages")
+    ap.add_argument("--http_timeout", type=float, default=CONFIG["timeout"], help="HTTP read/write timeout in seconds")
+    ap.add_argument("--http_connect_timeout", type=float, default=CONFIG["connect_timeout"])
+    ap.add_argument("--http2", choices=("auto", "on", "off"), default="auto", help="auto = HTTP/2 if the h2 package is installed")
+
+def configure(args):
+    # Must run before the first client is built; starts a new stats window
+    CONFIG.update(pool=args.http_pool, timeout=args.http_timeout, connect_timeout=args.http_connect_timeout, http2=args.http2)
+    _stats.update(requests=0, connections=0, tls_handshakes=0, connect_s=0.0, http2_responses=0)
+
+def _http2():
+    if CONFIG["http2"] != "auto":
+        return CONFIG["http2"] == "on"
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def timeout():
+    import httpx
+    return httpx.Timeout(CONFIG["timeout"], connect=CONFIG["connect_timeout"])
+
+def _tracer():
+    # Per-request httpcore trace callback; connect_s = TCP connect + TLS handshake time
+    t0 = [None]
+    def on_event(name):
+        if name in ("connection.connect_tcp.started", "connection.start_tls.started"):
+            t0[0] = time.perf_counter()
+        elif name in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+            _stats["connect_s"] += time.perf_counter() - (t0[0] or time.perf_counter())
+            _stats["connections" if "tcp" in name else "tls_handshakes"] += 1
+    return on_event
+
+def _kwargs():
+    import httpx
+    return {"http2": _http2(), "timeout": timeout(),
+            "limits": httpx.Limits(max_connections=CONFIG["pool"], max_keepalive_connections=CONFIG["pool"],
+                                   keepalive_expiry=CONFIG["keepalive_s"])}
+
+def _count_response(response):
+    if response.http_version == "HTTP/2":
+        _stats["http2_responses"] += 1
+
+def sync_client():
+    if "sync" not in _clients:
+        import httpx
+        def on_request(request):
+            _stats["requests"] += 1
+            on_event = _tracer()
+            request.extensions["trace"] = lambda name, info: on_event(name)
+        _clients["sync"] = httpx.Client(event_hooks={"request": [on_request], "response": [_count_response]}, **_kwargs())
+    return _clients["sync"]
+
+def async_client():
+    if "async" not in _clients:
+        import httpx
+        async def on_request(request):
+            _stats["requests"] += 1
+            on_event = _tracer()
+            async def trace(name, info):
+                on_event(name)
+            request.extensions["trace"] = trace
+        async def on_response(response):
+            _count_response(response)
+        _clients["async"] = httpx.AsyncClient(event_hooks={"request": [on_request], "response": [on_response]}, **_kwargs())
+    return _clients["async"]
+
+async def closing(coro):
+    # Await coro, then close the async client in the same event loop (its pooled connections
+    # belong to that loop); a later asyncio.run() gets a fresh client
+    try:
+        return await coro
+    finally:
+        client = _clients.pop("async", None)
+        if client is not None:
+            await client.aclose()
+
+def stats():
+    s = dict(_stats)
+    s["connect_s"] = round(s["connect_s"], 3)
+    s["reused"] = max(0, s["requests"] - s["connections"])
+    s["reuse_ratio"] = round(s["reused"] / s["requests"], 4) if s["requests"] else None
+    s.update(pool=CONFIG["pool"], http2=_http2())
+    return s
@@ -1,36 +1,287 @@
-import os, glob, json, argparse
+import os, glob, json, argparse, time
 from datetime import datetime, timezone
-from openai import OpenAI
 from dotenv import load_dotenv
 load_dotenv()
+from llm_cache import add_cache_args, cache_from_args, cache_key
+from run_store import write_json_atomic
+from judge_pack import PACK_REQ, pack_block, split_pack, extract_json
+from run_metrics import LLMResult, CallLog, case_metrics, write_metrics
+from scheduler import add_scheduler_args, pool_from_args, estimate_tokens
+import http_pool
+from prompt_compiler import add_prompt_args, prompt_vars, compile_prompt
+from judge_samples import add_sampling_args, score_pass, needs_more, aggregate, sampling_summary, merge_usage
+from batch_api import LocalBatchBackend, OpenAIBatchBackend, TERMINAL, output_content, output_usage, request_line
 
 JUDGE_REQ = """You are the compliance & clinical quality judge.
 Return STRICT JSON with:
 eval_id (string), score (0-100 int), pass (bool), findings (array of strings), rationale (string).
 Do not include any other keys."""
 
-def read(p):
-    with open(p, "r", encoding="utf-8") as f:
-        return f.read()
+# Replies with no parseable JSON object are requeued once in JSON mode (sync: right away;
+# batch: in a follow-up batch); counts end up in metrics.json as "rejudged"
+JSON_MODE = {"type": "json_object"}
+_rejudged = {"parse_failed": 0, "recovered": 0}
 
 def _safe_json(text: str):
+    j = extract_json(text, (dict,))
+    if j is not None:
+        return j
+    return {
+        "eval_id": "UNKNOWN",
+        "score": 0,
+        "pass": False,
+        "findings": ["Judge JSON parse failed"],
+        "rationale": (text or "")[:500],
+        "parse_error": True,
+    }
+
+def load_case(fp, judge_prompt):
+    # judge_prompt: compiled judge template (prompt_compiler.py) -> (eval_id, messages, case block)
+    with open(fp, "r", encoding="utf-8") as f:
+        gen = json.load(f)
+    eval_id = gen.get("eval_id") or os.path.splitext(os.path.basename(fp))[0]
+
+    # Try to enrich with original eval metadata
+    criteria, category = [], ""
     try:
-        return json.loads(text)
+        with open(gen["eval_file"], "r", encoding="utf-8") as f:
+            orig = json.load(f)
+        criteria = orig.get("evaluation_criteria", []) or []
+        category = orig.get("category", "") or ""
     except Exception:
-        import re
-        m = re.search(r"\{[\s\S]*\}", text)
-        if m:
-            try:
-                return json.loads(m.group(0))
-            except Exception:
-                pass
-        return {
-            "eval_id": "UNKNOWN",
-            "score": 0,
-            "pass": False,
-            "findings": ["Judge JSON parse failed"],
-            "rationale": text[:500],
-        }
+        pass
+
+    user_block = {
+        "eval_id": eval_id,
+        "category": category,
+        "rep_input": gen.get("rep_input", ""),
+        "model_output": gen.get("model_output", ""),
+        "evaluation_criteria": criteria,
+    }
+    messages = [
+        {"role": "system", "content": judge_prompt.prefix},
+        {"role": "user", "content": JUDGE_REQ},
+        {"role": "user", "content": judge_prompt.render(user_block)},
+    ]
+    return eval_id, messages, user_block
+
+def message_key(args, messages, sample=0, response_format=None):
+    temp = args.sample_temp if sample else args.temp
+    return cache_key(args.model, temp, [(m["role"], m["content"]) for m in messages], [args.judge_prompt_path], sample, response_format)
+
+def write_judged(output_text, eval_id, args, usage=None, samples=None):
+    # samples: extra judge dicts from resample(); aggregated into the written record
+    judged = _safe_json(output_text) if isinstance(output_text, str) else output_text
+    if not judged.get("eval_id"):
+        judged["eval_id"] = eval_id
+    judged["timestamp"] = datetime.now(timezone.utc).isoformat()
+    judged["model"] = args.model
+    if usage:
+        judged["judge_usage"] = usage
+    if samples is not None:
+        judged = aggregate(judged, [judged] + samples)
+    write_json_atomic(os.path.join(args.outdir, f"{eval_id}.judge.json"), judged)
+    return judged
+
+def resample(client, cache, args, messages, sched, calls, first):
+    # --judge_samples: further single-case samples at --sample_temp while the verdict is ambiguous
+    if args.judge_samples <= 1:
+        return None
+    first = _safe_json(first) if isinstance(first, str) else first
+    samples = []
+    while needs_more([score_pass(s) for s in [first] + samples], args):
+        text, usage = judge_one(client, cache, args, messages, sched, calls, sample=len(samples) + 1)
+        s = _safe_json(text)
+        s["judge_usage"] = usage
+        samples.append(s)
+    return samples
+
+def judge_one(client, cache, args, messages, sched, calls, sample=0):
+    # Single-case call -> (reply text, judge_usage); an unparseable reply is requeued in JSON mode
+    res = call_judge(client, cache, args, messages, sched, sample)
+    usage = calls.add("judge", args.model, res)
+    if not _safe_json(res.content).get("parse_error"):
+        return res.content, usage
+    _rejudged["parse_failed"] += 1
+    res = call_judge(client, cache, args, messages, sched, sample, json_mode=True)
+    if not _safe_json(res.content).get("parse_error"):
+        _rejudged["recovered"] += 1
+    usage = merge_usage([usage, calls.add("judge", args.model, res)])
+    usage.pop("samples", None)
+    return res.content, usage
+
+def call_judge(client, cache, args, messages, sched, sample=0, json_mode=False):
+    key = message_key(args, messages, sample, JSON_MODE if json_mode else None)
+    temp = args.sample_temp if sample else args.temp
+    t0 = time.perf_counter()
+    hit = cache.get(key) if cache.covers(temp) else None
+    if hit is not None:
+        return LLMResult(hit["content"], hit.get("usage"), True, time.perf_counter() - t0, None, 0)
+
+    def call():
+        extra = {"text": {"format": JSON_MODE}} if json_mode else {}
+        raw = client.responses.with_raw_response.create(model=args.model, temperature=temp, input=messages, **extra)
+        resp = raw.parse()
+        u = getattr(resp, "usage", None)
+        cached = getattr(getattr(u, "input_tokens_details", None), "cached_tokens", None) if u else None
+        usage = {"input_tokens": u.input_tokens, "output_tokens": u.output_tokens, "cached_tokens": cached} if u else None
+        return (resp.output_text, usage), raw.headers, (u.input_tokens + u.output_tokens) if u else None
+
+    (text, usage), retries = sched.run_sync(call, estimate_tokens([m["content"] for m in messages]))
+    if cache.covers(temp):
+        cache.put(key, args.model, {"content": text, "usage": usage})
+    return LLMResult(text, usage, False, time.perf_counter() - t0, None, retries)
+
+def judge_sync(files, judge_prompt, args, cache, calls, schedulers):
+    from openai import OpenAI
+    client = OpenAI(max_retries=0, http_client=http_pool.sync_client())
+    sched = schedulers.get(args.model)
+    k, fallbacks = max(1, args.judge_pack), 0
+    for start in range(0, len(files), k):
+        group = [load_case(fp, judge_prompt) for fp in files[start:start + k]]
+        print(f"Judging {start + 1}-{start + len(group)}/{len(files)}", flush=True)
+        got, usage = {}, None
+        if len(group) > 1:
+            packed = [
+                {"role": "system", "content": judge_prompt.prefix},
+                {"role": "user", "content": PACK_REQ},
+                {"role": "user", "content": pack_block([block for _, _, block in group])},
+            ]
+            res = call_judge(client, cache, args, packed, sched)
+            got, usage = split_pack(res.content, [eval_id for eval_id, _, _ in group]), calls.add("judge", args.model, res, len(group))
+        for eval_id, messages, _ in group:
+            if eval_id in got:
+                write_judged(got[eval_id], eval_id, args, usage, resample(client, cache, args, messages, sched, calls, got[eval_id]))
+                continue
+            if len(group) > 1:
+                fallbacks += 1
+            text, usage = judge_one(client, cache, args, messages, sched, calls)
+            write_judged(text, eval_id, args, usage, resample(client, cache, args, messages, sched, calls, text))
+    if k > 1:
+        print(f"Packed {k} cases per call; {fallbacks} re-judged singly", flush=True)
+    return len(files)
+
+def _save_state(path, state):
+    write_json_atomic(path, state)
+
+def requeue_chunk(state, chunk, eval_ids, args):
+    # Follow-up batch re-sending the given requests of chunk with response_format json_object
+    wanted, lines = set(eval_ids), []
+    with open(chunk["file"], "r", encoding="utf-8") as f:
+        for raw in f:
+            if raw.strip() and (req := json.loads(raw))["custom_id"] in wanted:
+                req["body"]["response_format"] = JSON_MODE
+                lines.append(req)
+    path = chunk["file"].replace(".jsonl", "_json.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for req in lines:
+            f.write(json.dumps(req, ensure_ascii=False) + "\n")
+    _rejudged["parse_failed"] += len(lines)
+    state["chunks"].append({"file": path, "batch_id": None, "status": "new", "collected": False, "json_mode": True,
+                            "keys": {r["custom_id"]: message_key(args, r["body"]["messages"], response_format=JSON_MODE) for r in lines}})
+
+def judge_batch(files, judge_prompt, args, cache, calls):
+    # Build chunked JSONL request files, submit them, poll until terminal, then fan results
+    # out to <eval_id>.judge.json. Progress lives in <outdir>/batch_state.json so an
+    # interrupted run picks up polling where it left off instead of resubmitting.
+    if args.batch_backend == "local":
+        backend = LocalBatchBackend(os.path.join(args.outdir, "_local_batches"), delay=args.poll_interval)
+    else:
+        from openai import OpenAI
+        backend = OpenAIBatchBackend(OpenAI(http_client=http_pool.sync_client()))
+    state_path = os.path.join(args.outdir, "batch_state.json")
+    state, written = None, 0
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if all(c["collected"] for c in state["chunks"]):
+            state = None
+        else:
+            print(f"Resuming batch state {state_path}", flush=True)
+
+    if state is None:
+        state = {"model": args.model, "temperature": args.temp, "backend": args.batch_backend, "chunks": []}
+        pending = []
+        for fp in files:
+            eval_id, messages, _ = load_case(fp, judge_prompt)
+            key, fmt = message_key(args, messages), None
+            hit = cache.get(key) if cache.covers(args.temp) else None
+            if hit is not None and _safe_json(hit["content"]).get("parse_error"):
+                # A cached unparseable reply: use (or request) the JSON-mode answer instead
+                key, fmt = message_key(args, messages, response_format=JSON_MODE), JSON_MODE
+                hit = cache.get(key)
+            if hit is not None:
+                write_judged(hit["content"], eval_id, args); written += 1
+            else:
+                pending.append((eval_id, key, messages, fmt))
+        print(f"{written} cached, {len(pending)} to submit in chunks of {args.batch_size}", flush=True)
+        req_dir = os.path.join(args.outdir, "_batch_requests")
+        os.makedirs(req_dir, exist_ok=True)
+        for n, start in enumerate(range(0, len(pending), args.batch_size)):
+            chunk = pending[start:start + args.batch_size]
+            path = os.path.join(req_dir, f"chunk_{n:04d}.jsonl")
+            with open(path, "w", encoding="utf-8") as f:
+                for eval_id, _, messages, fmt in chunk:
+                    f.write(json.dumps(request_line(eval_id, args.model, args.temp, messages, fmt), ensure_ascii=False) + "\n")
+            state["chunks"].append({"file": path, "batch_id": None, "status": "new", "collected": False,
+                                    "keys": {eval_id: key for eval_id, key, _, _ in chunk}})
+        _save_state(state_path, state)
+
+    def submit_new():
+        for c in state["chunks"]:
+            if c["batch_id"] is None:
+                c["batch_id"] = backend.submit(c["file"]); c["status"] = "submitted"
+                print(f"Submitted {c['file']} -> {c['batch_id']}", flush=True)
+                _save_state(state_path, state)
+    submit_new()
+    if args.submit_only:
+        print(f"Submitted; re-run with the same --outdir to poll and collect ({state_path})")
+        return written
+
+    while not all(c["collected"] for c in state["chunks"]):
+        submit_new()
+        for c in state["chunks"]:
+            if c["collected"] or c["batch_id"] is None:  # requeued chunks go out on the next pass
+                continue
+            st = backend.status(c["batch_id"])
+            c["status"] = st["status"]
+            if st["status"] not in TERMINAL:
+                continue
+            requeue = []
+            if st.get("output_file_id"):
+                for raw in backend.fetch(st["output_file_id"]).splitlines():
+                    if not raw.strip():
+                        continue
+                    line = json.loads(raw)
+                    eval_id = line["custom_id"]
+                    content = output_content(line)
+                    if content is None:
+                        print(f"  {eval_id}: request failed in batch {c['batch_id']}", flush=True)
+                        continue
+                    # Batch calls have no per-request latency; usage still feeds tokens/cost
+                    res = LLMResult(content, output_usage(line), False, 0.0, None, 0)
+                    if cache.covers(args.temp):
+                        cache.put(c["keys"].get(eval_id), args.model, {"content": content, "usage": res.usage})
+                    usage = calls.add("judge", args.model, res)
+                    if _safe_json(content).get("parse_error") and not c.get("json_mode"):
+                        requeue.append(eval_id)
+                        continue
+                    if c.get("json_mode") and not _safe_json(content).get("parse_error"):
+                        _rejudged["recovered"] += 1
+                    write_judged(content, eval_id, args, usage); written += 1
+            if requeue:
+                requeue_chunk(state, c, requeue, args)
+                print(f"  {len(requeue)} unparseable replies requeued in JSON mode", flush=True)
+            if st["status"] != "completed":
+                print(f"Batch {c['batch_id']} ended {st['status']}; unfinished cases need a re-run", flush=True)
+            c["collected"] = True
+            _save_state(state_path, state)
+        open_chunks = [c for c in state["chunks"] if not c["collected"]]
+        if open_chunks:
+            print(f"Waiting on {len(open_chunks)} batch(es): " + ", ".join(f"{c['batch_id'] or 'requeued'}={c['status']}" for c in open_chunks), flush=True)
+            _save_state(state_path, state)
+            time.sleep(args.poll_interval)
+    return written
 
 def main():
     ap = argparse.ArgumentParser()
@@ -39,61 +290,62 @@ def main():
     ap.add_argument("--outdir", default="results/phase5_full/judged")
     ap.add_argument("--model", default="gpt-4.1")
     ap.add_argument("--temp", type=float, default=0.0)
+    ap.add_argument("--mode", choices=("sync", "batch"), default="sync", help="batch = provider batch endpoint")
+    ap.add_argument("--batch_backend", choices=("openai", "local"), default="openai", help="local = offline file-based stand-in")
+    ap.add_argument("--batch_size", type=int, default=1000, help="requests per batch input file")
+    ap.add_argument("--poll_interval", type=float, default=30.0)
+    ap.add_argument("--judge_pack", type=int, default=1, help="sync mode: judge K cases per call")
+    ap.add_argument("--submit_only", action="store_true", help="submit batches and exit; re-run to collect")
+    add_sampling_args(ap)
+    add_prompt_args(ap)
+    add_cache_args(ap)
+    add_scheduler_args(ap)
+    http_pool.add_http_args(ap)
     args = ap.parse_args()
+    http_pool.configure(args)
 
     os.makedirs(args.outdir, exist_ok=True)
-    judge_prompt = read(args.judge_prompt_path)
-    client = OpenAI()
+    judge_prompt = compile_prompt(args.judge_prompt_path, prompt_vars(args))
+    cache = cache_from_args(args)
 
     files = sorted(glob.glob(args.inputs_glob))
     if not files:
         raise SystemExit(f"No generated outputs found at {args.inputs_glob}")
 
-    for i, fp in enumerate(files, 1):
-        print(f"Judging {i}/{len(files)}: {fp}", flush=True)
-
-        with open(fp, "r", encoding="utf-8") as f:
-            gen = json.load(f)
-        eval_id = gen.get("eval_id") or os.path.splitext(os.path.basename(fp))[0]
-
-        # Try to enrich with original eval metadata
-        criteria, category = [], ""
-        try:
-            with open(gen["eval_file"], "r", encoding="utf-8") as f:
-                orig = json.load(f)
-            criteria = orig.get("evaluation_criteria", []) or []
-            category = orig.get("category", "") or ""
-        except Exception:
-            pass
-
-        user_block = {
-            "eval_id": eval_id,
-            "category": category,
-            "rep_input": gen.get("rep_input", ""),
-            "model_output": gen.get("model_output", ""),
-            "evaluation_criteria": criteria,
-        }
-
-        resp = client.responses.create(
-            model=args.model,
-            temperature=args.temp,
-            input=[
-                {"role": "system", "content": judge_prompt},
-                {"role": "user", "content": JUDGE_REQ},
-                {"role": "user", "content": json.dumps(user_block, ensure_ascii=False)},
-            ],
-        )
-        judged = _safe_json(resp.output_text)
-        if not judged.get("eval_id"):
-            judged["eval_id"] = eval_id
-        judged["timestamp"] = datetime.now(timezone.utc).isoformat()
-        judged["model"] = args.model
-
-        outp = os.path.join(args.outdir, f"{eval_id}.judge.json")
-        with open(outp, "w", encoding="utf-8") as f:
-            json.dump(judged, f, ensure_ascii=False, indent=2)
-
-    print(f"✔ Judged {len(files)} items -> {args.outdir}")
+    if args.mode == "batch" and (args.judge_pack > 1 or args.judge_samples > 1):
+        raise SystemExit("--judge_pack and --judge_samples apply to --mode sync only")
+    calls = CallLog()
+    schedulers = pool_from_args(args)
+    t0 = time.perf_counter()
+    try:
+        if args.mode == "batch":
+            n = judge_batch(files, judge_prompt, args, cache, calls)
+        else:
+            n = judge_sync(files, judge_prompt, args, cache, calls, schedulers)
+    finally:
+        cache.close()
+    if calls.calls:
+        cases, records = [], []
+        for p in sorted(glob.glob(os.path.join(args.outdir, "*.judge.json"))):
+            with open(p, "r", encoding="utf-8") as f:
+                records.append(json.load(f))
+            cases.append(case_metrics(None, records[-1]))
+        extra = {"judge_samples": sampling_summary(records, args.judge_samples)} if args.judge_samples > 1 else {}
+        if _rejudged["parse_failed"]:
+            extra["rejudged"] = dict(_rejudged)
+            print(f"Judge JSON: {_rejudged['parse_failed']} unparseable replies re-judged in JSON mode, {_rejudged['recovered']} recovered", flush=True)
+        m = write_metrics(os.path.join(args.outdir, "metrics.json"), calls, cases,
+                          created=datetime.now(timezone.utc).isoformat(), wall_s=round(time.perf_counter() - t0, 3),
+                          mode=args.mode, judge_model=args.model, temperature=args.temp, n_cases=n, cache=cache.stats(),
+                          judge_prompt=dict(judge_prompt.info(), path=args.judge_prompt_path),
+                          scheduler=schedulers.summary(), http=http_pool.stats(), **extra)
+        t = m["totals"]
+        if t["cached_token_ratio"] is not None:
+            print(f"Prompt cache: {100 * t['cached_token_ratio']:.0f}% of {t['input_tokens']} input tokens cached", flush=True)
+        if "judge_samples" in extra:
+            js = extra["judge_samples"]
+            print(f"Judge samples/case: {js['mean']:.2f} (max {args.judge_samples}; {js['resampled']} cases resampled)", flush=True)
+    print(f"✔ Judged {n} items -> {args.outdir} (cache: {cache.stats()})")
 
 if __name__ == "__main__":
     main()
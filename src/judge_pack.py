@@ -0,0 +1,76 @@
+import json
+
+PACK_REQ = """You are the compliance & clinical quality judge.
+You will receive a JSON array of cases. Judge each case independently.
+Return a STRICT JSON array with exactly one object per case, in the same order, each with:
+eval_id (string), score (0-100 int), pass (bool), findings (array of strings), rationale (string).
+No extra text."""
+
+def extract_json(text, want=(dict, list), ok=lambda v: True):
+    # First JSON value of a wanted type in a judge reply: the whole text if it parses, else one
+    # left-to-right scan tracking bracket depth and string/escape state that tries each balanced
+    # {...} / [...] span as it closes. Prose, code fences and a second object after the first
+    # don't break it (a greedy \{[\s\S]*\} does), and brackets inside strings don't count.
+    # ok(value) can reject a candidate, e.g. a "[1]" citation when an array of objects is wanted.
+    try:
+        v = json.loads(text)
+        if isinstance(v, want) and ok(v):
+            return v
+    except (TypeError, ValueError):
+        pass
+    if not isinstance(text, str):
+        return None
+    stack, start, in_str, esc = [], 0, False, False
+    for i, ch in enumerate(text):
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch in "{[":
+            if not stack:
+                start = i
+            stack.append(ch)
+        elif ch in "}]":
+            if not stack or stack[-1] != ("{" if ch == "}" else "["):
+                stack = []  # stray closer: not inside a JSON value
+                continue
+            stack.pop()
+            if not stack:
+                try:
+                    v = json.loads(text[start:i + 1])
+                    if isinstance(v, want) and ok(v):
+                        return v
+                except ValueError:
+                    pass
+        elif ch == '"' and stack:
+            in_str = True
+    return None
+
+def pack_block(blocks):
+    # blocks: the per-case dicts normally sent one at a time as the judge's case block
+    return json.dumps(blocks, ensure_ascii=False)
+
+def _valid(j):
+    return isinstance(j, dict) and isinstance(j.get("eval_id"), str) and (
+        "score" in j or "pass" in j or isinstance(j.get("overall"), dict) or isinstance(j.get("scores"), dict))
+
+def split_pack(text, eval_ids):
+    # Packed judge reply -> {eval_id: judge dict} for the well-formed elements only;
+    # anything missing, duplicated or malformed is left out so the caller re-judges it alone.
+    arr = extract_json(text, ok=lambda v: isinstance(v, dict) or any(isinstance(j, dict) for j in v))
+    if isinstance(arr, dict):
+        arr = arr.get("results") or arr.get("cases") or [arr]
+    if not isinstance(arr, list):
+        return {}
+    wanted, out, seen = set(eval_ids), {}, set()
+    for j in arr:
+        if not _valid(j) or j["eval_id"] not in wanted:
+            continue
+        if j["eval_id"] in seen:
+            out.pop(j["eval_id"], None)
+            continue
+        seen.add(j["eval_id"]); out[j["eval_id"]] = j
+    return out
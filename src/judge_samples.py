@@ -0,0 +1,84 @@
+import math, statistics
+from statistics import NormalDist
+
+# Sequential judge sampling (--judge_samples N): a case gets a second, third, ... judge sample
+# (at --sample_temp, so samples can differ) only while its verdict is ambiguous -- the score is
+# within --sample_margin of the pass mark or the samples disagree -- and stops as soon as
+# --sample_agree of the samples agree and the mean score is clear of the pass mark at
+# --sample_confidence, or after N samples. Clear-cut cases cost one call, as before.
+
+PASS_SCORE = 80
+
+def add_sampling_args(ap):
+    ap.add_argument("--judge_samples", type=int, default=1, help="max judge samples per case; extra ones only while the verdict is ambiguous")
+    ap.add_argument("--sample_temp", type=float, default=0.7, help="judge temperature for samples after the first")
+    ap.add_argument("--sample_margin", type=float, default=10, help=f"scores within this many points of {PASS_SCORE} are ambiguous")
+    ap.add_argument("--sample_agree", type=float, default=0.8, help="share of samples that must agree on pass/fail to stop")
+    ap.add_argument("--sample_confidence", type=float, default=0.95, help="confidence that the mean score is on one side of the pass mark")
+
+def score_pass(j):
+    # Works on raw judge dicts (judge_batch.py) as well as normalized ones
+    try:
+        score = int(j.get("score") or 0)
+    except (TypeError, ValueError):
+        score = 0
+    return score, bool(j["pass"]) if j.get("pass") is not None else score >= PASS_SCORE
+
+def needs_more(samples, args):
+    # samples: [(score, pass)] so far
+    k = len(samples)
+    if k >= args.judge_samples:
+        return False
+    scores = [s for s, _ in samples]
+    votes = sum(1 for _, p in samples if p)
+    mean = sum(scores) / k
+    if k == 1:
+        score, passed = samples[0]
+        return abs(score - PASS_SCORE) < args.sample_margin or passed != (score >= PASS_SCORE)
+    if max(votes, k - votes) / k < args.sample_agree:
+        return True
+    if abs(mean - PASS_SCORE) >= args.sample_margin:
+        return False
+    z = NormalDist().inv_cdf(0.5 + args.sample_confidence / 2)
+    return abs(mean - PASS_SCORE) <= z * statistics.stdev(scores) / math.sqrt(k)
+
+def merge_usage(usages):
+    # Per-case judge_usage summed over samples (tokens, cost, latency); pack/ttft from the first
+    usages = [u for u in usages if u]
+    if not usages:
+        return None
+    out = dict(usages[0])
+    for k in ("input_tokens", "output_tokens", "cached_tokens", "latency_s"):
+        out[k] = round(sum(u.get(k) or 0 for u in usages), 4)
+    costs = [u["cost_usd"] for u in usages if u.get("cost_usd") is not None]
+    out["cost_usd"] = round(sum(costs), 6) if costs else None
+    out["retries"] = sum(u.get("retries") or 0 for u in usages)
+    out["cached"] = all(u.get("cached") for u in usages)
+    out["samples"] = len(usages)
+    return out
+
+def aggregate(j, samples):
+    # j: the first sample's judge dict; samples: judge dicts incl. j, in order.
+    # score = mean, pass = majority vote (a tie goes by the mean score); findings and rationale
+    # come from the sample closest to the aggregate. All samples are kept under "samples".
+    sp = [score_pass(s) for s in samples]
+    k = len(sp)
+    mean = sum(s for s, _ in sp) / k
+    votes = sum(1 for _, p in sp if p)
+    passed = votes * 2 > k or (votes * 2 == k and mean >= PASS_SCORE)
+    best = min(range(k), key=lambda i: (sp[i][1] != passed, abs(sp[i][0] - mean)))
+    out = dict(j)
+    out.update({"score": int(round(mean)), "pass": passed,
+                "findings": samples[best].get("findings") or [], "rationale": samples[best].get("rationale", ""),
+                "n_samples": k, "samples": [{"score": s, "pass": p, "findings": x.get("findings") or [],
+                                             "rationale": x.get("rationale", "")}
+                                            for (s, p), x in zip(sp, samples)]})
+    usage = merge_usage([x.get("judge_usage") for x in samples])
+    if usage:
+        out["judge_usage"] = usage
+    return out
+
+def sampling_summary(judged, max_samples):
+    n = [j.get("n_samples", 1) for j in judged]
+    return {"max": max_samples, "mean": round(sum(n) / len(n), 3) if n else None,
+            "resampled": sum(1 for x in n if x > 1), "calls": sum(n)}
@@ -0,0 +1,130 @@
+import os, json, time, sqlite3, hashlib, threading
+
+MODES = ("off", "read", "write", "readwrite")
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cache_key(model, temperature, messages, prompt_files=(), sample=0, response_format=None):
+    # messages: list of (role, content) pairs exactly as sent to the provider;
+    # sample: index of a repeated draw of the same request (--judge_samples), 0 = the usual key;
+    # response_format: set for JSON-mode calls, which must not share the plain call's entry
+    payload = {
+        "model": model,
+        "temperature": None if temperature is None else float(temperature),
+        "messages": [[r, c] for r, c in messages],
+        "prompt_files": sorted(file_hash(p) for p in prompt_files if p),
+    }
+    if sample:
+        payload["sample"] = sample
+    if response_format:
+        payload["response_format"] = response_format
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+# SQLite response cache; one row per cache_key(), evicted by age then LRU size
+class LLMCache:
+    def __init__(self, cache_dir="results/.cache", mode="readwrite", max_mb=512, max_age_days=30, sampled=False):
+        if mode not in MODES:
+            raise ValueError(f"cache mode must be one of {MODES}, got {mode!r}")
+        self.mode, self.sampled = mode, sampled
+        self.max_bytes = int(max_mb * 1024 * 1024) if max_mb else 0
+        self.max_age = max_age_days * 86400 if max_age_days else 0
+        self.hits = self.misses = self.writes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if mode == "off":
+            return
+        os.makedirs(cache_dir, exist_ok=True)
+        self._db = sqlite3.connect(os.path.join(cache_dir, "llm.sqlite"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, value TEXT NOT NULL,"
+            " size INTEGER NOT NULL, created REAL NOT NULL, used REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    @property
+    def readable(self): return self.mode in ("read", "readwrite")
+
+    @property
+    def writable(self): return self.mode in ("write", "readwrite")
+
+    def covers(self, temperature):
+        # Only deterministic (temperature 0) calls by default: replaying a sampled generation
+        # would hide run-to-run variance. --cache_sampled opts in.
+        return self.sampled or not temperature
+
+    def get(self, key):
+        if not self.readable:
+            return None
+        with self._lock:
+            row = self._db.execute("SELECT value, created FROM responses WHERE key=?", (key,)).fetchone()
+            now = time.time()
+            if row and self.max_age and now - row[1] > self.max_age:
+                self._db.execute("DELETE FROM responses WHERE key=?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET used=? WHERE key=?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, model, value):
+        if not self.writable:
+            return
+        blob = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses(key, model, value, size, created, used) VALUES (?,?,?,?,?,?)",
+                (key, model, blob, len(blob.encode("utf-8")), now, now),
+            )
+            self._db.commit()
+            self.writes += 1
+
+    def evict(self):
+        # Age first, then least-recently-used rows until under the size cap
+        if self._db is None or not self.writable:
+            return 0
+        removed = 0
+        with self._lock:
+            if self.max_age:
+                removed += self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.max_age,)).rowcount
+            if self.max_bytes:
+                total = self._db.execute("SELECT COALESCE(SUM(size),0) FROM responses").fetchone()[0]
+                if total > self.max_bytes:
+                    for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY used ASC").fetchall():
+                        if total <= self.max_bytes:
+                            break
+                        self._db.execute("DELETE FROM responses WHERE key=?", (key,))
+                        total -= size; removed += 1
+            self._db.commit()
+        return removed
+
+    def stats(self):
+        n = self.hits + self.misses
+        return {"mode": self.mode, "sampled": self.sampled, "hits": self.hits, "misses": self.misses, "writes": self.writes,
+                "hit_rate": round(self.hits / n, 3) if n else 0.0}
+
+    def close(self):
+        if self._db is not None:
+            self.evict()
+            self._db.close()
+            self._db = None
+
+def add_cache_args(ap):
+    ap.add_argument("--cache", choices=MODES, default="readwrite", help="LLM response cache under --cache_dir")
+    ap.add_argument("--cache_dir", default="results/.cache")
+    ap.add_argument("--cache_max_mb", type=float, default=512)
+    ap.add_argument("--cache_max_age_days", type=float, default=30)
+    ap.add_argument("--cache_sampled", action="store_true",
+                    help="also cache calls at temperature > 0 (HCP generations, judge sample draws); re-runs then replay old samples")
+
+def cache_from_args(args):
+    return LLMCache(args.cache_dir, args.cache, args.cache_max_mb, args.cache_max_age_days, args.cache_sampled)
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 from pathlib import Path
-import argparse, json, html, glob, os
+import argparse, html, os
+from run_store import open_store
 
 PAGE = """<!doctype html>
 <meta charset="utf-8">
@@ -21,6 +22,7 @@ PAGE = """<!doctype html>
   .rep .bubble {{ background:#eef6ff; }}
   .hcp .bubble {{ background:#fff; }}
   .meta {{ color:#64748b; font-size:12px; margin-bottom:6px; }}
+  .note {{ text-align:center; color:#94a3b8; font-size:12px; margin:8px 0; }}
   .ibox {{ margin-top:24px; border-top:1px dashed #e5e7eb; padding-top:14px; display:flex; gap:10px; }}
   .ibox input {{ flex:1; padding:10px 12px; border:1px solid #e5e7eb; border-radius:10px; }}
   .ibox button {{ padding:10px 14px; border:0; border-radius:10px; background:#111827; color:white; }}
@@ -35,13 +37,7 @@ PAGE = """<!doctype html>
   {findings_html}
 
   <div class="chat">
-    <div class="row rep"><div class="bubble">
-      <div class="meta">Sales Representative</div>{user_html}
-    </div></div>
-
-    <div class="row hcp"><div class="bubble">
-      <div class="meta">Dr Tawel</div>{asst_html}
-    </div></div>
+{chat_html}
   </div>
 
   <div class="ibox">
@@ -136,105 +132,150 @@ def extract_asst_text(j):
         if s: return s
     return _pick_best(list(_walk_strings(j)), min_len=24)
 
-def load_json(p: Path):
-    try:
-        return json.loads(p.read_text(encoding="utf-8"))
-    except Exception:
-        return {}
+def judge_score(jj):
+    score = jj.get("score")
+    if score is None and isinstance(jj.get("overall"), dict):
+        sc = jj["overall"].get("weighted_score") or jj["overall"].get("score")
+        if isinstance(sc, float):
+            score = round(sc*100) if sc <= 1.0 else int(sc)
+        elif isinstance(sc, int):
+            score = sc
+    return score
+
+BUBBLE = """    <div class="row {cls}"><div class="bubble">
+      <div class="meta">{meta}</div>{text}
+    </div></div>"""
+
+def _bubble(cls, meta, text):
+    # meta is HTML; text is escaped
+    return BUBBLE.format(cls=cls, meta=meta, text=html.escape(text).replace("\n", "<br>"))
+
+def transcript_html(turns, turn_judges=None):
+    # Multi-turn gen records: every rep/HCP exchange in order; per-turn verdicts when judged per turn
+    verdicts = {t.get("turn"): t for t in turn_judges or [] if isinstance(t, dict)}
+    out = []
+    for i, t in enumerate(turns, 1):
+        if t.get("compacted"):
+            out.append('    <div class="note">Earlier turns compacted out of the HCP\'s context here</div>')
+        out.append(_bubble("rep", f"Sales Representative · turn {i}", t.get("rep") or ""))
+        v = verdicts.get(i)
+        tag = "" if v is None else f' · <span class="badge {"pass" if v.get("pass") else "fail"}">{"PASS" if v.get("pass") else "FAIL"}</span> {v.get("score")}'
+        out.append(_bubble("hcp", f"Dr Tawel · turn {i}{tag}", t.get("hcp") or ""))
+    return "\n".join(out)
+
+def render_page(eid, j, jj):
+    if isinstance(j.get("turns"), list) and j["turns"]:
+        chat_html = transcript_html(j["turns"], jj.get("turns"))
+    else:
+        user = extract_user_text(j) or "(no rep message captured)"
+        asst = extract_asst_text(j) or "(no assistant message captured)"
+        chat_html = _bubble("rep", "Sales Representative", user) + "\n\n" + _bubble("hcp", "Dr Tawel", asst)
+
+    ps = jj.get("pass")
+    score = judge_score(jj)
+    if ps is not None:
+        cls = "pass" if ps else "fail"
+        txt = "PASS" if ps else "FAIL"
+        badge_html = f'<span class="badge {cls}">{txt}</span>'
+    else:
+        badge_html = ""
+
+    score_html = f'<span class="score">Score: {score}</span>' if score is not None else ""
+
+    findings_html = ""
+    f = jj.get("findings") or jj.get("evidence")
+    if isinstance(f, list) and f:
+        bullets = []
+        for item in f[:4]:
+            q = (item.get("quote") if isinstance(item, dict) else str(item)) or ""
+            q = html.escape(q).strip()
+            if q:
+                bullets.append(f"<li>{q}</li>")
+        if bullets:
+            findings_html = f'<div class="topfindings"><b>Top Findings</b><ul>' + "\n".join(bullets) + "</ul></div>"
+
+    return PAGE.format(
+        eid=eid,
+        chat_html=chat_html,
+        badge_html=badge_html,
+        score_html=score_html,
+        findings_html=findings_html,
+    )
+
+def index_row(eid, jj):
+    ps = jj.get("pass")
+    score = judge_score(jj)
+    if ps is not None:
+        cls = "pass" if ps else "fail"
+        badge = f'<span class="badge {cls}">{"PASS" if ps else "FAIL"}</span>'
+    else:
+        badge = ""
+    sc = f'<span class="score">{score}</span>' if score is not None else ""
+    return f'<tr><td>{eid}</td><td>{badge} {sc}</td><td><a href="{eid}.html">Open chat</a></td></tr>'
+
+def _write_pages(out_dir, items):
+    for eid, j, jj in items:
+        (out_dir / f"{eid}.html").write_text(render_page(eid, j, jj), encoding="utf-8")
+    return len(items)
+
+# Below this many pages a process pool costs more to start than it saves
+POOL_MIN = 2000
+
+def _batches(items, size):
+    batch = []
+    for it in items:
+        batch.append(it)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def write_chat_pages(out_dir, store, ids, workers=None, only=None, write_index=True):
+    # ids: eval_ids with a gen record, in index order. One page per id (only those in `only`, when
+    # given), plus the chat index. Records stream from the run store a case at a time; large
+    # batches render across a process pool with a few batches in flight. Returns pages written.
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    todo = [eid for eid in ids if only is None or eid in only]
+    items = ((eid, j, jj or {}) for eid, j, jj in zip(todo, store.get_many("gen", todo), store.get_many("judge", todo)) if j)
+    workers = workers if workers is not None else (os.cpu_count() or 1)
+    if workers > 1 and len(todo) >= POOL_MIN:
+        from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+        step = -(-len(todo) // (workers * 4))
+        with ProcessPoolExecutor(workers) as pool:
+            pending = set()
+            for batch in _batches(items, step):
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for fut in done: fut.result()
+                pending.add(pool.submit(_write_pages, out_dir, batch))
+            for fut in pending: fut.result()
+    else:
+        for batch in _batches(items, 500):
+            _write_pages(out_dir, batch)
+    if write_index:
+        head, tail = INDEX.format(rows="\0").split("\0")
+        with open(out_dir / "index.html", "w", encoding="utf-8") as f:
+            f.write(head)
+            for eid, jj in zip(ids, store.get_many("judge", ids)):
+                f.write(index_row(eid, jj or {}) + "\n")
+            f.write(tail)
+    return len(todo)
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--base", required=True)
+    ap.add_argument("--workers", type=int, help=f"processes for page rendering (used from {POOL_MIN} pages; default: CPU count)")
     args = ap.parse_args()
 
     base = Path(args.base).resolve()
-    gen_dir = base / "gen"
-    judged_dir = base / "judged"
     out_dir = base / "report" / "chat"
-    out_dir.mkdir(parents=True, exist_ok=True)
-
-    gens = {}
-    for p in sorted(gen_dir.glob("*.gen.json")):
-        j = load_json(p)
-        eid = j.get("eval_id") or p.stem
-        gens[eid] = j
-
-    judged = {}
-    for p in sorted(judged_dir.glob("*.judge.json")):
-        j = load_json(p)
-        eid = j.get("eval_id") or p.stem.replace(".judge","")
-        judged[eid] = j
 
-    for eid, j in gens.items():
-        user = extract_user_text(j) or "(no rep message captured)"
-        asst = extract_asst_text(j) or "(no assistant message captured)"
-        user_html = html.escape(user).replace("\n", "<br>")
-        asst_html = html.escape(asst).replace("\n", "<br>")
-
-        jj = judged.get(eid, {})
-        ps = jj.get("pass")
-        score = jj.get("score")
-        if score is None and isinstance(jj.get("overall"), dict):
-            sc = jj["overall"].get("weighted_score") or jj["overall"].get("score")
-            if isinstance(sc, float):
-                score = round(sc*100) if sc <= 1.0 else int(sc)
-            elif isinstance(sc, int):
-                score = sc
-
-        if ps is not None:
-            cls = "pass" if ps else "fail"
-            txt = "PASS" if ps else "FAIL"
-            badge_html = f'<span class="badge {cls}">{txt}</span>'
-        else:
-            badge_html = ""
-
-        score_html = f'<span class="score">Score: {score}</span>' if score is not None else ""
-
-        findings_html = ""
-        f = jj.get("findings") or jj.get("evidence")
-        if isinstance(f, list) and f:
-            bullets = []
-            for item in f[:4]:
-                q = (item.get("quote") if isinstance(item, dict) else str(item)) or ""
-                q = html.escape(q).strip()
-                if q:
-                    bullets.append(f"<li>{q}</li>")
-            if bullets:
-                findings_html = f'<div class="topfindings"><b>Top Findings</b><ul>' + "\n".join(bullets) + "</ul></div>"
-
-        (out_dir / f"{eid}.html").write_text(
-            PAGE.format(
-                eid=eid,
-                user_html=user_html,
-                asst_html=asst_html,
-                badge_html=badge_html,
-                score_html=score_html,
-                findings_html=findings_html,
-            ),
-            encoding="utf-8",
-        )
-
-    rows = []
-    for eid in sorted(gens):
-        jj = judged.get(eid, {})
-        ps = jj.get("pass")
-        score = jj.get("score")
-        if score is None and isinstance(jj.get("overall"), dict):
-            sc = jj["overall"].get("weighted_score") or jj["overall"].get("score")
-            if isinstance(sc, float):
-                score = round(sc*100) if sc <= 1.0 else int(sc)
-            elif isinstance(sc, int):
-                score = sc
-        if ps is not None:
-            cls = "pass" if ps else "fail"
-            badge = f'<span class="badge {cls}">{"PASS" if ps else "FAIL"}</span>'
-        else:
-            badge = ""
-        sc = f'<span class="score">{score}</span>' if score is not None else ""
-        rows.append(f'<tr><td>{eid}</td><td>{badge} {sc}</td><td><a href="{eid}.html">Open chat</a></td></tr>')
-
-    (out_dir / "index.html").write_text(INDEX.format(rows="\n".join(rows)), encoding="utf-8")
-    print(f"Chat pages -> {out_dir} (count={len(gens)})")
+    # gen/ + judged/ files or run.jsonl, whichever the run was written with
+    store = open_store(str(base))
+    n = write_chat_pages(out_dir, store, sorted(store.ids("gen"), key=str), args.workers)
+    print(f"Chat pages -> {out_dir} (count={n})")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+import os, json, argparse
+from datetime import datetime, timezone
+from run_store import STORES, open_store
+from run_metrics import latency_summary
+from report import build_report
+
+# Combine the run dirs of a sharded run (run_eval.py --shard i/N on several nodes) into one
+# run dir: every shard's gen/judge records in one store, a merged metrics.json, then the usual
+# summary.csv, HTML report and chat index built over all cases.
+
+def merge_metrics(runs, keep):
+    # Token/cost totals add up over shards; case latency percentiles are recomputed from the cases
+    shards, cases, totals = [], {}, {"input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "tokens": 0}
+    costs = []
+    for run in runs:
+        p = os.path.join(run, "metrics.json")
+        if not os.path.exists(p):
+            shards.append({"run": run})
+            continue
+        with open(p, "r", encoding="utf-8") as f:
+            m = json.load(f)
+        t = m.get("totals", {})
+        for k in ("input_tokens", "output_tokens", "cached_tokens", "tokens"):
+            totals[k] += t.get(k, 0) or 0
+        if t.get("cost_usd") is not None:
+            costs.append(t["cost_usd"])
+        for c in m.get("cases", []):
+            if c.get("eval_id") in keep: cases.setdefault(c["eval_id"], c)
+        shards.append({"run": run, "shard": m.get("shard"), "n_cases": m.get("n_cases"), "wall_s": m.get("wall_s"),
+                       "model": m.get("model"), "judge_model": m.get("judge_model"), "totals": t})
+    cases = list(cases.values())
+    totals["cost_usd"] = round(sum(costs), 4) if costs else None
+    totals["cached_token_ratio"] = round(totals["cached_tokens"] / totals["input_tokens"], 4) if totals["input_tokens"] else None
+    totals["case_latency_s"] = latency_summary([c["latency_s"] for c in cases if c.get("latency_s")])
+    walls = [s["wall_s"] for s in shards if s.get("wall_s") is not None]
+    return {"created": datetime.now(timezone.utc).isoformat(), "mode": "merged",
+            "wall_s": max(walls) if walls else None, "n_cases": len(keep),
+            "shards": shards, "totals": totals, "cases": cases}
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge shard run dirs into one run with a single report")
+    ap.add_argument("runs", nargs="+", help="shard run dirs (results/<outdir>/<TIMESTAMP>)")
+    ap.add_argument("--outdir", default="results/run_latest")
+    ap.add_argument("--store", choices=STORES, default="files", help="store for the merged run")
+    args = ap.parse_args()
+
+    runs = [r.rstrip("/") for r in args.runs]
+    for r in runs:
+        if not os.path.isdir(os.path.join(r, "judged")) and not os.path.exists(os.path.join(r, "metrics.json")):
+            raise SystemExit(f"Not a run dir: {r}")
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+    base_out = os.path.join(args.outdir, stamp + "-merged")
+    report_dir = os.path.join(base_out, "report")
+    os.makedirs(report_dir, exist_ok=True)
+
+    # A case found in several shards (overlapping datasets, re-runs) keeps the first shard's records
+    out = open_store(base_out, args.store)
+    seen, dupes = set(), 0
+    for r in runs:
+        gens, judged = open_store(r).scan()
+        for eid, j in judged.items():
+            if eid in seen:
+                dupes += 1
+                continue
+            seen.add(eid)
+            if eid in gens:
+                out.put("gen", gens[eid])
+            out.put("judge", j)
+    out.close()
+    if dupes:
+        print(f"(Note) {dupes} cases appeared in more than one shard; kept the first", flush=True)
+
+    m = merge_metrics(runs, seen)
+    with open(os.path.join(base_out, "metrics.json"), "w", encoding="utf-8") as f:
+        json.dump(m, f, ensure_ascii=False, indent=2)
+
+    rep = build_report(base_out)
+
+    latest = os.path.join(args.outdir, "latest")
+    try:
+        if os.path.islink(latest) or os.path.exists(latest): os.unlink(latest)
+        os.symlink(os.path.abspath(base_out), latest)
+    except Exception as e:
+        print(f"(Note) latest symlink not updated: {e}")
+
+    print(f"Merged {len(runs)} runs, {len(seen)} cases")
+    print("  base:", base_out)
+    print("  html:", rep["index"])
+    print("  chat:", rep["chat"])
+    print("  csv :", rep["csv"])
+    return base_out
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import re, json, hashlib
+
+# Prompt files may contain {{name}} placeholders. compile_prompt() parses a file once per content
+# hash into
+#   prefix: the static text -- run-level placeholders (--prompt_vars_file / --prompt_var) filled in and
+#           the "## " sections that hold per-case fields taken out. Sent as the system message,
+#           byte-identical for every case, so the provider's prompt cache covers it.
+#   case:   those sections (rep input, HCP response), filled per case and sent after the static
+#           messages, followed by the case fields the template does not use (category, criteria, ...).
+# A per-case field used inline in a static section (the eval_id in the output schema) is written
+# as <eval_id> there and listed at the top of the case message. A prompt without per-case fields
+# is all prefix and its case goes out as JSON, as before. Run-level values (rubric, label
+# source, ...) live in a vars file, prompt/judge_vars.json by default, not in code; a placeholder
+# without a value is an error.
+
+SLOT = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+# per-case placeholder -> case block key
+CASE_FIELDS = {"eval_id": "eval_id", "rep_input": "rep_input", "hcp_ai_response": "model_output"}
+
+_compiled = {}
+
+def add_prompt_args(ap):
+    ap.add_argument("--prompt_vars_file", metavar="JSON", default="prompt/judge_vars.json",
+                    help='values for the prompt placeholders: {"NAME": "VALUE", ...}')
+    ap.add_argument("--prompt_var", action="append", default=[], metavar="NAME=VALUE",
+                    help="fill {{NAME}} in the prompt files (VALUE @path reads a file); repeatable, overrides --prompt_vars_file")
+
+def prompt_vars(args):
+    out = {}
+    if args.prompt_vars_file:
+        with open(args.prompt_vars_file, "r", encoding="utf-8") as f:
+            out.update({k: str(v) for k, v in json.load(f).items()})
+    for item in args.prompt_var or []:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--prompt_var expects NAME=VALUE, got {item!r}")
+        if value.startswith("@"):
+            with open(value[1:], "r", encoding="utf-8") as f:
+                value = f.read().strip()
+        out[name.strip()] = value
+    return out
+
+def _own_line(section):
+    # A per-case placeholder alone on its line marks a section as per-case
+    return any(SLOT.fullmatch(line.strip()) and SLOT.fullmatch(line.strip())[1] in CASE_FIELDS
+               for line in section.splitlines())
+
+class CompiledPrompt:
+    def __init__(self, path, text, variables, sha):
+        self.path, self.sha = path, sha
+        missing = [n for n in dict.fromkeys(SLOT.findall(text)) if n not in CASE_FIELDS and n not in variables]
+        if missing:
+            raise SystemExit(f"{path}: no value for " + ", ".join(f"{{{{{n}}}}}" for n in missing) +
+                             "; pass --prompt_vars_file FILE or --prompt_var NAME=VALUE")
+        prefix, self.parts, self.inline = [], [], []
+        for section in re.split(r"(?m)^(?=## )", text):
+            pieces = SLOT.split(section)  # text, name, text, name, ...
+            if _own_line(section):
+                # [(text, case field or None)], run-level values merged into the text
+                for i in range(0, len(pieces), 2):
+                    name = pieces[i + 1] if i + 1 < len(pieces) else None
+                    if name is not None and name not in CASE_FIELDS:
+                        pieces[i + 2] = pieces[i] + variables[name] + pieces[i + 2]
+                        continue
+                    self.parts.append((pieces[i], name))
+            else:
+                for i, name in enumerate(pieces[1::2]):
+                    if name in CASE_FIELDS and name not in self.inline:
+                        self.inline.append(name)
+                    pieces[2 * i + 1] = f"<{name}>" if name in CASE_FIELDS else variables[name]
+                prefix.append("".join(pieces))
+        self.prefix = "".join(prefix).strip()
+        # Case message header: eval_id plus the inline-only fields
+        fields = {n for _, n in self.parts if n}
+        self.inline = [n for n in dict.fromkeys(["eval_id"] + self.inline) if n not in fields] if self.parts else []
+
+    def render(self, block):
+        # block: the case dict (run_eval.case_block) -> the per-case user message
+        if not self.parts:
+            return json.dumps(block, ensure_ascii=False)
+        used = set()
+        def value(name):
+            key = CASE_FIELDS[name]
+            used.add(key)
+            v = block.get(key, "")
+            return v if isinstance(v, str) else json.dumps(v, ensure_ascii=False)
+        head = "".join(f"{n}: {value(n)}\n" for n in self.inline)
+        body = "".join(text + (value(name) if name else "") for text, name in self.parts).strip()
+        rest = {k: v for k, v in block.items() if k not in used and v not in (None, "", [])}
+        out = (f"## Case\n{head}\n" if head else "") + body
+        if rest:
+            out += "\n\n## Case details\n" + json.dumps(rest, ensure_ascii=False)
+        return out
+
+    def info(self):
+        return {"sha256": self.sha, "prefix_chars": len(self.prefix), "case_fields": sorted({n for _, n in self.parts if n} | set(self.inline))}
+
+def compile_prompt(path, variables=None):
+    # Cached by (file content, variables): a sweep or a long run parses each prompt once
+    variables = variables or {}
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    key = (sha, tuple(sorted(variables.items())))
+    if key not in _compiled:
+        _compiled[key] = CompiledPrompt(path, text, variables, sha)
+    return _compiled[key]
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+import os, json, time, hashlib, argparse
+from run_store import open_store, find_log, write_json_atomic, load_json
+from report_batch import HTML, render_report
+from make_chat_pages import PAGE, INDEX, BUBBLE, write_chat_pages
+from report_paged import SHELL, CHAT_REDIRECT, write_paged_report
+
+# Everything under <run>/report, streamed from the run's store a record at a time: a hashing pass,
+# then index.html + summary.csv (report_batch), the chat pages of changed cases and the chat index
+# (make_chat_pages), each walking the records in eval_id order. Memory stays flat in the number
+# of cases apart from the per-case hashes. run_eval.py, run_eval.sh and merge_runs.py call this
+# in-process; the two older scripts remain for rebuilding one half on its own.
+#
+# report/manifest.json keeps a hash of each case's gen+judge records and of the templates, so a
+# rebuild only rewrites the chat pages whose inputs changed. A template change (or a moved run
+# dir, since the report links are absolute file:// URIs) invalidates everything.
+#
+# layout "paged" (report_paged.py) replaces the one-row-per-case index pages with a static shell
+# over chunked data files; "auto" switches to it from PAGED_MIN cases.
+
+MANIFEST = "manifest.json"
+LAYOUTS = ("auto", "table", "paged")
+PAGED_MIN = 5000
+
+def _hash(*objs):
+    return hashlib.sha1(json.dumps(objs, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+def _file_hash(path):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+def scan_hashes(store):
+    # One streaming read of the run -> ({eval_id: hash of gen+judge}, judged eval_ids); the
+    # records themselves are not kept
+    gen = {j["eval_id"]: _hash(j) for j in store.iter("gen")}
+    judge = {j["eval_id"]: _hash(j) for j in store.iter("judge")}
+    return {eid: _hash(gen.get(eid), judge.get(eid)) for eid in set(gen) | set(judge)}, judge.keys(), gen.keys()
+
+def build_report(base, workers=None, metrics_path=None, full=False, layout="auto"):
+    t0 = time.perf_counter()
+    store = open_store(base)
+    cases, judged, gens = scan_hashes(store)
+    t_load = time.perf_counter() - t0
+    report_dir = os.path.abspath(os.path.join(base, "report"))
+    chat_dir = os.path.join(report_dir, "chat")
+    metrics_path = metrics_path or os.path.join(base, "metrics.json")
+    man_path = os.path.join(report_dir, MANIFEST)
+
+    if layout == "auto":
+        layout = "paged" if len(judged) >= PAGED_MIN else "table"
+    templates = _hash(PAGE, INDEX, BUBBLE, HTML.template, SHELL, CHAT_REDIRECT, layout, report_dir)
+    man = None if full else load_json(man_path)
+    old = man["cases"] if man and man.get("templates") == templates and os.path.exists(os.path.join(chat_dir, "index.html")) else {}
+    changed = {eid for eid, h in cases.items() if old.get(eid, {}).get("hash") != h}
+    removed = set(old) - set(cases)
+    metrics = _file_hash(metrics_path)
+    out = {"index": os.path.join(report_dir, "index.html"), "csv": os.path.join(report_dir, "summary.csv"),
+           "chat": os.path.join(chat_dir, "index.html"), "cases": len(judged), "layout": layout}
+    if old and not changed and not removed and man.get("metrics") == metrics and os.path.exists(out["index"]):
+        return dict(out, pages=0, load_s=round(t_load, 3), total_s=round(time.perf_counter() - t0, 3))
+
+    # The indexes are re-streamed from the store in eval_id order; only chat pages of changed
+    # cases are re-rendered
+    order = sorted(judged, key=str)
+    paged = layout == "paged"
+    render_report(report_dir, (j for j in store.get_many("judge", order) if j), metrics_path, write_index=not paged)
+    pages = write_chat_pages(chat_dir, store, sorted(gens, key=str), workers, changed, write_index=not paged)
+    chunks = None
+    if paged:
+        chunks = write_paged_report(report_dir, ((j, g) for j, g in zip(store.get_many("judge", order), store.get_many("gen", order)) if j),
+                                    metrics_path, (man or {}).get("chunks") if old else None)
+        with open(out["chat"], "w", encoding="utf-8") as f:
+            f.write(CHAT_REDIRECT)
+    for eid in removed:
+        try:
+            os.remove(os.path.join(chat_dir, f"{eid}.html"))
+        except OSError:
+            pass
+
+    write_json_atomic(man_path, {"templates": templates, "metrics": metrics, "chunks": chunks,
+                                 "cases": {eid: {"hash": h} for eid, h in cases.items()}}, indent=None)
+    return dict(out, pages=pages, load_s=round(t_load, 3), total_s=round(time.perf_counter() - t0, 3))
+
+def _signature(base):
+    # Cheap change detector: (mtime, size) of every record file, or of run.jsonl
+    log = find_log(base)
+    if log:
+        st = os.stat(log)
+        return {log: (st.st_mtime_ns, st.st_size)}
+    sig = {}
+    for d in ("gen", "judged"):
+        try:
+            with os.scandir(os.path.join(base, d)) as it:
+                for e in it:
+                    if e.name.endswith(".json") and not e.name.startswith("."):
+                        st = e.stat()
+                        sig[e.path] = (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            pass
+    return sig
+
+def watch(base, interval=5.0, workers=None, layout="auto"):
+    # Poll the run dir and update the report as gen/judge records land; exits after the build
+    # that follows the run's metrics.json appearing (run_eval.py writes it when it finishes)
+    seen = {}
+    while True:
+        done = os.path.exists(os.path.join(base, "metrics.json"))
+        sig = _signature(base)
+        if sig != seen:
+            seen = sig
+            r = build_report(base, workers, layout=layout)
+            print(f"[watch] {r['cases']} judged, {r['pages']} pages updated", flush=True)
+        if done:
+            return
+        time.sleep(interval)
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the HTML report, summary.csv and chat pages of a run")
+    ap.add_argument("--base", required=True, help="run dir (results/<outdir>/<TIMESTAMP>)")
+    ap.add_argument("--workers", type=int, help="processes for chat page rendering at large N (default: CPU count)")
+    ap.add_argument("--metrics", help="run metrics.json (default: <base>/metrics.json)")
+    ap.add_argument("--full", action="store_true", help="ignore report/manifest.json and re-render everything")
+    ap.add_argument("--layout", choices=LAYOUTS, default="auto", help=f"paged = chunked data + virtual-scrolling shell (auto: from {PAGED_MIN} cases)")
+    ap.add_argument("--watch", action="store_true", help="keep updating the report while the run is in progress")
+    ap.add_argument("--interval", type=float, default=5.0, help="--watch poll interval in seconds")
+    args = ap.parse_args()
+    if args.watch:
+        watch(args.base, args.interval, args.workers, args.layout)
+        return
+    r = build_report(args.base, args.workers, args.metrics, full=args.full, layout=args.layout)
+    print(f"Report ({r['layout']}): {r['cases']} cases, {r['pages']} chat pages rendered in {r['total_s']:.2f}s")
+    print("  html:", r["index"])
+    print("  chat:", r["chat"])
+    print("  csv :", r["csv"])
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,10 @@
-import os, glob, json, argparse
+import os, glob, json, shutil, argparse
 from datetime import datetime, timezone
 from string import Template
 from pathlib import Path
+from html import escape
+from run_store import open_store
+from aggregator import RunAggregator
 
 HTML = Template("""<!doctype html><html><head>
 <meta charset="utf-8"><title>Single Evals — Report</title>
@@ -19,14 +22,18 @@ tr:hover{background:#fafafa}
 .fail{background:#fdeceb;color:#a31224;border:1px solid #f7c5ca}
 a{color:#2257d2;text-decoration:none}
 a:hover{text-decoration:underline}
+h3{margin:20px 0 8px}
+.slow{margin-bottom:20px}
 </style></head><body>
 <h1>Single Evals — Report</h1>
 <div class="small">Generated: $now • Items: $n • Pass rate: $pass_rate% • Avg score: $avg</div>
 <div class="kpi">
   <div class="card">Pass rate: <b>$pass_rate%</b></div>
   <div class="card">Avg score: <b>$avg</b></div>
+$extra_cards
   <div class="card"><a href="$chat_index_uri">Chat index →</a></div>
 </div>
+$slowest
 <table>
 <thead><tr><th>Eval ID</th><th>Score</th><th>Result</th><th>Top Findings</th><th>Chat</th></tr></thead>
 <tbody>
@@ -35,58 +42,181 @@ $rows
 </table>
 </body></html>""")
 
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--judged_glob", required=True)
-    ap.add_argument("--outdir", required=True)
-    args = ap.parse_args()
+def report_row(j, chatdir):
+    # One judge record -> (index table row, summary.csv line)
+    eid = j["eval_id"]
+    sc  = int(j.get("score", 0))
+    ps  = bool(j.get("pass", False))
+    chat_uri = (chatdir / f"{eid}.html").as_uri()
+    top = ""
+    if isinstance(j.get("findings"), list) and j["findings"]:
+        top = j["findings"][0]
+    badge = f'<span class="badge {"pass" if ps else "fail"}">{"PASS" if ps else "FAIL"}</span>'
+    row = (
+        f"<tr>"
+        f"<td><a href='{chat_uri}'>{eid}</a></td>"
+        f"<td>{sc}</td>"
+        f"<td>{badge}</td>"
+        f"<td>{top}</td>"
+        f"<td><a href='{chat_uri}'>Open chat</a></td>"
+        f"</tr>"
+    )
+    return row, f"{eid},{sc},{ps},{chat_uri}\n"
+
+def ci_table(ci):
+    # --target_ci runs: pass rate and interval per category (and stratified overall), drawn as bars
+    pct = lambda v: "–" if v is None else f"{100 * v:.0f}%"
+    def bar(lo, hi, p):
+        mark = "" if p is None else f"<span style='position:absolute;left:{100 * p:.1f}%;top:-2px;width:2px;height:14px;background:#333'></span>"
+        return (f"<div style='position:relative;width:200px;height:10px;background:#f0f0f0;border-radius:5px'>"
+                f"<span style='position:absolute;left:{100 * lo:.1f}%;width:{100 * (hi - lo):.1f}%;height:10px;background:#9bb7f0;border-radius:5px'></span>{mark}</div>")
+    rows = [f"<tr><td>{escape(cat)}</td><td>{c['n']}/{c['total']}</td><td>{pct(c['pass_rate'])}</td>"
+            f"<td>{pct(c['lo'])} – {pct(c['hi'])}</td><td>{bar(c['lo'], c['hi'], c['pass_rate'])}</td></tr>"
+            for cat, c in ci["categories"].items()]
+    o = ci.get("overall")
+    if o:
+        rows.append(f"<tr><td><b>Overall (stratified)</b></td><td>{ci['evaluated']}/{ci['total']}</td><td>{pct(o['pass_rate'])}</td>"
+                    f"<td>{pct(o['lo'])} – {pct(o['hi'])}</td><td>{bar(o['lo'], o['hi'], o['pass_rate'])}</td></tr>")
+    return (f"<h3>Pass rate by category ({100 * ci['level']:.0f}% CI)</h3><table class='slow'><thead><tr><th>Category</th><th>Evaluated</th>"
+            f"<th>Pass rate</th><th>Interval</th><th></th></tr></thead><tbody>\n" + "\n".join(rows) + "\n</tbody></table>")
 
-    outdir = Path(args.outdir).resolve()
+def aggregate_tables(agg, chatdir):
+    # Score histogram, per-category pass rates and lowest-scoring cases from a RunAggregator
+    s = agg.summary()
+    if not s["n"]:
+        return ""
+    top = max(b["n"] for b in s["histogram"]) or 1
+    hist = "\n".join(f"<tr><td>{b['lo']}–{b['hi']}</td><td>{b['n']}</td><td><div style='width:{200 * b['n'] / top:.0f}px;height:10px;"
+                     f"background:#9bb7f0;border-radius:5px'></div></td></tr>" for b in s["histogram"])
+    out = ("<h3>Score distribution</h3><table class='slow'><thead><tr><th>Score</th><th>Cases</th><th></th></tr></thead>"
+           f"<tbody>\n{hist}\n</tbody></table>")
+    if len(s["categories"]) > 1:
+        cats = "\n".join(f"<tr><td>{escape(cat)}</td><td>{c['n']}</td><td>{100 * c['pass_rate']:.1f}%</td><td>{c['avg_score']}</td></tr>"
+                         for cat, c in s["categories"].items())
+        out += ("<h3>By category</h3><table class='slow'><thead><tr><th>Category</th><th>Cases</th><th>Pass rate</th>"
+                f"<th>Avg score</th></tr></thead><tbody>\n{cats}\n</tbody></table>")
+    worst = "\n".join(f"<tr><td><a href='{(chatdir / (str(w['eval_id']) + '.html')).as_uri()}'>{w['eval_id']}</a></td><td>{w['score']}</td>"
+                      f"<td>{'PASS' if w['pass'] else 'FAIL'}</td><td>{escape(w['finding'])}</td></tr>" for w in s["worst"])
+    return out + ("<h3>Lowest-scoring cases</h3><table class='slow'><thead><tr><th>Eval ID</th><th>Score</th><th>Result</th>"
+                  f"<th>Top finding</th></tr></thead><tbody>\n{worst}\n</tbody></table>")
+
+def summary_cards(tokens_by_pack, metrics_path, chatdir):
+    # -> (extra KPI cards, slowest-cases table) as HTML
+    # Judge tokens per case, split by pack size so packed vs single-case cost sits side by side
+    extra_cards = ""
+    if tokens_by_pack:
+        parts = [f"<b>{round(tok/cases)}</b> (pack {k}, {cases} cases)" for k, (tok, cases) in sorted(tokens_by_pack.items(), reverse=True)]
+        extra_cards = f'  <div class="card">Judge tokens/case: {" · ".join(parts)}</div>'
+
+    # Latency / token / cost KPIs and slowest cases from the run's metrics.json
+    slowest = ""
+    metrics_path = Path(metrics_path)
+    if metrics_path.exists():
+        m = json.loads(metrics_path.read_text(encoding="utf-8"))
+        t = m.get("totals", {})
+        lat = t.get("case_latency_s", {})
+        fmt = lambda v: "–" if v is None else f"{v:.2f}s"
+        money = lambda v: "–" if v is None else f"${v:.4f}"
+        cost = t.get("cost_usd")
+        extra_cards += (
+            f'\n  <div class="card">Case latency p50/p95/max: <b>{fmt(lat.get("p50"))} / {fmt(lat.get("p95"))} / {fmt(lat.get("max"))}</b></div>'
+            f'\n  <div class="card">Tokens: <b>{t.get("tokens", 0):,}</b></div>'
+            f'\n  <div class="card">Est. cost: <b>{money(cost)}</b></div>'
+        )
+        js = m.get("judge_samples")
+        if js and js.get("mean") is not None:
+            extra_cards += (f'\n  <div class="card">Judge samples/case: <b>{js["mean"]:.2f}</b> '
+                            f'(max {js["max"]}, {js["resampled"]} cases resampled)</div>')
+        ci = m.get("target_ci")
+        if ci:
+            extra_cards += (f'\n  <div class="card">Evaluated: <b>{ci["evaluated"]}/{ci["total"]}</b> ({100 * (ci["fraction"] or 0):.0f}%) · '
+                            f'target CI {ci["target"]} · {ci["stopped"]}</div>')
+            slowest += ci_table(ci)
+        cases = sorted((c for c in m.get("cases", []) if c.get("latency_s")), key=lambda c: c["latency_s"], reverse=True)[:10]
+        if cases:
+            srows = "\n".join(
+                f"<tr><td><a href='{(chatdir / (str(c['eval_id']) + '.html')).as_uri()}'>{c['eval_id']}</a></td>"
+                f"<td>{fmt(c['latency_s'])}</td><td>{fmt(c.get('gen_latency_s'))}</td><td>{fmt(c.get('judge_latency_s'))}</td>"
+                f"<td>{c.get('tokens', 0)}</td><td>{money(c.get('cost_usd'))}</td></tr>"
+                for c in cases
+            )
+            slowest += ("<h3>Slowest cases</h3><table class='slow'><thead><tr><th>Eval ID</th><th>Total</th><th>Gen</th>"
+                       f"<th>Judge</th><th>Tokens</th><th>Est. cost</th></tr></thead><tbody>\n{srows}\n</tbody></table>")
+    return extra_cards, slowest
+
+def add_tokens(tokens_by_pack, j):
+    # Running judge-token totals per pack size: {pack: [tokens, cases]}
+    u = j.get("judge_usage")
+    if isinstance(u, dict):
+        t = tokens_by_pack.setdefault(u.get("pack", 1), [0, 0])
+        t[0] += (u.get("input_tokens") or 0) + (u.get("output_tokens") or 0)
+        t[1] += 1
+
+def render_report(outdir, records, metrics_path=None, write_index=True):
+    # records: judge dicts in display order, consumed once as a stream -> <outdir>/index.html and
+    # <outdir>/summary.csv. Each record becomes a CSV line and a <tr> as it arrives; the rows go to
+    # a side file until the totals for the page header are known, then are copied in after it.
+    # Only the aggregate and the token sums stay in memory. write_index=False writes the CSV only
+    # (the paged layout has its own index). Returns (index path, csv path).
+    outdir = Path(outdir).resolve()
     chatdir = (outdir / "chat").resolve()
     os.makedirs(outdir, exist_ok=True)
-
-    paths = sorted(glob.glob(ap.parse_args().judged_glob))
-    rows, scores, passes = [], [], 0
+    agg, tokens_by_pack = RunAggregator(), {}
+    out_path = outdir / "index.html"
+    rows_path = outdir / ".index_rows.tmp"
 
     # CSV with absolute file:// URIs for easy clicking from spreadsheet apps
     csv_path = outdir / "summary.csv"
-    with open(csv_path, "w", encoding="utf-8") as csv:
+    with open(csv_path, "w", encoding="utf-8") as csv, \
+         open(rows_path if write_index else os.devnull, "w", encoding="utf-8") as rows:
         csv.write("eval_id,score,pass,chat\n")
-        for p in paths:
-            j = json.load(open(p, "r", encoding="utf-8"))
-            eid = j.get("eval_id", os.path.splitext(os.path.basename(p))[0])
-            sc  = int(j.get("score", 0))
-            ps  = bool(j.get("pass", False))
-            scores.append(sc)
-            if ps: passes += 1
-            chat_uri = (chatdir / f"{eid}.html").as_uri()
-            top = ""
-            if isinstance(j.get("findings"), list) and j["findings"]:
-                top = j["findings"][0]
-            badge = f'<span class="badge {"pass" if ps else "fail"}">{"PASS" if ps else "FAIL"}</span>'
-            rows.append(
-                f"<tr>"
-                f"<td><a href='{chat_uri}'>{eid}</a></td>"
-                f"<td>{sc}</td>"
-                f"<td>{badge}</td>"
-                f"<td>{top}</td>"
-                f"<td><a href='{chat_uri}'>Open chat</a></td>"
-                f"</tr>"
-            )
-            csv.write(f"{eid},{sc},{ps},{chat_uri}\n")
+        for j in records:
+            agg.add(j)
+            add_tokens(tokens_by_pack, j)
+            row, line = report_row(j, chatdir)
+            rows.write(row + "\n")
+            csv.write(line)
+    if not write_index:
+        return out_path, csv_path
 
-    n = len(paths)
-    avg = round(sum(scores)/n) if n else 0
-    pass_rate = round(100*passes/n, 1) if n else 0.0
+    n = agg.n
+    avg = round(agg.avg_score()) if n else 0
+    pass_rate = round(100*agg.pass_rate(), 1) if n else 0.0
     chat_index_uri = (chatdir / "index.html").as_uri()
-    html = HTML.substitute(
-        now=datetime.now(timezone.utc).isoformat(),
-        n=n, pass_rate=pass_rate, avg=avg, rows="\n".join(rows),
-        chat_index_uri=chat_index_uri
-    )
-    out_path = outdir / "index.html"
+    extra_cards, slowest = summary_cards(tokens_by_pack, metrics_path or outdir.parent / "metrics.json", chatdir)
+    slowest += aggregate_tables(agg, chatdir)
+
+    head, tail = HTML.template.split("$rows")
     with open(out_path, "w", encoding="utf-8") as f:
-        f.write(html)
+        f.write(Template(head).substitute(
+            extra_cards=extra_cards, slowest=slowest,
+            now=datetime.now(timezone.utc).isoformat(),
+            n=n, pass_rate=pass_rate, avg=avg,
+            chat_index_uri=chat_index_uri
+        ))
+        with open(rows_path, "r", encoding="utf-8") as rows:
+            shutil.copyfileobj(rows, f)
+        f.write(tail)
+    os.remove(rows_path)
+    return out_path, csv_path
+
+def main():
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--judged_glob")
+    src.add_argument("--base", help="run dir; streams judge records from its store (judged/ files or run.jsonl)")
+    ap.add_argument("--outdir", required=True)
+    ap.add_argument("--metrics", help="run metrics.json (default: <outdir>/../metrics.json)")
+    args = ap.parse_args()
+
+    if args.base:
+        # run.jsonl is in write order; rows stay sorted by eval_id like the judged/ glob
+        store = open_store(args.base)
+        records = (j for j in store.get_many("judge", sorted(store.ids("judge"), key=str)) if j)
+    else:
+        records = ({"eval_id": os.path.splitext(os.path.basename(p))[0], **json.load(open(p, "r", encoding="utf-8"))}
+                   for p in sorted(glob.glob(args.judged_glob)))
+    out_path, csv_path = render_report(args.outdir, records, args.metrics)
     print("Wrote", out_path, "and", csv_path)
 
 if __name__ == "__main__":
@@ -0,0 +1,215 @@
+import json, hashlib
+from datetime import datetime, timezone
+from pathlib import Path
+from report_batch import summary_cards, aggregate_tables, add_tokens
+from aggregator import RunAggregator
+
+# Paged report layout for large runs: instead of one <tr> per case in index.html, case summaries
+# go to report/data/cases-NNNN.js in chunks of CHUNK cases, next to a static index.html shell
+# that loads them progressively and renders only the visible rows. The chunks are JSON wrapped
+# in a reportChunk(...) call so they load through <script> tags, which (unlike fetch) works
+# from file:// without a server.
+
+CHUNK = 2000
+
+SHELL = """<!doctype html><html><head>
+<meta charset="utf-8"><title>Single Evals — Report</title>
+<style>
+body{font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,sans-serif;margin:24px;background:#fafbff}
+h1{margin-top:0}
+.small{color:#666;font-size:12px}
+.kpi{display:flex;gap:16px;margin:12px 0;flex-wrap:wrap}
+.kpi .card{background:#fff;border:1px solid #eee;border-radius:12px;padding:12px 14px}
+.filters{display:flex;gap:10px;align-items:center;flex-wrap:wrap;margin:12px 0}
+.filters input,.filters select{padding:6px 8px;border:1px solid #ddd;border-radius:8px}
+.filters input[type=number]{width:64px}
+.hist{display:flex;align-items:flex-end;gap:3px;height:90px;background:#fff;border:1px solid #eee;border-radius:12px;padding:10px 12px;margin:12px 0}
+.hist .bin{flex:1;display:flex;flex-direction:column;justify-content:flex-end;height:100%;cursor:pointer}
+.hist .bar{display:flex;flex-direction:column;justify-content:flex-end}
+.hist .p{background:#9fdcb2}.hist .f{background:#f3a6ae}
+.hist .lbl{font-size:10px;color:#666;text-align:center;margin-top:2px}
+.grid{background:#fff;border:1px solid #eee;border-radius:12px;overflow:hidden}
+.head,.row{display:grid;grid-template-columns:160px 70px 80px 200px 1fr 90px;align-items:center}
+.head{background:#f6f7fb;font-weight:600;border-bottom:1px solid #eee}
+.head div{padding:10px 12px;cursor:pointer;user-select:none}
+.head div.sorted:after{content:" ▾"}.head div.sorted.asc:after{content:" ▴"}
+.viewport{height:65vh;overflow-y:auto;position:relative}
+.row{position:absolute;left:0;right:0;height:36px;border-bottom:1px solid #f0f0f0}
+.row:hover{background:#fafafa}
+.row div{padding:0 12px;white-space:nowrap;overflow:hidden;text-overflow:ellipsis}
+.badge{padding:2px 8px;border-radius:999px;font-size:12px;font-weight:600}
+.pass{background:#e9f9ee;color:#127c3a;border:1px solid #bfe8cc}
+.fail{background:#fdeceb;color:#a31224;border:1px solid #f7c5ca}
+a{color:#2257d2;text-decoration:none}
+a:hover{text-decoration:underline}
+h3{margin:20px 0 8px}
+table.slow{border-collapse:collapse;width:100%;background:#fff;border:1px solid #eee;border-radius:12px;margin-bottom:20px}
+table.slow th,table.slow td{padding:8px 12px;border-bottom:1px solid #f0f0f0;text-align:left}
+</style></head><body>
+<h1>Single Evals — Report</h1>
+<div class="small" id="status">Loading…</div>
+<div class="kpi" id="kpi"></div>
+<div id="extra"></div>
+<div class="filters">
+  <label>Score <input type="number" id="smin" min="0" max="100" value="0"> – <input type="number" id="smax" min="0" max="100" value="100"></label>
+  <select id="pass"><option value="">Pass &amp; fail</option><option value="1">Pass only</option><option value="0">Fail only</option></select>
+  <select id="cat"><option value="">All categories</option></select>
+  <input type="search" id="q" placeholder="Search findings / eval id" size="30">
+  <span class="small" id="shown"></span>
+</div>
+<div class="hist" id="hist"></div>
+<div class="grid">
+  <div class="head" id="head"><div data-k="0">Eval ID</div><div data-k="1" class="sorted">Score</div><div data-k="2">Result</div><div data-k="3">Category</div><div data-k="4">Top Findings</div><div>Chat</div></div>
+  <div class="viewport" id="vp"><div id="spacer"></div></div>
+</div>
+<script src="data/meta.js"></script>
+<script>
+// rows: [eval_id, score, pass (0/1), category, [findings...]]
+var ALL = [], VIEW = [], META = window.REPORT_META || {chunks: 0}, H = 36;
+var sortK = 1, asc = true, pending = false;
+var $ = function (id) { return document.getElementById(id); };
+function reportChunk(i, rows) { for (var r of rows) ALL.push(r); schedule(); }
+function schedule() { if (!pending) { pending = true; requestAnimationFrame(function () { pending = false; refresh(); }); } }
+function load(i) {
+  if (i >= META.chunks) { $("status").textContent = "Generated: " + META.generated + " • Items: " + ALL.length; return; }
+  var s = document.createElement("script");
+  s.src = "data/cases-" + String(i).padStart(4, "0") + ".js";
+  s.onload = function () { $("status").textContent = "Loading… " + ALL.length + " / " + META.n; load(i + 1); };
+  s.onerror = function () { $("status").textContent = "Missing data chunk " + s.src; };
+  document.body.appendChild(s);
+}
+function card(html) { var d = document.createElement("div"); d.className = "card"; d.innerHTML = html; return d; }
+function refresh() {
+  var smin = +$("smin").value || 0, smax = $("smax").value === "" ? 100 : +$("smax").value;
+  var p = $("pass").value, c = $("cat").value, q = $("q").value.trim().toLowerCase();
+  var cats = {};
+  VIEW = ALL.filter(function (r) {
+    cats[r[3]] = 1;
+    if (r[1] < smin || r[1] > smax) return false;
+    if (p !== "" && String(r[2]) !== p) return false;
+    if (c && r[3] !== c) return false;
+    if (q && r[0].toLowerCase().indexOf(q) < 0 && r[4].join(" \\n").toLowerCase().indexOf(q) < 0) return false;
+    return true;
+  });
+  var dir = asc ? 1 : -1;
+  VIEW.sort(function (a, b) {
+    var x = sortK === 4 ? (a[4][0] || "") : a[sortK], y = sortK === 4 ? (b[4][0] || "") : b[sortK];
+    return (x < y ? -1 : x > y ? 1 : 0) * dir || (a[0] < b[0] ? -1 : 1);
+  });
+  var sel = $("cat"), have = {};
+  for (var o of sel.options) have[o.value] = 1;
+  Object.keys(cats).sort().forEach(function (k) { if (!have[k] && k) sel.add(new Option(k, k)); });
+  stats(); hist(); $("spacer").style.height = VIEW.length * H + "px"; draw(true);
+}
+function stats() {
+  var n = VIEW.length, passes = 0, sum = 0;
+  for (var r of VIEW) { passes += r[2]; sum += r[1]; }
+  var k = $("kpi"); k.textContent = "";
+  k.appendChild(card("Pass rate: <b>" + (n ? (100 * passes / n).toFixed(1) : "0.0") + "%</b>"));
+  k.appendChild(card("Avg score: <b>" + (n ? Math.round(sum / n) : 0) + "</b>"));
+  if (META.cards_html) k.insertAdjacentHTML("beforeend", META.cards_html);
+  $("shown").textContent = n + " of " + ALL.length + " cases";
+}
+function hist() {
+  var bins = [];
+  for (var i = 0; i < 10; i++) bins.push([0, 0]);
+  for (var r of VIEW) bins[Math.min(9, Math.floor(r[1] / 10))][r[2] ? 0 : 1]++;
+  var max = Math.max(1, Math.max.apply(null, bins.map(function (b) { return b[0] + b[1]; })));
+  var h = $("hist"); h.textContent = "";
+  bins.forEach(function (b, i) {
+    var bin = document.createElement("div"); bin.className = "bin";
+    bin.title = (i * 10) + "–" + (i === 9 ? 100 : i * 10 + 9) + ": " + b[0] + " pass, " + b[1] + " fail";
+    bin.onclick = function () { $("smin").value = i * 10; $("smax").value = i === 9 ? 100 : i * 10 + 9; refresh(); };
+    var bar = document.createElement("div"); bar.className = "bar";
+    [["f", b[1]], ["p", b[0]]].forEach(function (x) { var d = document.createElement("div"); d.className = x[0]; d.style.height = (70 * x[1] / max) + "px"; bar.appendChild(d); });
+    var lbl = document.createElement("div"); lbl.className = "lbl"; lbl.textContent = i * 10;
+    bin.appendChild(bar); bin.appendChild(lbl); h.appendChild(bin);
+  });
+}
+var drawn = [-1, -1];
+function draw(force) {
+  var vp = $("vp"), first = Math.max(0, Math.floor(vp.scrollTop / H) - 10);
+  var last = Math.min(VIEW.length, Math.ceil((vp.scrollTop + vp.clientHeight) / H) + 10);
+  if (!force && drawn[0] === first && drawn[1] === last) return;
+  drawn = [first, last];
+  var sp = $("spacer"); sp.textContent = "";
+  for (var i = first; i < last; i++) {
+    var r = VIEW[i], row = document.createElement("div"), href = "chat/" + encodeURIComponent(r[0]) + ".html";
+    row.className = "row"; row.style.top = i * H + "px";
+    var id = document.createElement("div"), a = document.createElement("a"); a.href = href; a.textContent = r[0]; id.appendChild(a);
+    var sc = document.createElement("div"); sc.textContent = r[1];
+    var res = document.createElement("div"), b = document.createElement("span"); b.className = "badge " + (r[2] ? "pass" : "fail"); b.textContent = r[2] ? "PASS" : "FAIL"; res.appendChild(b);
+    var cat = document.createElement("div"); cat.textContent = r[3]; cat.title = r[3];
+    var f = document.createElement("div"); f.textContent = r[4][0] || ""; f.title = r[4].join("\\n");
+    var ch = document.createElement("div"), a2 = document.createElement("a"); a2.href = href; a2.textContent = "Open chat"; ch.appendChild(a2);
+    [id, sc, res, cat, f, ch].forEach(function (d) { row.appendChild(d); });
+    sp.appendChild(row);
+  }
+}
+$("vp").addEventListener("scroll", function () { draw(false); });
+["smin", "smax", "pass", "cat", "q"].forEach(function (id) { $(id).addEventListener("input", refresh); });
+document.querySelectorAll("#head div[data-k]").forEach(function (d) {
+  d.addEventListener("click", function () {
+    var k = +d.dataset.k; asc = k === sortK ? !asc : true; sortK = k;
+    document.querySelectorAll("#head div").forEach(function (x) { x.classList.remove("sorted", "asc"); });
+    d.classList.add("sorted"); if (asc) d.classList.add("asc");
+    refresh();
+  });
+});
+$("head").querySelector(".sorted").classList.add("asc");
+if (META.extra_html) $("extra").innerHTML = META.extra_html;
+load(0);
+</script>
+</body></html>
+"""
+
+CHAT_REDIRECT = """<!doctype html><meta charset="utf-8"><title>Chat Index</title>
+<meta http-equiv="refresh" content="0; url=../index.html">
+<p>The case list for this run is in the <a href="../index.html">paged report</a>.</p>
+"""
+
+def case_summary(j, gen=None):
+    findings = j.get("findings") if isinstance(j.get("findings"), list) else []
+    category = j.get("category") or (gen or {}).get("category") or ""
+    return [str(j["eval_id"]), int(j.get("score", 0)), 1 if j.get("pass") else 0, str(category),
+            [str(f)[:300] for f in findings[:5]]]
+
+def write_paged_report(report_dir, cases, metrics_path, old_chunks=None):
+    # cases: (judge dict, gen dict or None) in display order, consumed as a stream; one chunk of
+    # CHUNK rows is held at a time. Writes index.html (shell), data/meta.js and the chunk files
+    # whose content changed since old_chunks (their hashes); returns the new hashes.
+    report_dir = Path(report_dir).resolve()
+    data_dir = report_dir / "data"
+    data_dir.mkdir(parents=True, exist_ok=True)
+    old_chunks = old_chunks or []
+    rows, tokens_by_pack, agg, hashes = [], {}, RunAggregator(), []
+
+    def flush():
+        n = len(hashes)
+        body = json.dumps(rows, separators=(",", ":"))
+        h = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        hashes.append(h)
+        path = data_dir / f"cases-{n:04d}.js"
+        if n >= len(old_chunks) or old_chunks[n] != h or not path.exists():
+            path.write_text(f"reportChunk({n},{body});\n", encoding="utf-8")
+        rows.clear()
+
+    for j, gen in cases:
+        rows.append(case_summary(j, gen))
+        agg.add({**j, "category": rows[-1][3]})
+        add_tokens(tokens_by_pack, j)
+        if len(rows) == CHUNK:
+            flush()
+    if rows:
+        flush()
+    for p in data_dir.glob("cases-*.js"):
+        if int(p.stem.split("-")[1]) >= len(hashes):
+            p.unlink()
+
+    cards, slowest = summary_cards(tokens_by_pack, metrics_path, report_dir / "chat")
+    slowest += aggregate_tables(agg, report_dir / "chat")
+    meta = {"generated": datetime.now(timezone.utc).isoformat(), "n": agg.n, "chunks": len(hashes),
+            "chunk_size": CHUNK, "cards_html": cards, "extra_html": slowest}
+    (data_dir / "meta.js").write_text(f"window.REPORT_META = {json.dumps(meta)};\n", encoding="utf-8")
+    (report_dir / "index.html").write_text(SHELL, encoding="utf-8")
+    return hashes
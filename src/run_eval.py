@@ -1,138 +1,604 @@
-import os, json, argparse, re, sys, subprocess
+import os, argparse, asyncio, time
+from collections import namedtuple
 import os
 for _k in ('OPENAI_PROXY','HTTP_PROXY','HTTPS_PROXY','ALL_PROXY','http_proxy','https_proxy','all_proxy'):
     os.environ.pop(_k, None)
-if not os.environ.get('OPENAI_API_KEY'):
-    raise SystemExit('Missing OPENAI_API_KEY. Create .env from .env.example or export it in your shell.')
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 load_dotenv()
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from llm_cache import add_cache_args, cache_from_args, cache_key, file_hash
+from run_store import STORES, open_store, resolve_run_dir
+from judge_pack import PACK_REQ, pack_block, split_pack, extract_json
+from aggregator import RunAggregator
+from run_metrics import LLMResult, CallLog, case_metrics, write_metrics
+from scheduler import add_scheduler_args, pool_from_args, estimate_tokens
+from engines import ENGINES, LangChainEngine
+import http_pool
+from dataset import iter_cases, parse_shard
+from adaptive import add_adaptive_args, StratifiedSampler
+from conversation import add_conversation_args, check_budget, History, summary_messages, transcript, sum_usage, aggregate_turns, conversation_summary
+from prompt_compiler import add_prompt_args, prompt_vars, compile_prompt
+from judge_samples import add_sampling_args, score_pass, needs_more, aggregate, sampling_summary
+from report import LAYOUTS, build_report
+
+JUDGE_REQ=("You are the compliance & clinical quality judge. "
+           "Return STRICT JSON with keys: eval_id (string), score (0-100 int), pass (bool), "
+           "findings (array of strings), rationale (string). No extra text.")
 
-def read(p): return open(p,"r",encoding="utf-8").read()
 def ensure_dirs(*ps): [os.makedirs(x,exist_ok=True) for x in ps]
-def _escape_curly(t): return t.replace("{","{{").replace("}","}}")
 
-def main():
-    # Build a single OpenAI client and reuse it (avoids proxies kwarg issues)
+# render(inputs) -> [(role, content)]; engine performs the call (see engines.py)
+Chain=namedtuple("Chain","render engine model temp prompt_path")
+
+def build_chains(args, hcp_llm=None, judge_llm=None):
+    # Injected chat models (tests, fakes) always run through the LangChain engine
+    Engine=ENGINES[args.engine]
+    hcp_engine=LangChainEngine(args.model, args.temp, args.stream, hcp_llm) if hcp_llm else Engine(args.model, args.temp, args.stream)
+    judge_engine=LangChainEngine(args.judge_model, 0.0, args.stream, judge_llm) if judge_llm else Engine(args.judge_model, 0.0, args.stream)
+    json_engine=LangChainEngine(args.judge_model, 0.0, args.stream, judge_llm, json_mode=True) if judge_llm else Engine(args.judge_model, 0.0, args.stream, json_mode=True)
+
+    # Prompt files are compiled once (prompt_compiler.py): the static prefix leads every request,
+    # per-case fields go in the last message
+    pv=prompt_vars(args)
+
+    # HCP chain
+    hcp_parts=[("system", compile_prompt(args.hcp_prompt_path, pv).prefix, None), ("user", None, "user_input")]
+    hcp_chain=Chain(hcp_engine.compile(hcp_parts), hcp_engine, args.model, args.temp, args.hcp_prompt_path)
+
+    # Judge chain; case_block is the compiled template rendered for one case (ctx.judge_prompt)
+    judge_system=compile_prompt(args.judge_prompt_path, pv).prefix
+    judge_parts=[("system", judge_system, None), ("user", JUDGE_REQ, None), ("user", None, "case_block")]
+    judge_chain=Chain(judge_engine.compile(judge_parts), judge_engine, args.judge_model, 0.0, args.judge_prompt_path)
+
+    # Packed judge chain (--judge_pack): same system prompt, K case blocks in (as JSON), JSON array out
+    pack_parts=[("system", judge_system, None), ("user", PACK_REQ, None), ("user", None, "case_block")]
+    pack_chain=Chain(judge_engine.compile(pack_parts), judge_engine, args.judge_model, 0.0, args.judge_prompt_path)
+
+    # Extra judge samples (--judge_samples): the single-case judge messages at --sample_temp
+    sample_chain=None
+    if args.judge_samples>1:
+        sample_engine=LangChainEngine(args.judge_model, args.sample_temp, args.stream, judge_llm) if judge_llm else Engine(args.judge_model, args.sample_temp, args.stream)
+        sample_chain=Chain(sample_engine.compile(judge_parts), sample_engine, args.judge_model, args.sample_temp, args.judge_prompt_path)
+
+    # Single-case judge messages in JSON mode, for replies with no parseable JSON object
+    json_chain=Chain(json_engine.compile(judge_parts), json_engine, args.judge_model, 0.0, args.judge_prompt_path)
+
+    # Multi-turn cases (conversation.py) build their message lists themselves
+    conv_chain=Chain(lambda inputs: inputs["messages"], hcp_engine, args.model, args.temp, args.hcp_prompt_path)
+    return hcp_chain, judge_chain, pack_chain, sample_chain, json_chain, conv_chain
+
+async def ainvoke_cached(ctx, chain, inputs, sample=0):
+    # Render the chain's messages and call its engine, but consult the response cache first and
+    # go through the model's scheduler (rate limits, adaptive in-flight window, retries with
+    # backoff; the SDK's own retries are off so they can be counted). sample > 0 marks a repeated
+    # draw of the same messages, cached under its own key.
+    msgs=chain.render(inputs)
+    key=cache_key(chain.model, chain.temp, msgs, [chain.prompt_path], sample, chain.engine.response_format)
+    t0=time.perf_counter()
+    cacheable=ctx.cache.covers(chain.temp)
+    hit=ctx.cache.get(key) if cacheable else None
+    if hit is not None:
+        return LLMResult(hit["content"], hit.get("usage"), True, time.perf_counter()-t0, None, 0)
+    # ctx.inflight (shared by the cells of a sweep): an identical request that is already in
+    # flight or done is awaited instead of sent again, and counted like a cache hit
+    fut=None
+    if ctx.inflight is not None:
+        if key in ctx.inflight:
+            content, usage=await asyncio.shield(ctx.inflight[key])
+            ctx.deduped+=1
+            return LLMResult(content, usage, True, time.perf_counter()-t0, None, 0)
+        fut=ctx.inflight[key]=asyncio.get_running_loop().create_future()
+
+    async def call():
+        content, usage, headers, ttft=await chain.engine.acall(msgs, ctx.args.stream)
+        used=usage["input_tokens"]+usage["output_tokens"] if usage else None
+        return (content, usage, ttft), headers, used
+
+    try:
+        (content, usage, ttft), retries=await ctx.schedulers.get(chain.model).run(call, estimate_tokens([c for _, c in msgs]))
+    except BaseException as e:
+        if fut:
+            del ctx.inflight[key]
+            fut.set_exception(e); fut.exception()  # waiters re-raise; no "never retrieved" warning
+        raise
+    if fut: fut.set_result((content, usage))
+    if cacheable:
+        ctx.cache.put(key, chain.model, {"content": content, "usage": usage})
+    return LLMResult(content, usage, False, time.perf_counter()-t0, ttft, retries)
+
+def parse_judge(jraw, eid):
+    j=extract_json(jraw, (dict,))
+    return j if j is not None else {
+        "eval_id":eid,
+        "findings":["Judge JSON parse failed"],
+        "rationale": (jraw or "")[:500],
+        "parse_error": True
+    }
+
+def normalize_judge(j, eid, judge_model):
+    # --- normalize (respect existing judge-provided score/pass if present) ---
+    judge_score = j.get("score")
+    try:
+        judge_score = int(judge_score) if judge_score is not None else None
+    except Exception:
+        judge_score = None
+    judge_pass = j.get("pass")
+    judge_pass = bool(judge_pass) if judge_pass is not None else None
+
+    score = judge_score if (isinstance(judge_score,int) and judge_score>=0) else 0
+    ow=(j.get("overall") or {}).get("weighted_score")
+    if not score and isinstance(ow,(int,float)):
+        score = int(round(ow*100)) if ow<=1.0 else int(round(ow))
+    if not score and isinstance(j.get("scores"),dict):
+        vals=[v for v in j["scores"].values() if isinstance(v,(int,float))]
+        if vals:
+            mx=max(vals); avg=sum(vals)/len(vals)
+            score = int(round(avg*100)) if mx<=1.0 else int(round(avg))
+
+    verdict=(j.get("overall") or {}).get("final_verdict","")
+    verdict = verdict.strip().lower() if isinstance(verdict,str) else ""
+    passed = judge_pass if judge_pass is not None else (verdict.startswith("pass") if verdict else (score>=80))
+
+    findings = j.get("findings") or []
+    if not findings and isinstance(j.get("evidence"),list):
+        findings=[f"{e.get('domain','?')}: {str(e.get('quote','')).strip()[:180]}" for e in j["evidence"][:3]]
+    rationale = (j.get("rationale") or j.get("notes","") or "").strip()
+
+    j.update({
+        "eval_id":eid,
+        "score": max(0, min(100, int(score))),
+        "pass": bool(passed),
+        "findings": findings,
+        "rationale": rationale,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "model": judge_model
+    })
+    return j
+
+def slim_judge(j):
+    return {k: j[k] for k in ("eval_id", "category", "score", "pass", "n_samples", "judge_usage", "parse_error") if k in j}
+
+def slim_gen(g):
+    out={"eval_id": g.get("eval_id"), "usage": g.get("usage")}
+    if g.get("turns"):
+        out["turns"]=[{k: t.get(k) for k in ("context_tokens", "compacted", "usage")} for t in g["turns"]]
+    return out
+
+class RunContext:
+    # Everything a case needs: args, chains, record store, cache and resume state. A sweep passes
+    # one scheduler pool, in-flight map and semaphore to all of its cells.
+    def __init__(self, args, chains, store, cache, done=None, schedulers=None, inflight=None, sem=None):
+        self.args=args
+        self.hcp_chain, self.judge_chain, self.pack_chain, self.sample_chain, self.json_chain, self.conv_chain = chains
+        self.store=store
+        self.cache=cache
+        pv=prompt_vars(args)
+        self.hcp_system=compile_prompt(args.hcp_prompt_path, pv).prefix
+        self.judge_prompt=compile_prompt(args.judge_prompt_path, pv)
+        self.gens, self.judged = done or ({}, {})
+        # Finished cases keep only what metrics.json needs; the full records are in the store
+        self.agg=RunAggregator()
+        for eid, j in self.judged.items():
+            self.agg.add(j)
+            self.judged[eid]=slim_judge(j)
+            if eid in self.gens: self.gens[eid]=slim_gen(self.gens[eid])
+        self.rejudged={"parse_failed": 0, "recovered": 0}
+        self.pack_fallbacks=0
+        self.calls=CallLog()
+        self.schedulers=schedulers or pool_from_args(args)
+        self.inflight=inflight
+        self.deduped=0
+        self.gen_replayed=0  # generations served from the cache or a shared in-flight call
+        self.sem=sem
+        self.pipeline=None
+        self.adaptive=None
+
+async def converse(ctx, ex):
+    # Multi-turn case: the HCP answers each scripted rep turn; the context is compacted (dropped
+    # or summarized) only when the next request would exceed --context_budget
+    hist=History(ctx.hcp_system, ctx.args.context_budget)
+    turns=[]
+    for rep in ex["turns"]:
+        dropped=hist.compact(rep)
+        if dropped and ctx.args.context_mode=="summarize":
+            res=await ainvoke_cached(ctx, ctx.conv_chain, {"messages": summary_messages(hist.summary, dropped)})
+            ctx.calls.add("summary", ctx.args.model, res)
+            hist.summary=res.content
+        msgs=hist.messages(rep)
+        res=await ainvoke_cached(ctx, ctx.conv_chain, {"messages": msgs})
+        ctx.gen_replayed+=res.cached
+        turns.append({"rep": rep, "hcp": res.content, "context_tokens": hist.size(rep), "compacted": bool(dropped),
+                      "usage": ctx.calls.add("gen", ctx.args.model, res)})
+        hist.add(rep, res.content)
+    return turns
+
+async def generate(ctx, ex):
+    # Reuse a finished gen file when resuming
+    eid=ex["eval_id"]
+    if eid in ctx.gens:
+        return ctx.gens[eid]["model_output"]
+    if ex.get("turns"):
+        turns=await converse(ctx, ex)
+        rec={
+            "eval_id":eid,"timestamp":datetime.now(timezone.utc).isoformat(),
+            "model":ctx.args.model,"temperature":ctx.args.temp,"category":ex.get("category",""),
+            "rep_input":ex["turns"][0],"model_output":transcript(turns),"turns":turns,
+            "usage":sum_usage([t["usage"] for t in turns])
+        }
+        ctx.store.put("gen", rec)
+        ctx.gens[eid]=rec
+        return rec["model_output"]
+    user_input=ex.get("prompt","")
+    res=await ainvoke_cached(ctx, ctx.hcp_chain, {"user_input": user_input})
+    ctx.gen_replayed+=res.cached
+    rec={
+        "eval_id":eid,"timestamp":datetime.now(timezone.utc).isoformat(),
+        "model":ctx.args.model,"temperature":ctx.args.temp,"category":ex.get("category",""),
+        "rep_input":user_input,"model_output":res.content,
+        "usage":ctx.calls.add("gen", ctx.args.model, res)
+    }
+    ctx.store.put("gen", rec)
+    ctx.gens[eid]=rec
+    return res.content
+
+def case_block(ex, gen_text):
+    block={
+        "eval_id":ex["eval_id"],"category":ex.get("category",""),
+        "rep_input":ex.get("prompt",""),"model_output":gen_text,
+        "evaluation_criteria":ex.get("criteria",[])
+    }
+    if ex.get("turns"):
+        block["format"]=f"multi-turn conversation, {len(ex['turns'])} rep turns; model_output is the full transcript"
+    return block
+
+async def judge_once(ctx, chain, block, eid, sample=0):
+    # One single-case judge call -> normalized judge dict. A reply with no parseable JSON object
+    # is requeued once to the JSON-mode judge (response_format json_object) instead of scoring 0.
+    res=await ainvoke_cached(ctx, chain, {"case_block": block}, sample)
+    usage=[ctx.calls.add("judge", ctx.args.judge_model, res)]
+    j=parse_judge(res.content, eid)
+    if j.get("parse_error"):
+        ctx.rejudged["parse_failed"]+=1
+        res=await ainvoke_cached(ctx, ctx.json_chain, {"case_block": block}, sample)
+        usage.append(ctx.calls.add("judge", ctx.args.judge_model, res))
+        j=parse_judge(res.content, eid)
+        if not j.get("parse_error"):
+            ctx.rejudged["recovered"]+=1
+            j["rejudged"]=True
+    j=normalize_judge(j, eid, ctx.args.judge_model)
+    j["judge_usage"]=usage[0] if len(usage)==1 else sum_usage(usage)
+    return j
 
+def record_judge(ctx, j):
+    # Final judge dict of a case: to the store and the running aggregate; the caller gets the
+    # slim copy (full records stay on disk, so memory does not grow with findings/rationales)
+    eid=j["eval_id"]
+    ctx.store.put("judge", j)
+    ctx.agg.add(j)
+    if eid in ctx.gens: ctx.gens[eid]=slim_gen(ctx.gens[eid])
+    return slim_judge(j)
+
+async def judge_turns(ctx, ex):
+    # --judge_per turn: one judge call per HCP reply, with the previous exchange as context
+    eid=ex["eval_id"]
+    turns=ctx.gens[eid]["turns"]
+    out=[]
+    for i, t in enumerate(turns):
+        block=case_block({**ex, "turns": None, "prompt": t["rep"]}, t["hcp"])
+        block["turn"]=f"{i+1} of {len(turns)}"
+        if i: block["previous_turn"]={"rep_input": turns[i-1]["rep"], "model_output": turns[i-1]["hcp"]}
+        out.append(await judge_once(ctx, ctx.judge_chain, ctx.judge_prompt.render(block), eid))
+    j=aggregate_turns(out[0], out)
+    j["category"]=ex.get("category","")
+    return record_judge(ctx, j)
+
+async def resample(ctx, ex, gen_text, j):
+    # --judge_samples: draw more judge samples while the verdict is ambiguous, then aggregate
+    # (see judge_samples.py); one-sample runs keep the judge dict as it is
+    if ctx.args.judge_samples<=1:
+        return j
+    eid=ex["eval_id"]
+    samples=[j]
+    block=ctx.judge_prompt.render(case_block(ex, gen_text))
+    while needs_more([score_pass(s) for s in samples], ctx.args):
+        samples.append(await judge_once(ctx, ctx.sample_chain, block, eid, sample=len(samples)))
+    return aggregate(j, samples)
+
+async def judge(ctx, ex, gen_text):
+    eid=ex["eval_id"]
+    if ex.get("turns") and ctx.args.judge_per=="turn" and ctx.gens.get(eid, {}).get("turns"):
+        return await judge_turns(ctx, ex)
+    j=await judge_once(ctx, ctx.judge_chain, ctx.judge_prompt.render(case_block(ex, gen_text)), eid)
+    j["category"]=ex.get("category","")
+    j=await resample(ctx, ex, gen_text, j)
+    return record_judge(ctx, j)
+
+async def judge_many(ctx, items):
+    # One packed judge call for several (ex, gen_text) cases; any case the reply does not
+    # cover with a well-formed element is re-judged on its own
+    if len(items)==1 or (ctx.args.judge_per=="turn" and any(ex.get("turns") for ex, _ in items)):
+        return [await judge(ctx, ex, gen_text) for ex, gen_text in items]
+    blocks=[case_block(ex, gen_text) for ex, gen_text in items]
+    res=await ainvoke_cached(ctx, ctx.pack_chain, {"case_block": pack_block(blocks)})
+    got=split_pack(res.content, [b["eval_id"] for b in blocks])
+    usage=ctx.calls.add("judge", ctx.args.judge_model, res, len(items))
+    out=[]
+    for ex, gen_text in items:
+        eid=ex["eval_id"]
+        if eid not in got:
+            ctx.pack_fallbacks+=1
+            out.append(await judge(ctx, ex, gen_text))
+            continue
+        j=normalize_judge(got[eid], eid, ctx.args.judge_model)
+        j["category"]=ex.get("category","")
+        j["judge_usage"]=usage
+        j=await resample(ctx, ex, gen_text, j)
+        out.append(record_judge(ctx, j))
+    return out
+
+class JudgePacker:
+    # Concurrency mode: holds finished generations until --judge_pack of them are waiting
+    # (or no more are coming), then judges them in one packed call
+    def __init__(self, ctx, expected, sem):
+        self.ctx=ctx; self.expected=expected; self.sem=sem; self.pending=[]
+
+    async def judge(self, ex, gen_text):
+        fut=asyncio.get_running_loop().create_future()
+        self.pending.append((ex, gen_text, fut)); self.expected-=1
+        if len(self.pending)>=self.ctx.args.judge_pack or self.expected<=0:
+            batch, self.pending = self.pending, []
+            try:
+                async with self.sem:
+                    res=await judge_many(self.ctx, [(e, g) for e, g, _ in batch])
+                for (_, _, f), j in zip(batch, res): f.set_result(j)
+            except Exception as e:
+                for _, _, f in batch:
+                    if not f.done(): f.set_exception(e)
+        return await fut
+
+async def run_cases(ctx, examples):
+    # At most --concurrency LLM calls in flight; results come back in dataset order
+    sem=ctx.sem or asyncio.Semaphore(max(1, ctx.args.concurrency))
+    packer=None
+    if ctx.args.judge_pack>1:
+        packer=JudgePacker(ctx, sum(1 for ex in examples if ex["eval_id"] not in ctx.judged), sem)
+    async def one(i, ex):
+        if ex["eval_id"] in ctx.judged:
+            return ctx.judged[ex["eval_id"]]
+        print(f"[{i}] {ex['eval_id']}", flush=True)
+        async with sem:
+            gen_text=await generate(ctx, ex)
+        if packer:
+            return await packer.judge(ex, gen_text)
+        async with sem:
+            return await judge(ctx, ex, gen_text)
+    return await asyncio.gather(*(one(i, ex) for i, ex in enumerate(examples, 1)))
+
+async def run_adaptive(ctx, examples):
+    # --target_ci: --concurrency workers take cases from a stratified sampler that stops handing
+    # them out once every category's pass-rate interval is narrow enough (adaptive.py)
+    sem=ctx.sem or asyncio.Semaphore(max(1, ctx.args.concurrency))
+    cost=lambda: sum(c["cost_usd"] or 0.0 for c in ctx.calls.calls)
+    sampler=StratifiedSampler(examples, ctx.args, cost, ctx.judged)
+    async def worker():
+        while (ex:=await sampler.next()) is not None:
+            print(f"[{sampler.issued}] {ex['eval_id']} ({ex.get('category') or '-'})", flush=True)
+            async with sem:
+                gen_text=await generate(ctx, ex)
+            async with sem:
+                j=await judge(ctx, ex, gen_text)
+            sampler.update(ex, j)
+    await asyncio.gather(*(worker() for _ in range(max(1, ctx.args.concurrency))))
+    ctx.adaptive=sampler.summary()
+    return sampler.results()
+
+class StageStats:
+    def __init__(self, name):
+        self.name=name; self.done=0; self.busy=0.0; self.idle=0.0
+
+    def line(self, wall):
+        rate=self.done/wall if wall else 0.0
+        # busy/idle are summed over the stage's workers
+        return f"{self.name}: {self.done} done, {rate:.2f}/s, busy {self.busy:.1f} worker-s, idle {self.idle:.1f} worker-s"
+
+async def run_pipeline(ctx, examples):
+    # Generation workers feed a bounded queue drained by a separate pool of judge workers,
+    # so neither model waits on the other. Idle = time blocked on the queue (empty for judges,
+    # full for generators).
+    args=ctx.args
+    results=[None]*len(examples)
+    todo=asyncio.Queue()
+    for i, ex in enumerate(examples):
+        if ex["eval_id"] in ctx.judged: results[i]=ctx.judged[ex["eval_id"]]
+        else: todo.put_nowait((i, ex))
+    n_judge=max(1, args.judge_workers or args.gen_workers)
+    handoff=asyncio.Queue(maxsize=args.queue_size or 2*n_judge)
+    gs, js = StageStats("gen"), StageStats("judge")
+    depth={"max":0, "sum":0, "samples":0}
+    t0=time.perf_counter()
+
+    def sample():
+        q=handoff.qsize(); depth["max"]=max(depth["max"], q); depth["sum"]+=q; depth["samples"]+=1
+
+    async def gen_worker():
+        while True:
+            try: i, ex = todo.get_nowait()
+            except asyncio.QueueEmpty: return
+            print(f"[{i+1}] {ex['eval_id']}", flush=True)
+            t=time.perf_counter(); gen_text=await generate(ctx, ex); gs.busy+=time.perf_counter()-t; gs.done+=1
+            t=time.perf_counter(); await handoff.put((i, ex, gen_text)); gs.idle+=time.perf_counter()-t
+            sample()
+
+    async def judge_worker():
+        # Takes up to --judge_pack items off the queue per judge call
+        stop=False
+        while not stop:
+            batch=[]
+            while len(batch)<max(1, args.judge_pack):
+                t=time.perf_counter(); item=await handoff.get(); js.idle+=time.perf_counter()-t
+                if item is None: stop=True; break
+                sample(); batch.append(item)
+            if not batch: return
+            t=time.perf_counter()
+            res=await judge_many(ctx, [(ex, gen_text) for _, ex, gen_text in batch])
+            for (i, _, _), j in zip(batch, res): results[i]=j
+            js.busy+=time.perf_counter()-t; js.done+=len(batch)
+
+    async def monitor():
+        while True:
+            await asyncio.sleep(args.log_every)
+            wall=time.perf_counter()-t0
+            print(f"[pipeline] queue {handoff.qsize()}/{handoff.maxsize} | {gs.line(wall)} | {js.line(wall)} | {ctx.agg.line()}", flush=True)
+
+    gen_tasks=[asyncio.create_task(gen_worker()) for _ in range(max(1, args.gen_workers))]
+    judge_tasks=[asyncio.create_task(judge_worker()) for _ in range(n_judge)]
+    mon=asyncio.create_task(monitor())
+    try:
+        await asyncio.gather(*gen_tasks)
+        for _ in judge_tasks: await handoff.put(None)
+        await asyncio.gather(*judge_tasks)
+    finally:
+        for t in gen_tasks+judge_tasks+[mon]: t.cancel()
+    wall=time.perf_counter()-t0
+    mean=depth["sum"]/depth["samples"] if depth["samples"] else 0.0
+    print(f"[pipeline] done in {wall:.1f}s | queue max {depth['max']}/{handoff.maxsize}, mean {mean:.1f}", flush=True)
+    print(f"[pipeline] {gs.line(wall)} | {js.line(wall)}", flush=True)
+    ctx.pipeline={"queue_max":depth["max"], "queue_mean":round(mean,2), "queue_size":handoff.maxsize,
+                  **{st.name:{"done":st.done, "per_s":round(st.done/wall,3) if wall else 0.0,
+                              "busy_worker_s":round(st.busy,2), "idle_worker_s":round(st.idle,2)} for st in (gs, js)}}
+    return results
+
+def build_parser():
     ap=argparse.ArgumentParser()
-    ap.add_argument("--dataset", default="eval/eval_set.jsonl")
+    ap.add_argument("--dataset", default="eval/eval_set.jsonl", help="JSONL, JSON array, per-case JSON files, a dir or a glob")
+    ap.add_argument("--shard", metavar="i/N", help="only run cases with hash(eval_id) %% N == i (0-based); combine with merge_runs.py")
     ap.add_argument("--hcp_prompt_path", default="prompt/hcp_system_prompt.md")
     ap.add_argument("--judge_prompt_path", default="prompt/judge_master.md")
     ap.add_argument("--outdir", default="results/run_latest")
     ap.add_argument("--model", default="gpt-4o")
     ap.add_argument("--judge_model", default="gpt-4o")
     ap.add_argument("--temp", type=float, default=0.6)
-    args=ap.parse_args()
+    ap.add_argument("--engine", choices=sorted(ENGINES), default="langchain", help="openai = call the openai SDK directly")
+    ap.add_argument("--concurrency", type=int, default=1, help="max LLM calls in flight (1 = serial)")
+    ap.add_argument("--gen_workers", type=int, default=0, help="pipelined mode: HCP generation workers")
+    ap.add_argument("--judge_workers", type=int, default=0, help="pipelined mode: judge workers (default = gen_workers)")
+    ap.add_argument("--queue_size", type=int, default=0, help="pipelined mode: gen->judge queue bound (default 2x judge_workers)")
+    ap.add_argument("--log_every", type=float, default=10.0, help="pipelined mode: seconds between queue/throughput logs")
+    ap.add_argument("--judge_pack", type=int, default=1, help="judge K cases per call (JSON array reply; malformed elements re-judged singly)")
+    ap.add_argument("--stream", action="store_true", help="stream responses (records time-to-first-token)")
+    ap.add_argument("--resume", metavar="RUN_DIR", help="continue an existing run dir (or 'latest'), skipping finished cases")
+    ap.add_argument("--report_layout", choices=LAYOUTS, default="auto", help="paged = chunked data + virtual-scrolling index (auto: for large runs)")
+    ap.add_argument("--store", choices=STORES, default="files", help="files = gen/ and judged/ JSON per case; jsonl[.gz] = one append-only run.jsonl")
+    add_sampling_args(ap)
+    add_adaptive_args(ap)
+    add_conversation_args(ap)
+    add_prompt_args(ap)
+    add_cache_args(ap)
+    add_scheduler_args(ap)
+    http_pool.add_http_args(ap)
+    return ap
 
+def run_dir(args):
+    if args.resume:
+        return resolve_run_dir(args.outdir, args.resume)
     stamp=datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-    base_out=os.path.join(args.outdir, stamp)
-    gen_dir=os.path.join(base_out,"gen"); judged_dir=os.path.join(base_out,"judged"); report_dir=os.path.join(base_out,"report")
-    ensure_dirs(gen_dir, judged_dir, report_dir)
+    if args.shard: stamp+=f"-shard{args.shard.replace('/','of')}"
+    return os.path.join(args.outdir, stamp)
 
-    # HCP chain
-    hcp_prompt=ChatPromptTemplate.from_messages([
-        ("system", _escape_curly(read(args.hcp_prompt_path))),
-        ("user", "{user_input}")
-    ])
-    hcp_llm=ChatOpenAI(model=args.model, temperature=args.temp)
-    hcp_chain=hcp_prompt|hcp_llm
-
-    # Judge chain
-    judge_prompt=ChatPromptTemplate.from_messages([
-        ("system", _escape_curly(read(args.judge_prompt_path))),
-        ("user",
-         "You are the compliance & clinical quality judge. "
-         "Return STRICT JSON with keys: eval_id (string), score (0-100 int), pass (bool), "
-         "findings (array of strings), rationale (string). No extra text."),
-        ("user", "{case_block}")
-    ])
-    judge_llm=ChatOpenAI(model=args.judge_model, temperature=0.0)
-    judge_chain=judge_prompt|judge_llm
-
-    judged=[]
-    with open(args.dataset,"r",encoding="utf-8") as f:
-        for i,line in enumerate(f,1):
-            ex=json.loads(line); eid=ex["eval_id"]; print(f"[{i}] {eid}", flush=True)
-
-            # Generate
-            user_input=ex.get("prompt","")
-            gen_text=hcp_chain.invoke({"user_input": user_input}).content
-            json.dump({
-                "eval_id":eid,"timestamp":datetime.now(timezone.utc).isoformat(),
-                "model":args.model,"temperature":args.temp,
-                "rep_input":user_input,"model_output":gen_text
-            }, open(os.path.join(gen_dir,f"{eid}.gen.json"),"w",encoding="utf-8"), ensure_ascii=False, indent=2)
-
-            # Judge
-            case_block=json.dumps({
-                "eval_id":eid,"category":ex.get("category",""),
-                "rep_input":user_input,"model_output":gen_text,
-                "evaluation_criteria":ex.get("criteria",[])
-            }, ensure_ascii=False)
-            jraw=judge_chain.invoke({"case_block": case_block}).content
-            try:
-                j=json.loads(jraw)
-            except Exception:
-                m=re.search(r"\{[\s\S]*\}",jraw)
-                j=json.loads(m.group(0)) if m else {
-                    "eval_id":eid,
-                    "findings":["Judge JSON parse failed"],
-                    "rationale": jraw[:500]
-                }
-
-            # --- normalize (respect existing judge-provided score/pass if present) ---
-            judge_score = j.get("score")
-            try:
-                judge_score = int(judge_score) if judge_score is not None else None
-            except Exception:
-                judge_score = None
-            judge_pass = j.get("pass")
-            judge_pass = bool(judge_pass) if judge_pass is not None else None
-
-            score = judge_score if (isinstance(judge_score,int) and judge_score>=0) else 0
-            ow=(j.get("overall") or {}).get("weighted_score")
-            if not score and isinstance(ow,(int,float)):
-                score = int(round(ow*100)) if ow<=1.0 else int(round(ow))
-            if not score and isinstance(j.get("scores"),dict):
-                vals=[v for v in j["scores"].values() if isinstance(v,(int,float))]
-                if vals:
-                    mx=max(vals); avg=sum(vals)/len(vals)
-                    score = int(round(avg*100)) if mx<=1.0 else int(round(avg))
-
-            verdict=(j.get("overall") or {}).get("final_verdict","")
-            verdict = verdict.strip().lower() if isinstance(verdict,str) else ""
-            passed = judge_pass if judge_pass is not None else (verdict.startswith("pass") if verdict else (score>=80))
-
-            findings = j.get("findings") or []
-            if not findings and isinstance(j.get("evidence"),list):
-                findings=[f"{e.get('domain','?')}: {str(e.get('quote','')).strip()[:180]}" for e in j["evidence"][:3]]
-            rationale = (j.get("rationale") or j.get("notes","") or "").strip()
-
-            j.update({
-                "eval_id":eid,
-                "score": max(0, min(100, int(score))),
-                "pass": bool(passed),
-                "findings": findings,
-                "rationale": rationale,
-                "timestamp": datetime.now(timezone.utc).isoformat(),
-                "model": args.judge_model
-            })
-            json.dump(j, open(os.path.join(judged_dir,f"{eid}.judge.json"),"w",encoding="utf-8"), ensure_ascii=False, indent=2)
-            judged.append(j)
-
-    # CSV with chat links
-    with open(os.path.join(report_dir,"summary.csv"),"w",encoding="utf-8") as w:
-        w.write("eval_id,score,pass,chat\n")
-        for x in judged:
-            w.write(f"{x['eval_id']},{int(x.get('score',0))},{bool(x.get('pass',False))},chat/{x['eval_id']}.html\n")
-
-    # HTML report
-    subprocess.run([sys.executable,"src/report_batch.py","--judged_glob",os.path.join(judged_dir,"*.judge.json"),"--outdir",report_dir], check=True)
-
-    # Chat pages (split theme/layout + labels; SR right/top, Dr left/below)
+def open_run(args, base_out, cache, hcp_llm=None, judge_llm=None, **shared):
+    # Store, chains, cases and resume state for one run dir -> (ctx, examples)
+    # First: a bad prompt, key or budget fails before the run dir exists
+    chains=build_chains(args, hcp_llm, judge_llm)
+    shard=parse_shard(args.shard) if args.shard else None
+    examples=list(iter_cases(args.dataset, shard))
+    check_budget(compile_prompt(args.hcp_prompt_path, prompt_vars(args)).prefix, examples, args.context_budget)
+    ensure_dirs(os.path.join(base_out,"report"))
+    store=open_store(base_out, args.store)
+    if shard: print(f"Shard {args.shard}: {len(examples)} cases", flush=True)
+
+    done=store.scan() if args.resume else None
+    if done:
+        todo=[ex for ex in examples if ex["eval_id"] not in done[1]]
+        rejudge=sum(1 for ex in todo if ex["eval_id"] in done[0])
+        print(f"Resuming {base_out}: {len(examples)-len(todo)} done, {rejudge} to re-judge, {len(todo)-rejudge} to generate", flush=True)
+    return RunContext(args, chains, store, cache, done, **shared), examples
+
+def finish_run(ctx, base_out, judged, wall, mode):
+    # metrics.json + report/ for a finished run -> (metrics, report)
+    args=ctx.args
+    # Per-call latency/tokens/cost roll-up (this invocation's calls; per-case rows come from the records)
+    m=write_metrics(os.path.join(base_out,"metrics.json"), ctx.calls,
+                    [case_metrics(ctx.gens.get(x["eval_id"]), x) for x in judged],
+                    created=datetime.now(timezone.utc).isoformat(), wall_s=round(wall,3), mode=mode,
+                    model=args.model, judge_model=args.judge_model, temperature=args.temp, n_cases=len(judged),
+                    dataset=args.dataset, shard=args.shard,
+                    prompts={"hcp": {"path": args.hcp_prompt_path, "sha256": file_hash(args.hcp_prompt_path)},
+                             "judge": {"path": args.judge_prompt_path, "sha256": file_hash(args.judge_prompt_path),
+                                       "prefix_chars": ctx.judge_prompt.info()["prefix_chars"], "case_fields": ctx.judge_prompt.info()["case_fields"]}},
+                    cache=ctx.cache.stats(), pipeline=ctx.pipeline, scheduler=ctx.schedulers.summary(), http=http_pool.stats(),
+                    aggregate=ctx.agg.summary(),
+                    **({"rejudged": ctx.rejudged} if ctx.rejudged["parse_failed"] else {}),
+                    **({"deduped_calls": ctx.deduped} if ctx.inflight is not None else {}),
+                    **({"gen_replayed": ctx.gen_replayed} if ctx.gen_replayed else {}),
+                    **({"judge_samples": sampling_summary(judged, args.judge_samples)} if args.judge_samples>1 else {}),
+                    **({"target_ci": ctx.adaptive} if ctx.adaptive else {}),
+                    **({"conversation": conv} if (conv:=conversation_summary(ctx.gens.get(x["eval_id"]) for x in judged)) else {}))
+    # index.html, summary.csv and chat pages, from one read of the run's records
+    rep=build_report(base_out, layout=args.report_layout)
+    return m, rep
+
+def main(argv=None, hcp_llm=None, judge_llm=None):
+    args=build_parser().parse_args(argv)
+    if args.target_ci and (args.gen_workers or args.judge_workers or args.judge_pack>1):
+        raise SystemExit("--target_ci runs case by case; drop --gen_workers/--judge_workers/--judge_pack")
+    http_pool.configure(args)
+    base_out=run_dir(args)
+    report_dir=os.path.join(base_out,"report")
+    cache=cache_from_args(args)
+    ctx, examples=open_run(args, base_out, cache, hcp_llm, judge_llm)
+    t0=time.perf_counter()
+    pipelined=args.gen_workers>0 or args.judge_workers>0
+    run=run_pipeline if pipelined else run_adaptive if args.target_ci else run_cases
+    try:
+        judged=asyncio.run(http_pool.closing(run(ctx, examples)))
+    finally:
+        ctx.store.close()
+        cache.close()
+    wall=time.perf_counter()-t0
+    mode=f"gen_workers={max(1,args.gen_workers)}, judge_workers={max(1,args.judge_workers or args.gen_workers)}" if pipelined else f"concurrency={args.concurrency}"
+    print(f"Ran {len(judged)} cases in {wall:.1f}s ({mode}): {ctx.agg.line()}", flush=True)
+    if ctx.rejudged["parse_failed"]:
+        print(f"Judge JSON: {ctx.rejudged['parse_failed']} unparseable replies re-judged in JSON mode, {ctx.rejudged['recovered']} recovered", flush=True)
+    print(f"Cache: {cache.stats()}", flush=True)
+    if ctx.gen_replayed:
+        print(f"Cache: {ctx.gen_replayed} HCP generations replayed from the cache (not re-sampled)", flush=True)
+    hs=http_pool.stats()
+    if hs["requests"]:
+        print(f"HTTP: {hs['requests']} requests over {hs['connections']} connections ({100*hs['reuse_ratio']:.0f}% reused, {hs['connect_s']:.2f}s connecting, http2={hs['http2']})", flush=True)
+    tok=[x["judge_usage"]["input_tokens"]+x["judge_usage"]["output_tokens"] for x in judged if x.get("judge_usage")]
+    if tok:
+        print(f"Judge tokens/case: {sum(tok)/len(tok):.0f} (pack {args.judge_pack}, {ctx.pack_fallbacks} single-case fallbacks)", flush=True)
+    if ctx.adaptive:
+        a=ctx.adaptive
+        print(f"Target CI {args.target_ci} ({a['stopped']}): evaluated {a['evaluated']}/{a['total']} cases ({100*a['fraction']:.0f}%)", flush=True)
+        for cat, c in a["categories"].items():
+            rate="-" if c["pass_rate"] is None else f"{100*c['pass_rate']:.0f}%"
+            print(f"  {cat[:40]:<40} {c['n']:>4}/{c['total']:<4} pass {rate:>4}  [{100*c['lo']:.0f}%, {100*c['hi']:.0f}%]", flush=True)
+    if args.judge_samples>1:
+        js=sampling_summary(judged, args.judge_samples)
+        print(f"Judge samples/case: {js['mean']:.2f} (max {args.judge_samples}; {js['resampled']} of {len(judged)} cases resampled)", flush=True)
+
+    m, rep=finish_run(ctx, base_out, judged, wall, mode)
+    for sc in ctx.schedulers.summary():
+        if sc["retries"]:
+            print(f"Scheduler {sc['model']}: {sc['throttles']} throttled, {sc['retries']} retries, window min {sc['window_min']} -> {sc['window']}", flush=True)
+    st=m["stages"]
+    ratios=[f"{k} {100*st[k]['cached_token_ratio']:.0f}%" for k in ("gen", "judge") if st.get(k, {}).get("cached_token_ratio") is not None]
+    if ratios:
+        print(f"Prompt cache: {', '.join(ratios)} of input tokens cached", flush=True)
+    cost=m["totals"]["cost_usd"]
+    print(f"Metrics: {m['totals']['tokens']} tokens, est. cost {'n/a' if cost is None else f'${cost:.4f}'}", flush=True)
+    print(f"Report: {rep['cases']} cases, {rep['pages']} chat pages in {rep['total_s']:.2f}s", flush=True)
     # latest symlink
     latest=os.path.join(args.outdir,"latest")
     try:
@@ -146,5 +612,6 @@ def main():
     print("  html:", os.path.join(report_dir,"index.html"))
     print("  chat:", os.path.join(report_dir,"chat","index.html"))
     print("  csv :", os.path.join(report_dir,"summary.csv"))
+    return base_out
 
 if __name__=="__main__": main()
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+import os, json, math, time, sqlite3, argparse, html
+from datetime import datetime, timezone
+from string import Template
+from run_store import open_store, find_log, load_json
+from dataset import iter_cases
+
+# SQLite index of every run under results/: run metadata (models, temperature, dataset, prompt
+# hashes, totals) plus one row per case (category, score, pass, findings). `ingest` only reads run
+# dirs that are new or changed since the last ingest (signature = metrics.json / judged/ /
+# run.jsonl stat), so it stays cheap with hundreds of runs. `compare A B` diffs two runs.
+
+DB_PATH = "results/index.sqlite"
+SKIP = {"gen", "judged", "report", "data", "chat", ".cache", "_batch_requests", "_local_batches"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  run_id TEXT PRIMARY KEY, name TEXT, created TEXT, sig TEXT, ingested REAL,
+  model TEXT, judge_model TEXT, temperature REAL, dataset TEXT, shard TEXT,
+  hcp_prompt TEXT, hcp_sha TEXT, judge_prompt TEXT, judge_sha TEXT,
+  n_cases INTEGER, n_pass INTEGER, avg_score REAL, cost_usd REAL
+);
+CREATE TABLE IF NOT EXISTS cases (
+  run_id TEXT, eval_id TEXT, category TEXT, score INTEGER, pass INTEGER, findings TEXT,
+  PRIMARY KEY (run_id, eval_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cases_eval ON cases(eval_id);
+CREATE INDEX IF NOT EXISTS runs_created ON runs(created);
+"""
+
+def connect(path=DB_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    db = sqlite3.connect(path)
+    db.row_factory = sqlite3.Row
+    db.executescript(SCHEMA)
+    return db
+
+def is_run(d):
+    return os.path.exists(os.path.join(d, "metrics.json")) or os.path.isdir(os.path.join(d, "judged")) or find_log(d)
+
+def discover(root, depth=4):
+    # Run dirs under root (results/<outdir>/<TIMESTAMP>, bench runs a level or two deeper)
+    seen = set()
+    def walk(d, level):
+        try:
+            entries = sorted(os.scandir(d), key=lambda e: e.name)
+        except OSError:
+            return
+        for e in entries:
+            if not e.is_dir() or e.name in SKIP:
+                continue
+            real = os.path.realpath(e.path)
+            if real in seen:
+                continue  # the "latest" symlink
+            seen.add(real)
+            if is_run(real):
+                yield real
+            elif level < depth:
+                yield from walk(real, level + 1)
+    yield from walk(root, 1)
+
+def signature(d):
+    parts = []
+    for p in (os.path.join(d, "metrics.json"), os.path.join(d, "judged"), find_log(d)):
+        if p and os.path.exists(p):
+            st = os.stat(p)
+            parts.append(f"{st.st_mtime_ns}:{st.st_size}")
+        else:
+            parts.append("-")
+    return "|".join(parts)
+
+def _categories(dataset):
+    try:
+        return {ex["eval_id"]: ex.get("category", "") for ex in iter_cases(dataset)}
+    except (SystemExit, OSError, ValueError):
+        return {}
+
+def _created(d, m):
+    if m.get("created"):
+        return m["created"]
+    try:
+        return datetime.strptime(os.path.basename(d)[:15], "%Y%m%d-%H%M%S").replace(tzinfo=timezone.utc).isoformat()
+    except ValueError:
+        return datetime.fromtimestamp(os.path.getmtime(d), timezone.utc).isoformat()
+
+def ingest_run(db, d, sig, default_dataset):
+    m = load_json(os.path.join(d, "metrics.json")) or {}
+    prompts = m.get("prompts") or {}
+    cats = None
+    rows, passes, total = [], 0, 0
+    for j in open_store(d).iter("judge"):
+        cat = j.get("category")
+        if cat is None:
+            if cats is None:
+                cats = _categories(m.get("dataset") or default_dataset)
+            cat = cats.get(j["eval_id"], "")
+        score, ok = int(j.get("score", 0) or 0), 1 if j.get("pass") else 0
+        findings = j.get("findings") if isinstance(j.get("findings"), list) else []
+        rows.append((d, j["eval_id"], cat, score, ok, json.dumps([str(f) for f in findings], ensure_ascii=False)))
+        passes += ok; total += score
+    db.execute("DELETE FROM cases WHERE run_id=?", (d,))
+    db.executemany("INSERT OR REPLACE INTO cases VALUES (?,?,?,?,?,?)", rows)
+    db.execute("INSERT OR REPLACE INTO runs VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", (
+        d, os.path.basename(d), _created(d, m), sig, time.time(),
+        m.get("model"), m.get("judge_model"), m.get("temperature"), m.get("dataset"), m.get("shard"),
+        (prompts.get("hcp") or {}).get("path"), (prompts.get("hcp") or {}).get("sha256"),
+        (prompts.get("judge") or {}).get("path"), (prompts.get("judge") or {}).get("sha256"),
+        len(rows), passes, round(total / len(rows), 2) if rows else None, (m.get("totals") or {}).get("cost_usd")))
+    return len(rows)
+
+def ingest(db, root="results", default_dataset="eval/eval_set.jsonl"):
+    # -> (runs ingested, runs pruned); unchanged runs cost three stat() calls each
+    known = {r["run_id"]: r["sig"] for r in db.execute("SELECT run_id, sig FROM runs")}
+    found, n = set(), 0
+    for d in discover(root):
+        found.add(d)
+        sig = signature(d)
+        if known.get(d) != sig:
+            ingest_run(db, d, sig, default_dataset)
+            n += 1
+    root_real = os.path.realpath(root) + os.sep
+    gone = [r for r in known if r.startswith(root_real) and r not in found]
+    for r in gone:
+        db.execute("DELETE FROM cases WHERE run_id=?", (r,))
+        db.execute("DELETE FROM runs WHERE run_id=?", (r,))
+    db.commit()
+    return n, len(gone)
+
+def resolve(db, spec):
+    # A run dir, "latest" / "latest~N" (by creation time) or a unique substring of the run name
+    if os.path.isdir(spec):
+        row = db.execute("SELECT * FROM runs WHERE run_id=?", (os.path.realpath(spec),)).fetchone()
+        if row: return row
+    if spec.startswith("latest"):
+        k = int(spec.split("~")[1]) if "~" in spec else 0
+        row = db.execute("SELECT * FROM runs ORDER BY created DESC LIMIT 1 OFFSET ?", (k,)).fetchone()
+        if row: return row
+    rows = db.execute("SELECT * FROM runs WHERE name LIKE ? ORDER BY created DESC", (f"%{spec}%",)).fetchall()
+    if len(rows) == 1:
+        return rows[0]
+    raise SystemExit(f"{spec!r} matches {len(rows)} indexed runs" + (": " + ", ".join(r["name"] for r in rows[:5]) if rows else ""))
+
+# --- statistics ---------------------------------------------------------------
+
+def binom_two_sided(k, n):
+    # Exact two-sided binomial test against p=0.5 (McNemar on flips, sign test on deltas)
+    if n == 0:
+        return 1.0
+    k = min(k, n - k)
+    return min(1.0, 2 * sum(math.comb(n, i) for i in range(k + 1)) / 2 ** n)
+
+def _cmp(rows):
+    # rows: (category, score_a, pass_a, score_b, pass_b)
+    n = len(rows)
+    up = sum(1 for r in rows if r[3] > r[1]); down = sum(1 for r in rows if r[3] < r[1])
+    f2p = sum(1 for r in rows if not r[2] and r[4]); p2f = sum(1 for r in rows if r[2] and not r[4])
+    mean = lambda i: round(sum(r[i] for r in rows) / n, 2) if n else None
+    rate = lambda i: round(100 * sum(r[i] for r in rows) / n, 1) if n else None
+    return {"n": n, "avg_a": mean(1), "avg_b": mean(3),
+            "delta": round(sum(r[3] - r[1] for r in rows) / n, 2) if n else None,
+            "pass_a": rate(2), "pass_b": rate(4), "fail_to_pass": f2p, "pass_to_fail": p2f,
+            "p_flips": round(binom_two_sided(f2p, f2p + p2f), 4), "p_scores": round(binom_two_sided(up, up + down), 4)}
+
+def compare(db, a, b, top=50):
+    q = ("SELECT x.eval_id, COALESCE(NULLIF(y.category,''), x.category) AS category, x.score AS sa, x.pass AS pa,"
+         " y.score AS sb, y.pass AS pb, x.findings AS fa, y.findings AS fb"
+         " FROM cases x JOIN cases y ON y.run_id=? AND y.eval_id=x.eval_id WHERE x.run_id=? ORDER BY x.eval_id")
+    rows = db.execute(q, (b["run_id"], a["run_id"])).fetchall()
+    only = lambda r1, r2: db.execute("SELECT COUNT(*) FROM cases WHERE run_id=? AND eval_id NOT IN "
+                                     "(SELECT eval_id FROM cases WHERE run_id=?)", (r1, r2)).fetchone()[0]
+    flat = [(r["category"] or "(none)", r["sa"], r["pa"], r["sb"], r["pb"]) for r in rows]
+    cats = {}
+    for f in flat:
+        cats.setdefault(f[0], []).append(f)
+    top_finding = lambda s: (json.loads(s or "[]") or [""])[0]
+    flips = [{"eval_id": r["eval_id"], "category": r["category"] or "", "score_a": r["sa"], "score_b": r["sb"],
+              "to": "pass" if r["pb"] else "fail", "finding_a": top_finding(r["fa"]), "finding_b": top_finding(r["fb"])}
+             for r in rows if r["pa"] != r["pb"]]
+    deltas = sorted(({"eval_id": r["eval_id"], "category": r["category"] or "", "score_a": r["sa"], "score_b": r["sb"],
+                      "delta": r["sb"] - r["sa"]} for r in rows), key=lambda x: x["delta"])
+    keys = ("name", "created", "model", "judge_model", "temperature", "dataset", "hcp_sha", "judge_sha")
+    return {"a": {k: a[k] for k in keys} | {"run_id": a["run_id"]}, "b": {k: b[k] for k in keys} | {"run_id": b["run_id"]},
+            "only_a": only(a["run_id"], b["run_id"]), "only_b": only(b["run_id"], a["run_id"]),
+            "overall": _cmp(flat), "categories": {c: _cmp(v) for c, v in sorted(cats.items())},
+            "flips": flips, "largest_drops": [d for d in deltas[:top] if d["delta"] < 0],
+            "largest_gains": [d for d in deltas[::-1][:top] if d["delta"] > 0]}
+
+# --- output -------------------------------------------------------------------
+
+HTML = Template("""<!doctype html><html><head>
+<meta charset="utf-8"><title>Compare — $a_name vs $b_name</title>
+<style>
+body{font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,sans-serif;margin:24px;background:#fafbff}
+h1{margin-top:0}
+.small{color:#666;font-size:12px}
+.kpi{display:flex;gap:16px;margin:12px 0;flex-wrap:wrap}
+.kpi .card{background:#fff;border:1px solid #eee;border-radius:12px;padding:12px 14px}
+table{border-collapse:collapse;width:100%;background:#fff;border:1px solid #eee;border-radius:12px;overflow:hidden;margin-bottom:20px}
+th,td{padding:8px 12px;border-bottom:1px solid #f0f0f0;text-align:left}
+.badge{padding:2px 8px;border-radius:999px;font-size:12px;font-weight:600}
+.pass{background:#e9f9ee;color:#127c3a;border:1px solid #bfe8cc}
+.fail{background:#fdeceb;color:#a31224;border:1px solid #f7c5ca}
+.up{color:#127c3a}.down{color:#a31224}
+.sig{font-weight:600}
+a{color:#2257d2;text-decoration:none}
+</style></head><body>
+<h1>Compare runs</h1>
+<div class="small">Generated: $now</div>
+<table><thead><tr><th></th><th>A</th><th>B</th></tr></thead><tbody>
+$config
+</tbody></table>
+<div class="kpi">
+  <div class="card">Cases in both: <b>$n</b> <span class="small">(only A: $only_a, only B: $only_b)</span></div>
+  <div class="card">Pass rate: <b>$pass_a% → $pass_b%</b></div>
+  <div class="card">Avg score: <b>$avg_a → $avg_b</b> (Δ $delta)</div>
+  <div class="card">Flips: <b class="up">$f2p fail→pass</b> · <b class="down">$p2f pass→fail</b> (McNemar p=$p_flips)</div>
+  <div class="card">Score sign test: p=$p_scores</div>
+</div>
+<h3>By category</h3>
+<table><thead><tr><th>Category</th><th>n</th><th>Avg A</th><th>Avg B</th><th>Δ</th><th>Pass A</th><th>Pass B</th>
+<th>F→P</th><th>P→F</th><th>p (flips)</th><th>p (scores)</th></tr></thead><tbody>
+$categories
+</tbody></table>
+<h3>Flipped cases ($n_flips)</h3>
+<table><thead><tr><th>Eval ID</th><th>Category</th><th>Score A → B</th><th>Now</th><th>Top finding A</th><th>Top finding B</th></tr></thead><tbody>
+$flips
+</tbody></table>
+<h3>Largest score drops</h3>
+<table><thead><tr><th>Eval ID</th><th>Category</th><th>Score A → B</th><th>Δ</th></tr></thead><tbody>
+$drops
+</tbody></table>
+<div class="small">p-values: exact two-sided binomial tests (McNemar on pass/fail flips, sign test on per-case score changes); bold = p &lt; 0.05.</div>
+</body></html>""")
+
+def _chat(run_id, eid):
+    p = os.path.join(run_id, "report", "chat", f"{eid}.html")
+    return f"<a href='{html.escape(p)}'>{html.escape(eid)}</a>" if os.path.exists(p) else html.escape(eid)
+
+def render_html(c):
+    e = html.escape
+    p = lambda v: f"<span class='sig'>{v}</span>" if v < 0.05 else str(v)
+    d = lambda v: "–" if v is None else f"<span class='{'up' if v > 0 else 'down' if v < 0 else ''}'>{v:+}</span>"
+    o = c["overall"]
+    config = "\n".join(f"<tr><td>{k}</td><td>{e(str(c['a'][k]))}</td><td>{e(str(c['b'][k]))}</td></tr>"
+                       for k in ("name", "created", "model", "judge_model", "temperature", "dataset", "hcp_sha", "judge_sha"))
+    cats = "\n".join(f"<tr><td>{e(k)}</td><td>{v['n']}</td><td>{v['avg_a']}</td><td>{v['avg_b']}</td><td>{d(v['delta'])}</td>"
+                     f"<td>{v['pass_a']}%</td><td>{v['pass_b']}%</td><td>{v['fail_to_pass']}</td><td>{v['pass_to_fail']}</td>"
+                     f"<td>{p(v['p_flips'])}</td><td>{p(v['p_scores'])}</td></tr>" for k, v in c["categories"].items())
+    flips = "\n".join(f"<tr><td>{_chat(c['b']['run_id'], f['eval_id'])}</td><td>{e(f['category'])}</td>"
+                      f"<td>{f['score_a']} → {f['score_b']}</td><td><span class='badge {f['to']}'>{f['to'].upper()}</span></td>"
+                      f"<td>{e(f['finding_a'])}</td><td>{e(f['finding_b'])}</td></tr>" for f in c["flips"])
+    drops = "\n".join(f"<tr><td>{_chat(c['b']['run_id'], x['eval_id'])}</td><td>{e(x['category'])}</td>"
+                      f"<td>{x['score_a']} → {x['score_b']}</td><td>{d(x['delta'])}</td></tr>" for x in c["largest_drops"])
+    return HTML.substitute(a_name=e(c["a"]["name"]), b_name=e(c["b"]["name"]), now=datetime.now(timezone.utc).isoformat(),
+                           config=config, n=o["n"], only_a=c["only_a"], only_b=c["only_b"],
+                           pass_a=o["pass_a"], pass_b=o["pass_b"], avg_a=o["avg_a"], avg_b=o["avg_b"], delta=d(o["delta"]),
+                           f2p=o["fail_to_pass"], p2f=o["pass_to_fail"], p_flips=p(o["p_flips"]), p_scores=p(o["p_scores"]),
+                           categories=cats, n_flips=len(c["flips"]), flips=flips, drops=drops)
+
+def print_compare(c):
+    o = c["overall"]
+    print(f"A: {c['a']['name']} ({c['a']['model']}, judge {c['a']['judge_model']}, T={c['a']['temperature']})")
+    print(f"B: {c['b']['name']} ({c['b']['model']}, judge {c['b']['judge_model']}, T={c['b']['temperature']})")
+    print(f"Cases in both: {o['n']} (only A: {c['only_a']}, only B: {c['only_b']})")
+    print(f"Pass rate {o['pass_a']}% -> {o['pass_b']}%, avg score {o['avg_a']} -> {o['avg_b']} (delta {o['delta']})")
+    print(f"Flips: {o['fail_to_pass']} fail->pass, {o['pass_to_fail']} pass->fail (McNemar p={o['p_flips']}); score sign test p={o['p_scores']}")
+    print(f"\n{'category':<32} {'n':>5} {'avg A':>7} {'avg B':>7} {'delta':>7} {'F->P':>5} {'P->F':>5} {'p':>7}")
+    for k, v in c["categories"].items():
+        print(f"{k[:32]:<32} {v['n']:>5} {v['avg_a']:>7} {v['avg_b']:>7} {v['delta']:>7} {v['fail_to_pass']:>5} {v['pass_to_fail']:>5} {v['p_flips']:>7}")
+
+def main():
+    ap = argparse.ArgumentParser(description="SQLite index of eval runs and run-to-run comparison")
+    ap.add_argument("--db", default=DB_PATH)
+    ap.add_argument("--root", default="results", help="directory scanned for run dirs")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    ing = sub.add_parser("ingest", help="index new or changed run dirs")
+    ing.add_argument("--dataset", default="eval/eval_set.jsonl", help="category fallback for runs without one")
+    ls = sub.add_parser("runs", help="list indexed runs, newest first")
+    ls.add_argument("-n", type=int, default=20)
+    ls.add_argument("--model")
+    cmp_ = sub.add_parser("compare", help="diff two runs: flips, score deltas by category, significance")
+    cmp_.add_argument("a", help="baseline: run dir, latest~N or unique name substring")
+    cmp_.add_argument("b", nargs="?", default="latest", help="candidate (default: latest)")
+    cmp_.add_argument("--out", help="HTML diff report (default: results/compare/<A>_vs_<B>.html)")
+    cmp_.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = ap.parse_args()
+
+    db = connect(args.db)
+    t0 = time.perf_counter()
+    n, pruned = ingest(db, args.root, getattr(args, "dataset", "eval/eval_set.jsonl"))
+    if args.cmd == "ingest":
+        total = db.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
+        print(f"Ingested {n} new/changed runs, pruned {pruned}; {total} runs indexed ({time.perf_counter() - t0:.3f}s)")
+    elif args.cmd == "runs":
+        q, params = "SELECT * FROM runs", []
+        if args.model:
+            q += " WHERE model=? OR judge_model=?"; params = [args.model, args.model]
+        print(f"{'name':<28} {'created':<20} {'model':<14} {'judge':<14} {'T':>4} {'cases':>6} {'pass%':>6} {'avg':>6}")
+        for r in db.execute(q + " ORDER BY created DESC LIMIT ?", params + [args.n]):
+            rate = round(100 * r["n_pass"] / r["n_cases"], 1) if r["n_cases"] else 0
+            print(f"{r['name'][:28]:<28} {(r['created'] or '')[:19]:<20} {str(r['model'])[:14]:<14} {str(r['judge_model'])[:14]:<14} "
+                  f"{'' if r['temperature'] is None else r['temperature']:>4} {r['n_cases']:>6} {rate:>6} {r['avg_score'] or 0:>6}")
+    else:
+        a, b = resolve(db, args.a), resolve(db, args.b)
+        c = compare(db, a, b)
+        if args.json:
+            print(json.dumps(c, ensure_ascii=False, indent=2))
+        else:
+            print_compare(c)
+        out = args.out or os.path.join(args.root, "compare", f"{a['name']}_vs_{b['name']}.html")
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w", encoding="utf-8") as f:
+            f.write(render_html(c))
+        if not args.json:
+            print(f"\nDiff report: {out}")
+
+if __name__ == "__main__":
+    main()
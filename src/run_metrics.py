@@ -0,0 +1,113 @@
+import json, math
+from collections import namedtuple
+
+# One LLM call as seen by the harness. usage = {"input_tokens", "output_tokens", "cached_tokens"} or None;
+# latency/ttft in seconds (ttft only when streaming); retries = attempts beyond the first.
+LLMResult = namedtuple("LLMResult", "content usage cached latency ttft retries")
+
+# USD per 1M tokens (input, output, cached input). Longest matching prefix wins; unknown models cost None.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60, 0.075),
+    "gpt-4o": (2.50, 10.00, 1.25),
+    "gpt-4.1-nano": (0.10, 0.40, 0.025),
+    "gpt-4.1-mini": (0.40, 1.60, 0.10),
+    "gpt-4.1": (2.00, 8.00, 0.50),
+    "gpt-4-turbo": (10.00, 30.00, 10.00),
+    "gpt-3.5-turbo": (0.50, 1.50, 0.50),
+}
+
+def price_for(model):
+    best = max((k for k in PRICES if (model or "").startswith(k)), key=len, default=None)
+    return PRICES.get(best)
+
+def estimate_cost(model, usage):
+    p = price_for(model)
+    if not p or not usage:
+        return None
+    cached = usage.get("cached_tokens") or 0
+    return round(((usage.get("input_tokens", 0) - cached) * p[0] + cached * p[2] + usage.get("output_tokens", 0) * p[1]) / 1e6, 6)
+
+def percentile(vals, p):
+    vals = sorted(vals)
+    if not vals:
+        return None
+    k = (len(vals) - 1) * p / 100.0
+    lo, hi = math.floor(k), math.ceil(k)
+    return vals[lo] + (vals[hi] - vals[lo]) * (k - lo)
+
+def latency_summary(vals):
+    if not vals:
+        return {"p50": None, "p95": None, "max": None, "mean": None}
+    return {"p50": round(percentile(vals, 50), 3), "p95": round(percentile(vals, 95), 3),
+            "max": round(max(vals), 3), "mean": round(sum(vals) / len(vals), 3)}
+
+def cached_share(calls):
+    # Prompt-cache hits among the input tokens actually sent (response-cache hits excluded), over
+    # the calls whose provider reported them (LangChain streaming does not)
+    known = [c for c in calls if c.get("cached_tokens") is not None]
+    inp, cached = sum(c["input_tokens"] for c in known), sum(c["cached_tokens"] for c in known)
+    return {"cached_tokens": cached, "cached_token_ratio": round(cached / inp, 4) if inp else None}
+
+class CallLog:
+    # Every LLM call of a run, per stage ("gen", "judge"); feeds metrics.json
+    def __init__(self):
+        self.calls = []
+
+    def add(self, stage, model, res, n=1):
+        # Returns the per-case share of the call (tokens and cost split over the n cases it served)
+        u = res.usage or {}
+        cost = 0.0 if res.cached else estimate_cost(model, res.usage)
+        self.calls.append({"stage": stage, "model": model, "cases": n, "cached": res.cached,
+                           "latency_s": round(res.latency, 4), "ttft_s": None if res.ttft is None else round(res.ttft, 4),
+                           "input_tokens": u.get("input_tokens", 0), "output_tokens": u.get("output_tokens", 0),
+                           "cached_tokens": u.get("cached_tokens"), "cost_usd": cost, "retries": res.retries})
+        return {"input_tokens": round(u.get("input_tokens", 0) / n, 1),
+                "output_tokens": round(u.get("output_tokens", 0) / n, 1),
+                "cached_tokens": None if u.get("cached_tokens") is None else round(u["cached_tokens"] / n, 1),
+                "cost_usd": None if cost is None else round(cost / n, 6),
+                "latency_s": round(res.latency, 4),
+                "ttft_s": None if res.ttft is None else round(res.ttft, 4),
+                "retries": res.retries, "cached": res.cached, "pack": n}
+
+    def summary(self):
+        out = {}
+        for stage in sorted({c["stage"] for c in self.calls}):
+            cs = [c for c in self.calls if c["stage"] == stage]
+            live = [c for c in cs if not c["cached"]]
+            costs = [c["cost_usd"] for c in live if c["cost_usd"] is not None]
+            out[stage] = {
+                "calls": len(cs), "cached_calls": len(cs) - len(live),
+                "latency_s": latency_summary([c["latency_s"] for c in live]),
+                "ttft_s": latency_summary([c["ttft_s"] for c in live if c["ttft_s"] is not None]),
+                "input_tokens": sum(c["input_tokens"] for c in live),
+                "output_tokens": sum(c["output_tokens"] for c in live),
+                **cached_share(live),
+                "cost_usd": round(sum(costs), 4) if costs else None,
+                "retries": sum(c["retries"] for c in cs),
+            }
+        return out
+
+def case_metrics(gen, judged):
+    # Per-case roll-up from the usage stored on the gen/judge records
+    gu, ju = (gen or {}).get("usage") or {}, (judged or {}).get("judge_usage") or {}
+    cost = [x for x in (gu.get("cost_usd"), ju.get("cost_usd")) if x is not None]
+    return {
+        "eval_id": (judged or gen or {}).get("eval_id"),
+        "gen_latency_s": gu.get("latency_s"), "judge_latency_s": ju.get("latency_s"),
+        "latency_s": round((gu.get("latency_s") or 0) + (ju.get("latency_s") or 0), 4),
+        "tokens": round(sum(u.get(k, 0) or 0 for u in (gu, ju) for k in ("input_tokens", "output_tokens"))),
+        "cost_usd": round(sum(cost), 6) if cost else None,
+    }
+
+def write_metrics(path, calls, cases, **extra):
+    totals = {"input_tokens": sum(c["input_tokens"] for c in calls.calls if not c["cached"]),
+              "output_tokens": sum(c["output_tokens"] for c in calls.calls if not c["cached"])}
+    costs = [c["cost_usd"] for c in calls.calls if c["cost_usd"] is not None]
+    totals.update(cached_share([c for c in calls.calls if not c["cached"]]))
+    totals["tokens"] = totals["input_tokens"] + totals["output_tokens"]
+    totals["cost_usd"] = round(sum(costs), 4) if costs else None
+    totals["case_latency_s"] = latency_summary([c["latency_s"] for c in cases if c.get("latency_s")])
+    data = dict(extra, totals=totals, stages=calls.summary(), cases=cases)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    return data
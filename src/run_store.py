@@ -0,0 +1,269 @@
+import os, json, glob, gzip, zlib
+
+def write_json_atomic(path, obj, indent=2):
+    # Temp file in the same dir + rename: readers never see a half-written JSON.
+    # The temp name ends in .tmp so "*.gen.json"/"*.judge.json" globs skip it.
+    d, name = os.path.split(path)
+    tmp = os.path.join(d, f".{name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=indent)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+def load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            j = json.load(f)
+        return j if isinstance(j, dict) else None
+    except Exception:
+        return None
+
+def valid_gen(j):
+    return bool(j) and isinstance(j.get("model_output"), str) and bool(j["model_output"].strip())
+
+def valid_judge(j):
+    return bool(j) and isinstance(j.get("score"), int) and isinstance(j.get("pass"), bool)
+
+def load_gen(path):
+    j = load_json(path)
+    return j if valid_gen(j) else None
+
+def load_judge(path):
+    j = load_json(path)
+    return j if valid_judge(j) else None
+
+def scan_run(base):
+    # {eval_id: record} for every valid gen/judge file already in a run dir
+    gens, judged = {}, {}
+    for p in glob.glob(os.path.join(base, "gen", "*.gen.json")):
+        j = load_gen(p)
+        if j: gens[j.get("eval_id") or os.path.basename(p)[:-len(".gen.json")]] = j
+    for p in glob.glob(os.path.join(base, "judged", "*.judge.json")):
+        j = load_judge(p)
+        if j: judged[j.get("eval_id") or os.path.basename(p)[:-len(".judge.json")]] = j
+    return gens, judged
+
+def resolve_run_dir(outdir, resume):
+    # "latest" -> the latest symlink, else the newest timestamped dir under outdir
+    if resume != "latest":
+        if not os.path.isdir(resume):
+            raise SystemExit(f"--resume: no such run directory: {resume}")
+        return resume.rstrip("/")
+    latest = os.path.join(outdir, "latest")
+    if os.path.isdir(latest):
+        return os.path.realpath(latest)
+    runs = sorted(d for d in glob.glob(os.path.join(outdir, "*", "")) if os.path.isdir(os.path.join(d, "gen")) or find_log(d))
+    if not runs:
+        raise SystemExit(f"--resume latest: no runs found under {outdir}")
+    return runs[-1].rstrip("/")
+
+# --- storage backends -------------------------------------------------------
+# Both expose put(kind, rec) / get(kind, eid) / iter(kind) / ids(kind) / get_many(kind, eids) /
+# scan() / checkpoint() / close() with kind "gen" or "judge"; open_store() picks the one a run
+# dir already uses. get_many streams records in the given order (None for a missing one), so a
+# report can walk a run sorted by eval_id without holding it in memory.
+
+LOG_NAMES = ("run.jsonl", "run.jsonl.gz")
+STORES = ("files", "jsonl", "jsonl.gz")
+
+class FileStore:
+    # The per-file layout: gen/<id>.gen.json and judged/<id>.judge.json, each written atomically
+    DIRS = {"gen": ("gen", ".gen.json"), "judge": ("judged", ".judge.json")}
+
+    def __init__(self, base):
+        self.base = base
+
+    def path(self, kind, eid):
+        d, ext = self.DIRS[kind]
+        return os.path.join(self.base, d, f"{eid}{ext}")
+
+    def put(self, kind, rec):
+        p = self.path(kind, rec["eval_id"])
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        write_json_atomic(p, rec)
+
+    def get(self, kind, eid):
+        return load_json(self.path(kind, eid))
+
+    def iter(self, kind):
+        d, ext = self.DIRS[kind]
+        for p in sorted(glob.glob(os.path.join(self.base, d, f"*{ext}"))):
+            j = load_json(p)
+            if j is not None:
+                j.setdefault("eval_id", os.path.basename(p)[:-len(ext)])
+                yield j
+
+    def ids(self, kind):
+        d, ext = self.DIRS[kind]
+        return [os.path.basename(p)[:-len(ext)] for p in glob.glob(os.path.join(self.base, d, f"*{ext}"))]
+
+    def get_many(self, kind, eids):
+        for eid in eids:
+            j = self.get(kind, eid)
+            if j is not None:
+                j.setdefault("eval_id", eid)
+            yield j
+
+    def scan(self):
+        return scan_run(self.base)
+
+    def checkpoint(self):
+        pass
+
+    def close(self):
+        pass
+
+def _gz_members(f, start):
+    # (offset, end, payload) per gzip member from start; stops at a torn or corrupt tail
+    f.seek(start)
+    off, buf = start, b""
+    while True:
+        d, out, begin = zlib.decompressobj(31), [], off
+        try:
+            while not d.eof:
+                if not buf:
+                    buf = f.read(1 << 16)
+                    if not buf:
+                        return
+                out.append(d.decompress(buf))
+                rest = d.unused_data if d.eof else b""
+                off += len(buf) - len(rest)
+                buf = rest
+        except zlib.error:
+            return
+        yield begin, off, b"".join(out)
+
+def _lines(f, start):
+    # (offset, end, line) per complete line from start; a last line without "\n" is torn
+    f.seek(start)
+    off = start
+    for line in iter(f.readline, b""):
+        if not line.endswith(b"\n"):
+            return
+        yield off, off + len(line), line
+        off += len(line)
+
+class RunLog:
+    # Append-only run.jsonl (or run.jsonl.gz): one {"kind", "eval_id", "rec"} line per record, the
+    # last line for a (kind, eval_id) wins. run.idx.json maps kind -> eval_id -> byte offset; in
+    # the .gz variant every line is its own gzip member, so offsets stay seekable and the file is
+    # still one valid gzip stream. Writes are buffered; data is fsync'd and the index saved every
+    # checkpoint_every records and on close. A torn tail left by a crash is cut off on the next append.
+    def __init__(self, base, compress=False, checkpoint_every=200):
+        self.base = base
+        self.path = find_log(base) or os.path.join(base, LOG_NAMES[1] if compress else LOG_NAMES[0])
+        self.gz = self.path.endswith(".gz")
+        self.idx_path = os.path.join(base, "run.idx.json")
+        self.every, self.pending, self.f = checkpoint_every, 0, None
+        self.index, self.size = {"gen": {}, "judge": {}}, 0
+        if os.path.exists(self.path):
+            self._load_index()
+
+    def _records(self, f, start=0):
+        # (offset, end, {"kind", "eval_id", "rec"}) in file order
+        for off, end, raw in (_gz_members(f, start) if self.gz else _lines(f, start)):
+            try:
+                r = json.loads(raw)
+            except ValueError:
+                return
+            yield off, end, r
+
+    def _load_index(self):
+        idx = load_json(self.idx_path) or {}
+        real = os.path.getsize(self.path)
+        if idx.get("file") == os.path.basename(self.path) and 0 < idx.get("size", 0) <= real:
+            self.index = {"gen": {}, "judge": {}, **idx["offsets"]}
+            self.size = idx["size"]
+        if self.size < real:
+            # Records appended after the last checkpoint (or no index at all): scan only that tail
+            with open(self.path, "rb") as f:
+                for off, end, r in self._records(f, self.size):
+                    self.index.setdefault(r["kind"], {})[r["eval_id"]] = off
+                    self.size = end
+
+    def _read_at(self, f, off):
+        for _, _, r in self._records(f, off):
+            return r
+
+    def put(self, kind, rec):
+        if self.f is None:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.size:
+                os.truncate(self.path, self.size)
+            self.f = open(self.path, "ab", buffering=1 << 20)
+        line = json.dumps({"kind": kind, "eval_id": rec["eval_id"], "rec": rec}, ensure_ascii=False, separators=(",", ":")) + "\n"
+        data = line.encode("utf-8")
+        if self.gz:
+            data = gzip.compress(data, compresslevel=6, mtime=0)
+        self.f.write(data)
+        self.index.setdefault(kind, {})[rec["eval_id"]] = self.size
+        self.size += len(data)
+        self.pending += 1
+        if self.pending >= self.every:
+            self.checkpoint()
+
+    def get(self, kind, eid):
+        off = self.index.get(kind, {}).get(eid)
+        if off is None:
+            return None
+        if self.f: self.f.flush()
+        with open(self.path, "rb") as f:
+            r = self._read_at(f, off)
+        return r["rec"] if r else None
+
+    def iter(self, kind):
+        # Streams the current record of each eval_id, in the order they were last written
+        if not os.path.exists(self.path):
+            return
+        if self.f: self.f.flush()
+        live = self.index.get(kind, {})
+        with open(self.path, "rb") as f:
+            for off, end, r in self._records(f):
+                if end > self.size:
+                    return
+                if r.get("kind") == kind and live.get(r.get("eval_id")) == off:
+                    yield r["rec"]
+
+    def ids(self, kind):
+        return list(self.index.get(kind, {}))
+
+    def get_many(self, kind, eids):
+        # One open file for the whole walk, seeking to each record's offset
+        if self.f: self.f.flush()
+        live = self.index.get(kind, {})
+        with open(self.path, "rb") if os.path.exists(self.path) else open(os.devnull, "rb") as f:
+            for eid in eids:
+                off = live.get(eid)
+                r = self._read_at(f, off) if off is not None else None
+                yield r["rec"] if r else None
+
+    def scan(self):
+        gens = {j["eval_id"]: j for j in self.iter("gen") if valid_gen(j)}
+        judged = {j["eval_id"]: j for j in self.iter("judge") if valid_judge(j)}
+        return gens, judged
+
+    def checkpoint(self):
+        if self.f is None:
+            return
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        write_json_atomic(self.idx_path, {"file": os.path.basename(self.path), "size": self.size, "offsets": self.index}, indent=None)
+        self.pending = 0
+
+    def close(self):
+        if self.f is not None:
+            self.checkpoint()
+            self.f.close()
+            self.f = None
+
+def find_log(base):
+    for name in LOG_NAMES:
+        if os.path.exists(os.path.join(base, name)):
+            return os.path.join(base, name)
+    return None
+
+def open_store(base, store="files"):
+    # A run dir that already has a run.jsonl[.gz] keeps using it, whatever store is asked for
+    if find_log(base) or store in ("jsonl", "jsonl.gz"):
+        return RunLog(base, compress=store == "jsonl.gz")
+    return FileStore(base)
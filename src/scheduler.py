@@ -0,0 +1,210 @@
+import asyncio, random, re, threading, time
+
+def _retryable(e):
+    # openai is imported lazily: by the time a call has failed, the SDK is loaded anyway
+    import openai
+    return isinstance(e, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError))
+
+def _throttled(e):
+    import openai
+    return isinstance(e, openai.RateLimitError)
+
+def parse_reset(v):
+    # OpenAI reset headers look like "1s", "6m0s", "20ms", "0.5s"
+    if not v:
+        return None
+    try:
+        return float(v)
+    except ValueError:
+        pass
+    total = 0.0
+    for num, unit in re.findall(r"([\d.]+)(ms|s|m|h)", v):
+        total += float(num) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return total
+
+def _int(v):
+    try:
+        return int(float(v))
+    except (TypeError, ValueError):
+        return None
+
+def estimate_tokens(texts, expected_output=300):
+    return sum(len(t) for t in texts) // 4 + expected_output
+
+class TokenBucket:
+    # per_min units/minute with ~10s of burst; reserve() goes into debt and returns the wait
+    def __init__(self, per_min):
+        self.lock = threading.Lock()
+        self.set_rate(per_min)
+        self.tokens = self.capacity
+        self.t = time.monotonic()
+
+    def set_rate(self, per_min):
+        self.per_min = per_min
+        self.rate = per_min / 60.0
+        self.capacity = max(1.0, per_min / 6.0)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+
+    def reserve(self, n):
+        with self.lock:
+            self._refill()
+            self.tokens -= n
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def adjust(self, n):
+        # Correct an earlier estimate once the real usage is known (negative n refunds)
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+
+class Scheduler:
+    # One per model: token buckets on requests/min and tokens/min, an AIMD in-flight window
+    # steered by 429s and the x-ratelimit-* headers, and jittered exponential backoff for
+    # retryable errors. rpm/tpm = 0 means "learn the limit from the headers".
+    def __init__(self, model, rpm=0, tpm=0, max_in_flight=64, max_retries=2, base_delay=0.5, max_delay=30.0):
+        self.model = model
+        self.rpm = TokenBucket(rpm) if rpm else None
+        self.tpm = TokenBucket(tpm) if tpm else None
+        self.max_in_flight = max(1, max_in_flight)
+        self.window = float(min(4, self.max_in_flight))
+        self.window_min = self.window
+        self.slow_start = True  # grow by 1 per success until the first congestion signal
+        self.max_retries, self.base_delay, self.max_delay = max_retries, base_delay, max_delay
+        self.in_flight = 0
+        self.retries = 0
+        self.events = []
+        self._cond = None
+        self._lock = threading.Lock()
+
+    # --- AIMD window --------------------------------------------------------
+    def _on_success(self, headers):
+        h = {k.lower(): v for k, v in (headers or {}).items()}
+        lim_r, rem_r = _int(h.get("x-ratelimit-limit-requests")), _int(h.get("x-ratelimit-remaining-requests"))
+        lim_t, rem_t = _int(h.get("x-ratelimit-limit-tokens")), _int(h.get("x-ratelimit-remaining-tokens"))
+        with self._lock:
+            if lim_r and self.rpm is None: self.rpm = TokenBucket(lim_r)
+            if lim_t and self.tpm is None: self.tpm = TokenBucket(lim_t)
+            low = (lim_r and rem_r is not None and rem_r < 0.1 * lim_r) or (lim_t and rem_t is not None and rem_t < 0.1 * lim_t)
+            if low:
+                self.window = max(1.0, self.window * 0.75)
+                self.window_min = min(self.window_min, self.window)
+                self.slow_start = False
+            else:
+                step = 1.0 if self.slow_start else 1.0 / self.window
+                self.window = min(float(self.max_in_flight), self.window + step)
+
+    def _on_error(self, e, attempt):
+        # -> seconds to wait before the retry
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        throttled = _throttled(e)
+        retry_after = parse_reset(headers.get("retry-after"))
+        if throttled and not retry_after:
+            retry_after = parse_reset(headers.get("x-ratelimit-reset-requests"))
+        with self._lock:
+            if throttled:
+                self.window = max(1.0, self.window / 2)
+                self.window_min = min(self.window_min, self.window)
+                self.slow_start = False
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if retry_after:
+                delay = max(delay, min(self.max_delay, retry_after))
+            self.retries += 1
+            self.events.append({"t": round(time.time(), 3), "model": self.model, "kind": type(e).__name__,
+                                "attempt": attempt + 1, "retry_in_s": round(delay, 3), "window": round(self.window, 2)})
+        return delay
+
+    # --- async path ---------------------------------------------------------
+    async def _acquire(self, est_tokens):
+        wait = max(self.rpm.reserve(1) if self.rpm else 0.0, self.tpm.reserve(est_tokens) if self.tpm else 0.0)
+        if wait:
+            await asyncio.sleep(wait)
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < max(1, int(self.window)))
+            self.in_flight += 1
+
+    async def _release(self):
+        # Count first: if the notify below is itself cancelled the slot is still returned
+        self.in_flight -= 1
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def run(self, call, est_tokens=0):
+        # call: async () -> (result, headers, used_tokens or None). Returns (result, retries).
+        attempt = 0
+        while True:
+            await self._acquire(est_tokens)
+            try:
+                result, headers, used = await call()
+            except Exception as e:
+                if not _retryable(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._on_error(e, attempt)
+            else:
+                delay = None
+            finally:
+                # Also on cancellation (early stop, shutdown, Ctrl-C), which is not an Exception
+                await self._release()
+            if delay is not None:
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            if self.tpm and used is not None:
+                self.tpm.adjust(used - est_tokens)
+            self._on_success(headers)
+            return result, attempt
+
+    # --- sync path (sequential callers, e.g. judge_batch.py) ----------------
+    def run_sync(self, call, est_tokens=0):
+        attempt = 0
+        while True:
+            wait = max(self.rpm.reserve(1) if self.rpm else 0.0, self.tpm.reserve(est_tokens) if self.tpm else 0.0)
+            if wait:
+                time.sleep(wait)
+            try:
+                result, headers, used = call()
+            except Exception as e:
+                if not _retryable(e) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._on_error(e, attempt))
+                attempt += 1
+                continue
+            if self.tpm and used is not None:
+                self.tpm.adjust(used - est_tokens)
+            self._on_success(headers)
+            return result, attempt
+
+    def summary(self):
+        throttles = sum(1 for e in self.events if e["kind"] == "RateLimitError")
+        return {"model": self.model, "retries": self.retries, "throttles": throttles,
+                "window": round(self.window, 2), "window_min": round(self.window_min, 2),
+                "rpm": self.rpm.per_min if self.rpm else None, "tpm": self.tpm.per_min if self.tpm else None,
+                "events": self.events[-200:]}
+
+class SchedulerPool:
+    # Schedulers keyed by model, so stages sharing a model share one set of limits
+    def __init__(self, **kw):
+        self.kw = kw
+        self.by_model = {}
+
+    def get(self, model):
+        if model not in self.by_model:
+            self.by_model[model] = Scheduler(model, **self.kw)
+        return self.by_model[model]
+
+    def summary(self):
+        return [s.summary() for s in self.by_model.values()]
+
+def add_scheduler_args(ap):
+    ap.add_argument("--rpm", type=int, default=0, help="requests/min per model (0 = learn from rate-limit headers)")
+    ap.add_argument("--tpm", type=int, default=0, help="tokens/min per model (0 = learn from rate-limit headers)")
+    ap.add_argument("--max_in_flight", type=int, default=64, help="upper bound for the adaptive in-flight window")
+    ap.add_argument("--max_retries", type=int, default=4, help="retries per LLM call on 429/5xx/timeouts")
+
+def pool_from_args(args):
+    return SchedulerPool(rpm=args.rpm, tpm=args.tpm, max_in_flight=args.max_in_flight, max_retries=args.max_retries)
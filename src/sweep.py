@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+import os, re, csv, json, html, time, asyncio, argparse, itertools
+from datetime import datetime, timezone
+from string import Template
+import run_eval
+from llm_cache import cache_from_args
+from scheduler import pool_from_args
+import http_pool
+
+# Grid sweep: models x temperatures x HCP prompt files x datasets, every cell a normal run dir
+# (<sweep_outdir>/<TIMESTAMP>-sweep/<cell>/ with gen/judged/metrics.json/report) so report.py,
+# run_index.py and merge_runs.py work on cells as usual. All cells run in one event loop through
+# one --concurrency semaphore, one per-model scheduler pool (rate limits, AIMD window, retries)
+# and one LLM cache; requests identical across cells (same model, temperature and messages,
+# e.g. judging an answer two cells both produced) are sent once. Ends with matrix.html/.csv.
+# Other run_eval.py options (--judge_model, --judge_pack, --engine, --store, --rpm, ...) apply to
+# every cell.
+
+def _slug(s):
+    return re.sub(r"[^\w.-]+", "-", s).strip("-") or "x"
+
+def _stem(path):
+    return _slug(os.path.splitext(os.path.basename(path.rstrip("/")))[0].replace("*", "all"))
+
+def grid_cells(models, temps, prompts, datasets):
+    # -> [(name, model, temp, prompt, dataset)]; single-valued dimensions stay out of the name
+    cells, names = [], set()
+    for model, temp, prompt, dataset in itertools.product(models, temps, prompts, datasets):
+        parts = [_slug(model) if len(models) > 1 else None, f"t{temp:g}" if len(temps) > 1 else None,
+                 _stem(prompt) if len(prompts) > 1 else None, _stem(dataset) if len(datasets) > 1 else None]
+        name = "_".join(p for p in parts if p) or _slug(model)
+        base, k = name, 2
+        while name in names:
+            name, k = f"{base}-{k}", k + 1
+        names.add(name)
+        cells.append((name, model, temp, prompt, dataset))
+    return cells
+
+def load_grid(path):
+    with open(path, "r", encoding="utf-8") as f:
+        g = json.load(f)
+    out = {}
+    for key, alias in (("models", "model"), ("temps", "temp"), ("hcp_prompts", "hcp_prompt_path"), ("datasets", "dataset")):
+        v = g.get(key, g.get(alias))
+        if v is not None:
+            out[key] = v if isinstance(v, list) else [v]
+    return out
+
+async def run_cells(cells, base_args, sweep_dir, cache, hcp_llm=None, judge_llm=None):
+    schedulers, inflight = pool_from_args(base_args), {}
+    sem = asyncio.Semaphore(max(1, base_args.concurrency))
+    ctxs = []
+    for name, model, temp, prompt, dataset in cells:
+        args = argparse.Namespace(**vars(base_args))
+        args.model, args.temp, args.hcp_prompt_path, args.dataset = model, temp, prompt, dataset
+        ctx, examples = run_eval.open_run(args, os.path.join(sweep_dir, name), cache, hcp_llm, judge_llm,
+                                          schedulers=schedulers, inflight=inflight, sem=sem)
+        ctxs.append((name, ctx, examples))
+
+    async def one(name, ctx, examples):
+        t0 = time.perf_counter()
+        try:
+            judged = await (run_eval.run_adaptive if ctx.args.target_ci else run_eval.run_cases)(ctx, examples)
+        finally:
+            ctx.store.close()
+        return judged, time.perf_counter() - t0
+
+    # Cells interleave: the shared semaphore, not cell order, decides what runs next
+    done = await asyncio.gather(*(one(*c) for c in ctxs))
+    return [(name, ctx, judged, wall) for (name, ctx, _), (judged, wall) in zip(ctxs, done)]
+
+MATRIX = Template("""<!doctype html><html><head>
+<meta charset="utf-8"><title>Sweep — $name</title>
+<style>
+body{font-family:ui-sans-serif,system-ui,-apple-system,Segoe UI,Roboto,sans-serif;margin:24px;background:#fafbff}
+h1{margin-top:0}
+.small{color:#666;font-size:12px}
+table{border-collapse:collapse;background:#fff;border:1px solid #eee;border-radius:12px;overflow:hidden;margin-bottom:20px}
+th,td{padding:8px 12px;border-bottom:1px solid #f0f0f0;text-align:left}
+td.cell{text-align:center;min-width:110px}
+td.cell b{font-size:16px}
+a{color:#2257d2;text-decoration:none}
+</style></head><body>
+<h1>Sweep matrix</h1>
+<div class="small">Generated: $now · $n_cells cells · judge $judge · $deduped duplicate calls shared across cells · wall $wall s</div>
+<p class="small">Each cell: pass rate, average score (n cases). Click a cell for its report.</p>
+$tables
+<h3>All cells</h3>
+<table><thead><tr><th>Cell</th><th>Model</th><th>Temp</th><th>HCP prompt</th><th>Dataset</th><th>n</th><th>Pass %</th><th>Avg score</th><th>Cost</th></tr></thead><tbody>
+$rows
+</tbody></table>
+</body></html>""")
+
+def _color(rate):
+    # red (0%) -> green (100%)
+    return f"hsl({int(1.2 * rate)},70%,92%)"
+
+def _cost(c):
+    return "n/a" if c is None else f"${c:.4f}"
+
+def write_matrix(sweep_dir, results, judge_model, deduped, wall):
+    # results: [{"cell","model","temp","prompt","dataset","n","pass_rate","avg_score","cost_usd","report"}]
+    # One pivot per (prompt, dataset): models down, temperatures across
+    e = html.escape
+    link = lambda r: os.path.relpath(r["report"], sweep_dir)
+    tables = []
+    for prompt, dataset in dict.fromkeys((r["prompt"], r["dataset"]) for r in results):
+        sub = [r for r in results if r["prompt"] == prompt and r["dataset"] == dataset]
+        temps = list(dict.fromkeys(r["temp"] for r in sub))
+        head = "".join(f"<th>T={t:g}</th>" for t in temps)
+        body = []
+        for model in dict.fromkeys(r["model"] for r in sub):
+            tds = []
+            for t in temps:
+                r = next((x for x in sub if x["model"] == model and x["temp"] == t), None)
+                tds.append("<td class='cell'>–</td>" if r is None else
+                           f"<td class='cell' style='background:{_color(r['pass_rate'])}'><a href='{e(link(r))}'>"
+                           f"<b>{r['pass_rate']}%</b><br>{r['avg_score']} <span class='small'>(n={r['n']})</span></a></td>")
+            body.append(f"<tr><th>{e(model)}</th>{''.join(tds)}</tr>")
+        tables.append(f"<h3>{e(prompt)} · {e(dataset)}</h3><table><thead><tr><th>Model</th>{head}</tr></thead>"
+                      f"<tbody>{''.join(body)}</tbody></table>")
+    rows = "\n".join(f"<tr><td><a href='{e(link(r))}'>{e(r['cell'])}</a></td><td>{e(r['model'])}</td><td>{r['temp']:g}</td>"
+                     f"<td>{e(r['prompt'])}</td><td>{e(r['dataset'])}</td><td>{r['n']}</td><td>{r['pass_rate']}</td>"
+                     f"<td>{r['avg_score']}</td><td>{_cost(r['cost_usd'])}</td></tr>"
+                     for r in results)
+    path = os.path.join(sweep_dir, "matrix.html")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(MATRIX.substitute(name=e(os.path.basename(sweep_dir)), now=datetime.now(timezone.utc).isoformat(),
+                                  n_cells=len(results), judge=e(judge_model), deduped=deduped, wall=round(wall, 1),
+                                  tables="\n".join(tables), rows=rows))
+    with open(os.path.join(sweep_dir, "matrix.csv"), "w", encoding="utf-8", newline="") as f:
+        w = csv.writer(f)
+        keys = ["cell", "model", "temp", "prompt", "dataset", "n", "pass_rate", "avg_score", "cost_usd", "report"]
+        w.writerow(keys)
+        for r in results:
+            w.writerow([r[k] for k in keys])
+    return path
+
+def main(argv=None, hcp_llm=None, judge_llm=None):
+    ap = argparse.ArgumentParser(description="Run a grid of run_eval.py cells through one shared scheduler", allow_abbrev=False)
+    ap.add_argument("--grid", help='JSON file: {"models": [...], "temps": [...], "hcp_prompts": [...], "datasets": [...]}')
+    ap.add_argument("--models", nargs="+")
+    ap.add_argument("--temps", nargs="+", type=float)
+    ap.add_argument("--hcp_prompts", nargs="+", help="HCP system prompt files")
+    ap.add_argument("--datasets", nargs="+")
+    ap.add_argument("--sweep_outdir", default="results/sweeps")
+    args, rest = ap.parse_known_args(argv)
+    base = run_eval.build_parser().parse_args(rest)
+    if base.target_ci and base.judge_pack > 1:
+        raise SystemExit("--target_ci runs case by case; drop --judge_pack")
+    if base.resume or base.gen_workers or base.judge_workers:
+        raise SystemExit("sweep: --resume and the pipelined mode (--gen_workers/--judge_workers) are not supported; use --concurrency")
+    grid = load_grid(args.grid) if args.grid else {}
+    for key, default in (("models", base.model), ("temps", base.temp), ("hcp_prompts", base.hcp_prompt_path), ("datasets", base.dataset)):
+        if getattr(args, key):
+            grid[key] = getattr(args, key)
+        grid.setdefault(key, [default])
+    http_pool.configure(base)
+    cells = grid_cells(grid["models"], [float(t) for t in grid["temps"]], grid["hcp_prompts"], grid["datasets"])
+
+    sweep_dir = os.path.join(args.sweep_outdir, datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S") + "-sweep")
+    os.makedirs(sweep_dir, exist_ok=True)
+    print(f"Sweep: {len(cells)} cells ({len(grid['models'])} models x {len(grid['temps'])} temps x "
+          f"{len(grid['hcp_prompts'])} prompts x {len(grid['datasets'])} datasets), concurrency {base.concurrency}", flush=True)
+    cache = cache_from_args(base)
+    t0 = time.perf_counter()
+    try:
+        done = asyncio.run(http_pool.closing(run_cells(cells, base, sweep_dir, cache, hcp_llm, judge_llm)))
+    finally:
+        cache.close()
+    wall = time.perf_counter() - t0
+
+    results, deduped = [], 0
+    for (name, model, temp, prompt, dataset), (_, ctx, judged, cell_wall) in zip(cells, done):
+        m, rep = run_eval.finish_run(ctx, os.path.join(sweep_dir, name), judged, cell_wall, f"sweep, concurrency={base.concurrency}")
+        deduped += ctx.deduped
+        n = len(judged)
+        results.append({"cell": name, "model": model, "temp": temp, "prompt": prompt, "dataset": dataset, "n": n,
+                        "pass_rate": round(100 * sum(1 for j in judged if j.get("pass")) / n, 1) if n else 0.0,
+                        "avg_score": round(sum(j.get("score", 0) for j in judged) / n, 1) if n else 0.0,
+                        "cost_usd": m["totals"]["cost_usd"], "report": rep["index"]})
+    with open(os.path.join(sweep_dir, "sweep.json"), "w", encoding="utf-8") as f:
+        json.dump({"created": datetime.now(timezone.utc).isoformat(), "wall_s": round(wall, 3), "grid": grid,
+                   "judge_model": base.judge_model, "deduped_calls": deduped, "cache": cache.stats(),
+                   "scheduler": done[0][1].schedulers.summary() if done else [], "cells": results}, f, ensure_ascii=False, indent=2)
+    path = write_matrix(sweep_dir, results, base.judge_model, deduped, wall)
+
+    print(f"\nSweep done in {wall:.1f}s, {deduped} duplicate calls shared across cells", flush=True)
+    print(f"{'cell':<40} {'n':>5} {'pass%':>6} {'avg':>6}")
+    for r in results:
+        print(f"{r['cell'][:40]:<40} {r['n']:>5} {r['pass_rate']:>6} {r['avg_score']:>6}")
+    print("  matrix:", path)
+    return sweep_dir
+
+if __name__ == "__main__":
+    main()